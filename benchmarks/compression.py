@@ -0,0 +1,222 @@
+"""Bytes-on-wire vs latency for the response compression middleware.
+
+Builds payloads shaped like the real listing responses, then reports for each
+encoding and level the compressed size, the CPU cost on both ends, and the
+resulting time to deliver the body over a few link speeds. A second table
+runs the payloads through HTTPCacheMiddleware in-process to show its
+per-request overhead and the saving from a 304.
+
+    python benchmarks/compression.py [--repeat 50] [--json results.json]
+
+Needs the shared package installed (pip install -e service-common), which
+provides the middleware all services use.
+"""
+import json
+import time
+import zlib
+import random
+import asyncio
+import argparse
+import statistics
+
+from service_common import middleware
+
+# Link speeds in Mbit/s: mobile, office Wi-Fi, in-cluster
+LINKS = {"10Mbit": 10, "100Mbit": 100, "1Gbit": 1000}
+
+ENCODINGS = [("identity", None), ("gzip", 1), ("gzip", 6), ("gzip", 9)]
+if middleware.brotli:
+    ENCODINGS += [("br", 1), ("br", 4), ("br", 11)]
+
+
+def _object_id() -> str:
+    return "".join(random.choice("0123456789abcdef") for _ in range(24))
+
+
+def restaurant_page(size: int = 50, menu_size: int = 15) -> list:
+    return [
+        {
+            "id": _object_id(),
+            "name": f"Restaurant {i}",
+            "description": "Family-run kitchen serving regional dishes and daily specials",
+            "address": f"{random.randint(1, 999)} Nguyen Hue, District {random.randint(1, 12)}",
+            "phone": f"09{random.randint(10000000, 99999999)}",
+            "location": {"lat": round(random.uniform(10.7, 10.9), 6), "lng": round(random.uniform(106.6, 106.8), 6)},
+            "menu_items": [
+                {
+                    "id": _object_id(),
+                    "name": f"Dish {j}",
+                    "description": "Rice noodles with grilled pork, herbs and fish sauce",
+                    "price": round(random.uniform(2, 15), 2),
+                    "available": random.random() > 0.1,
+                }
+                for j in range(menu_size)
+            ],
+        }
+        for i in range(size)
+    ]
+
+
+def order_page(size: int = 200) -> list:
+    statuses = ["cart", "confirmed", "preparing", "ready", "shipped", "delivered"]
+    orders = []
+    for _ in range(size):
+        items = [
+            {"menu_item_id": _object_id(), "item_name": f"Dish {j}", "price": 4.5, "quantity": random.randint(1, 3)}
+            for j in range(random.randint(1, 5))
+        ]
+        for item in items:
+            item["line_total"] = round(item["price"] * item["quantity"], 2)
+        orders.append({
+            "id": _object_id(),
+            "user_id": _object_id(),
+            "user_name": "customer",
+            "restaurant_id": _object_id(),
+            "restaurant_name": "Restaurant",
+            "items": items,
+            "total": round(sum(item["line_total"] for item in items), 2),
+            "status": random.choice(statuses),
+            "shipper_id": _object_id(),
+            "shipper_name": "Shipper",
+            "created_at": "2026-01-01T12:00:00.000000",
+        })
+    return orders
+
+
+def single_order() -> dict:
+    return order_page(1)[0]
+
+
+def _median_seconds(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def _compress(body: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "br":
+        middleware.BROTLI_QUALITY = level
+    else:
+        middleware.GZIP_LEVEL = level
+    return middleware.Compressor(encoding).compress(body, final=True)
+
+
+def _decompress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return middleware.brotli.decompress(data)
+    return zlib.decompress(data, 31)
+
+
+def measure_encodings(name: str, body: bytes, repeat: int) -> list:
+    rows = []
+    for encoding, level in ENCODINGS:
+        if encoding == "identity":
+            data, compress_s, decompress_s = body, 0.0, 0.0
+        else:
+            data = _compress(body, encoding, level)
+            compress_s = _median_seconds(lambda: _compress(body, encoding, level), repeat)
+            decompress_s = _median_seconds(lambda: _decompress(data, encoding), repeat)
+        row = {
+            "payload": name,
+            "encoding": encoding if level is None else f"{encoding}-{level}",
+            "bytes": len(data),
+            "ratio": round(len(body) / len(data), 2),
+            "compress_ms": round(compress_s * 1000, 3),
+            "decompress_ms": round(decompress_s * 1000, 3),
+        }
+        for link, mbit in LINKS.items():
+            transfer_s = len(data) * 8 / (mbit * 1_000_000)
+            row[f"total_ms_{link}"] = round((compress_s + transfer_s + decompress_s) * 1000, 3)
+        rows.append(row)
+    return rows
+
+
+async def _through_middleware(body: bytes, request_headers: list) -> list:
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "headers": request_headers}
+    await middleware.HTTPCacheMiddleware(app)(scope, None, send)
+    return sent
+
+
+def measure_middleware(name: str, body: bytes, repeat: int) -> list:
+    middleware.GZIP_LEVEL, middleware.BROTLI_QUALITY = 6, 4
+    etag = middleware.weak_etag(body)
+    cases = [
+        ("passthrough (no Accept-Encoding)", []),
+        ("gzip", [(b"accept-encoding", b"gzip")]),
+        ("br", [(b"accept-encoding", b"br")]),
+        ("304 Not Modified", [(b"accept-encoding", b"gzip, br"), (b"if-none-match", etag.encode())]),
+    ]
+    loop = asyncio.new_event_loop()
+    rows = []
+    try:
+        for label, headers in cases:
+            if label == "br" and not middleware.brotli:
+                continue
+            sent = loop.run_until_complete(_through_middleware(body, headers))
+            seconds = _median_seconds(lambda: loop.run_until_complete(_through_middleware(body, headers)), repeat)
+            rows.append({
+                "payload": name,
+                "case": label,
+                "status": sent[0]["status"],
+                "bytes_on_wire": len(sent[-1]["body"]),
+                "middleware_ms": round(seconds * 1000, 3),
+            })
+    finally:
+        loop.close()
+    return rows
+
+
+def _print_table(rows: list):
+    if not rows:
+        return
+    columns = list(rows[0])
+    widths = {column: max(len(column), *(len(str(row[column])) for row in rows)) for column in columns}
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print("  ".join(str(row[column]).ljust(widths[column]) for column in columns))
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compression size/latency trade-off")
+    parser.add_argument("--repeat", type=int, default=50, help="timing samples per measurement (median reported)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    random.seed(42)
+    payloads = {
+        "restaurants_page_50_with_menus": restaurant_page(),
+        "orders_page_200": order_page(),
+        "single_order": single_order(),
+    }
+    encoding_rows, middleware_rows = [], []
+    for name, payload in payloads.items():
+        body = json.dumps(payload).encode()
+        encoding_rows += measure_encodings(name, body, args.repeat)
+        middleware_rows += measure_middleware(name, body, args.repeat)
+
+    if not middleware.brotli:
+        print("brotli is not installed; only gzip is measured\n")
+    _print_table(encoding_rows)
+    _print_table(middleware_rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"encodings": encoding_rows, "middleware": middleware_rows}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
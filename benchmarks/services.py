@@ -0,0 +1,248 @@
+"""Start the four services for a benchmark run.
+
+In-process: every service's FastAPI app is imported in this interpreter with
+its own mongomock-motor database, and all HTTP traffic (the load driver's and
+the services' calls to each other) goes through httpx ASGI transports. Each
+outbound call is counted against the endpoint that caused it.
+
+Ports: every service runs its production entry point (service_common.serve: uvicorn,
+uvloop, --workers processes) on a local port against a real MongoDB
+(--mongo-url), the way the Docker images run them.
+"""
+import os
+import sys
+import time
+import asyncio
+import importlib
+import contextvars
+import subprocess
+from collections import defaultdict
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (directory, docker-compose host, local port in ports mode)
+SERVICES = {
+    "user": ("user-service", "user-service", 18001),
+    "order": ("order-service", "order-service", 18002),
+    "restaurant": ("restaurant-service", "restaurant-service", 18003),
+    "shipper": ("shipper-service", "shipper-service", 18004),
+}
+
+# Endpoint label of the driver request currently being served; outbound calls are charged to it
+current_endpoint = contextvars.ContextVar("current_endpoint", default=None)
+
+
+def _load_service(directory: str) -> dict:
+    """Import one service's `app` package and detach it from sys.modules.
+
+    All services name their package `app`, so each is imported on its own and
+    kept as a dict of its modules; the modules hold direct references to each
+    other, so they keep working after being detached. The shared service_common
+    package is imported afresh for each service too, so every service keeps its
+    own metrics, spans and settings, as it would in its own process.
+    """
+    def _app_modules():
+        return [name for name in sys.modules
+                if name.split(".")[0] in ("app", "service_common")]
+
+    for name in _app_modules():
+        del sys.modules[name]
+    path = os.path.join(ROOT, directory)
+    sys.path.insert(0, path)
+    try:
+        importlib.import_module("app.main")
+        modules = {name: sys.modules[name] for name in _app_modules()}
+    finally:
+        sys.path.remove(path)
+        for name in _app_modules():
+            del sys.modules[name]
+    return modules
+
+
+class RoutingTransport(httpx.AsyncBaseTransport):
+    """Send each request to the in-process app registered for its host"""
+
+    def __init__(self, apps: dict, outbound_calls=None):
+        self._transports = {host: httpx.ASGITransport(app=app, raise_app_exceptions=False) for host, app in apps.items()}
+        self.outbound_calls = outbound_calls  # endpoint -> target host -> count; None for the load driver
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        transport = self._transports.get(request.url.host)
+        if transport is None:
+            raise httpx.ConnectError(f"No in-process service for {request.url.host}", request=request)
+        if self.outbound_calls is not None:
+            self.outbound_calls[current_endpoint.get() or "(background)"][request.url.host] += 1
+        return await transport.handle_async_request(request)
+
+
+class Lifespan:
+    """Drive an ASGI app's startup and shutdown handlers"""
+
+    def __init__(self, app):
+        self.app = app
+        self._messages = asyncio.Queue()
+        self._replies = asyncio.Queue()
+        self._task = None
+
+    async def _send(self, event: str):
+        await self._messages.put({"type": f"lifespan.{event}"})
+        reply = await self._replies.get()
+        if reply["type"].endswith("failed"):
+            raise RuntimeError(f"{event} failed: {reply.get('message')}")
+
+    async def startup(self):
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._task = asyncio.create_task(self.app(scope, self._messages.get, self._replies.put))
+        await self._send("startup")
+
+    async def shutdown(self):
+        await self._send("shutdown")
+        await self._task
+
+
+class InProcessServices:
+    """All four services in this interpreter, each with its own mongomock database"""
+
+    supports_geo = False  # mongomock has no $geoNear
+    supports_bulk_write = False  # mongomock's bulk_write does not accept pymongo 4.9+ operations
+    backend = "in-process, mongomock-motor"
+
+    def __init__(self):
+        from mongomock_motor import AsyncMongoMockClient
+
+        # mongomock has no change streams; the order event feed polls instead
+        os.environ.setdefault("ORDER_EVENTS_MODE", "polling")
+        self.modules = {}
+        self.apps = {}
+        for name, (directory, _, _) in SERVICES.items():
+            modules = _load_service(directory)
+            modules["app.database"].AsyncIOMotorClient = AsyncMongoMockClient
+            self.modules[name] = modules
+            self.apps[SERVICES[name][1]] = modules["app.main"].app
+        self.outbound_calls = defaultdict(lambda: defaultdict(int))
+        self.urls = {name: f"http://{host}:8000" for name, (_, host, _) in SERVICES.items()}
+        self._lifespans = []
+        self._clients = []
+
+    def _internal_client(self) -> httpx.AsyncClient:
+        # Same headers as the services' own clients, so internal responses stay uncompressed here too
+        client = httpx.AsyncClient(
+            transport=RoutingTransport(self.apps, self.outbound_calls), headers={"Accept-Encoding": "identity"}
+        )
+        self._clients.append(client)
+        return client
+
+    async def start(self):
+        for app in self.apps.values():
+            lifespan = Lifespan(app)
+            await lifespan.startup()
+            self._lifespans.append(lifespan)
+        # Swap the clients the services created at startup for ones that reach the other apps in-process
+        http_client = self.modules["order"]["app.http_client"]
+        await http_client.client.aclose()
+        http_client.client = self._internal_client()
+        notifications = self.modules["restaurant"]["app.notifications"]
+        await notifications.client.aclose()
+        notifications.client = self._internal_client()
+
+    def driver(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=RoutingTransport(self.apps), timeout=30.0)
+
+    async def outbound_snapshot(self) -> dict:
+        names = {host: name for name, (_, host, _) in SERVICES.items()}
+        return {
+            endpoint: {names[host]: count for host, count in targets.items()}
+            for endpoint, targets in self.outbound_calls.items()
+        }
+
+    async def collect_spans(self) -> list:
+        """Spans still held by each service's in-memory trace exporter"""
+        return [span for modules in self.modules.values() for span in modules["service_common.tracing"].recent_spans()]
+
+    async def stop(self):
+        for client in self._clients:
+            await client.aclose()
+        self.modules["order"]["app.http_client"].client = None
+        self.modules["restaurant"]["app.notifications"].client = None
+        for lifespan in self._lifespans:
+            await lifespan.shutdown()
+
+
+class PortServices:
+    """All four services under uvicorn on local ports, backed by a real MongoDB"""
+
+    supports_geo = True
+    supports_bulk_write = True
+
+    def __init__(self, mongo_url: str, workers: int = 1):
+        self.mongo_url = mongo_url
+        self.workers = workers
+        self.run_id = time.strftime("%Y%m%d%H%M%S")
+        self.backend = f"uvicorn on local ports, {workers} worker(s) per service, MongoDB at {mongo_url}"
+        self.urls = {name: f"http://127.0.0.1:{port}" for name, (_, _, port) in SERVICES.items()}
+        self._processes = []
+
+    def _database(self, name: str) -> str:
+        return f"bench_{self.run_id}_{name}"
+
+    async def start(self):
+        for name, (directory, _, port) in SERVICES.items():
+            env = {
+                **os.environ,
+                "MONGO_URL": self.mongo_url,
+                "MONGO_DB": self._database(name),
+                "USER_SERVICE_URL": self.urls["user"],
+                "RESTAURANT_SERVICE_URL": self.urls["restaurant"],
+                "SHIPPER_SERVICE_URL": self.urls["shipper"],
+                "MENU_UPDATE_SUBSCRIBERS": f"{self.urls['order']}/cache/invalidate",
+                "HOST": "127.0.0.1",
+                "PORT": str(port),
+                "WEB_CONCURRENCY": str(self.workers),
+                "UVICORN_LOG_LEVEL": "warning",
+                # Empty: each service's workers get their own metrics directory from service_common.serve
+                "PROMETHEUS_MULTIPROC_DIR": "",
+            }
+            self._processes.append(subprocess.Popen(
+                [sys.executable, "-m", "service_common.serve"], cwd=os.path.join(ROOT, directory), env=env,
+            ))
+        async with httpx.AsyncClient() as client:
+            for name, url in self.urls.items():
+                for _ in range(60):
+                    try:
+                        if (await client.get(f"{url}/health")).status_code == 200:
+                            break
+                    except httpx.HTTPError:
+                        pass
+                    await asyncio.sleep(0.5)
+                else:
+                    raise RuntimeError(f"{name} service did not become healthy")
+
+    def driver(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(max_connections=200, max_keepalive_connections=200)
+        return httpx.AsyncClient(limits=limits, timeout=30.0)
+
+    async def outbound_snapshot(self) -> dict:
+        """Order service's outbound request counters; only totals per target are available across processes"""
+        if self.workers > 1:
+            return {}  # each worker keeps its own counters, and one request reaches only one of them
+        async with httpx.AsyncClient() as client:
+            stats = (await client.get(f"{self.urls['order']}/stats/resilience")).json()
+        return {"(all)": {target: values["requests"] for target, values in stats.items()}}
+
+    async def collect_spans(self) -> list:
+        """Spans from each service's GET /traces (in-memory exporter, the default); one worker's when several run"""
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            return [span for url in self.urls.values() for span in (await client.get(f"{url}/traces")).json()]
+
+    async def stop(self):
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.wait(timeout=30)
+        from pymongo import MongoClient
+
+        client = MongoClient(self.mongo_url)
+        for name in SERVICES:
+            client.drop_database(self._database(name))
+        client.close()
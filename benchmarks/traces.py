@@ -0,0 +1,151 @@
+"""Fan-out and critical-path report over exported trace spans.
+
+    python benchmarks/traces.py SOURCE [SOURCE ...] [--fanout 5] [--trace TRACE_ID]
+
+Each SOURCE is a JSON-lines file written by TRACE_EXPORTER=file or by
+`harness.py --traces`, or a service base URL whose in-memory spans are read
+from GET /traces (e.g. http://localhost:8002). Pass every service's spans so
+calls between them join into one tree per request.
+
+For each root endpoint the report shows the spans one request caused, per
+service and operation. It then lists N+1 suspects: a single span that made
+--fanout or more calls with the same name, such as one `mongo find orders`
+per order or one `GET user` per line. Last comes the critical path of the
+slowest trace, the chain of spans that decided its latency.
+"""
+import sys
+import json
+import argparse
+from collections import defaultdict
+import httpx
+
+
+def load_spans(sources: list) -> list:
+    spans = {}
+    for source in sources:
+        if source.startswith(("http://", "https://")):
+            records = httpx.get(f"{source.rstrip('/')}/traces", timeout=30.0).json()
+        else:
+            with open(source) as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        for record in records:
+            spans[record["span_id"]] = record
+    return list(spans.values())
+
+
+def _end(span: dict) -> float:
+    return span["start_time"] + span["duration"]
+
+
+def _label(span: dict) -> str:
+    return f"{span['service']}: {span['name']}"
+
+
+def build_traces(spans: list):
+    """(traces: trace_id -> root span, children: span_id -> child spans, orphans)"""
+    by_id = {span["span_id"]: span for span in spans}
+    children = defaultdict(list)
+    roots = {}
+    orphans = 0
+    for span in spans:
+        if span["parent_id"] is None:
+            roots[span["trace_id"]] = span
+        elif span["parent_id"] in by_id:
+            children[span["parent_id"]].append(span)
+        else:
+            orphans += 1  # the caller's spans were not among the sources
+    return roots, children, orphans
+
+
+def _descendants(span: dict, children: dict) -> list:
+    found = []
+    stack = list(children[span["span_id"]])
+    while stack:
+        child = stack.pop()
+        found.append(child)
+        stack.extend(children[child["span_id"]])
+    return found
+
+
+def fanout_report(roots: dict, children: dict) -> dict:
+    """Root endpoint -> {traces, mean duration, mean spans per label}"""
+    report = defaultdict(lambda: {"traces": 0, "duration": 0.0, "spans": defaultdict(int)})
+    for root in roots.values():
+        entry = report[_label(root)]
+        entry["traces"] += 1
+        entry["duration"] += root["duration"]
+        for span in _descendants(root, children):
+            entry["spans"][_label(span)] += 1
+    return report
+
+
+def n_plus_one(roots: dict, children: dict, threshold: int) -> dict:
+    """(root endpoint, parent label, repeated child label) -> largest repeat count seen"""
+    suspects = defaultdict(int)
+    for root in roots.values():
+        for parent in [root] + _descendants(root, children):
+            counts = defaultdict(int)
+            for child in children[parent["span_id"]]:
+                counts[_label(child)] += 1
+            for label, count in counts.items():
+                if count >= threshold:
+                    key = (_label(root), _label(parent), label)
+                    suspects[key] = max(suspects[key], count)
+    return suspects
+
+
+def critical_path(span: dict, children: dict, depth: int = 0, path: list = None) -> list:
+    """Walk back from the span's end, taking the child that finished last before the cursor"""
+    path = [] if path is None else path
+    path.append((depth, span))
+    cursor = _end(span)
+    chain = []
+    for child in sorted(children[span["span_id"]], key=_end, reverse=True):
+        if _end(child) <= cursor + 1e-6:
+            chain.append(child)
+            cursor = child["start_time"]
+    for child in reversed(chain):
+        critical_path(child, children, depth + 1, path)
+    return path
+
+
+def print_report(spans: list, threshold: int, trace_id: str = None):
+    roots, children, orphans = build_traces(spans)
+    print(f"{len(spans)} spans, {len(roots)} traces, {orphans} spans whose parent is missing")
+
+    print("\nSpans per request, by root endpoint:")
+    for label, entry in sorted(fanout_report(roots, children).items(), key=lambda item: -item[1]["traces"]):
+        traces = entry["traces"]
+        print(f"\n  {label}  ({traces} traces, mean {entry['duration'] / traces * 1000:.1f} ms)")
+        for span_label, count in sorted(entry["spans"].items(), key=lambda item: -item[1]):
+            print(f"    {count / traces:8.1f}  {span_label}")
+
+    suspects = n_plus_one(roots, children, threshold)
+    print(f"\nN+1 suspects (one span making {threshold}+ calls with the same name):")
+    for (root, parent, child), count in sorted(suspects.items(), key=lambda item: -item[1]):
+        print(f"  {count:5}x {child}\n         under {parent}\n         in {root}")
+    if not suspects:
+        print("  none")
+
+    if trace_id is not None:
+        root = roots.get(trace_id)
+        if root is None:
+            sys.exit(f"Trace {trace_id} has no root span in the sources")
+    elif roots:
+        root = max(roots.values(), key=lambda span: span["duration"])
+    else:
+        return
+    print(f"\nCritical path of trace {root['trace_id']} ({root['duration'] * 1000:.1f} ms):")
+    for depth, span in critical_path(root, children):
+        offset = (span["start_time"] - root["start_time"]) * 1000
+        error = f"  [{span['error']}]" if span.get("error") else ""
+        print(f"  {offset:8.1f} ms +{span['duration'] * 1000:8.1f} ms  {'  ' * depth}{_label(span)}{error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report fan-out, N+1 calls and critical paths from trace spans")
+    parser.add_argument("sources", nargs="+", help="JSON-lines span files or service base URLs")
+    parser.add_argument("--fanout", type=int, default=5, help="same-name calls under one span that count as N+1")
+    parser.add_argument("--trace", help="show the critical path of this trace instead of the slowest one")
+    args = parser.parse_args()
+    print_report(load_spans(args.sources), args.fanout, args.trace)
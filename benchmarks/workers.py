@@ -0,0 +1,69 @@
+"""Throughput and latency as the number of uvicorn workers per service grows.
+
+    python benchmarks/workers.py [--worker-counts 1,2,4] [--mongo-url URL] [harness.py options]
+
+Runs harness.py in ports mode once per worker count, each time with fresh
+databases. For each scenario it prints the total requests per second, the
+speed-up over the first worker count, and the worst endpoint p95.
+
+The load driver is one Python process. If the driver saturates a core
+before the services do, the curve flattens for that reason alone. Watch
+`top` during the run, raise --concurrency, or drive the services from a
+second machine.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services import ROOT  # noqa: E402
+from harness import build_parser, main  # noqa: E402
+
+
+def summarize(results: dict) -> dict:
+    """Scenario -> totals over its endpoints"""
+    return {
+        scenario: {
+            "rps": round(sum(stats["rps"] for stats in result["endpoints"].values()), 1),
+            "worst_p95_ms": max((stats["p95_ms"] for stats in result["endpoints"].values()), default=0.0),
+            "errors": sum(stats["errors"] for stats in result["endpoints"].values()),
+        }
+        for scenario, result in results["scenarios"].items()
+    }
+
+
+def print_table(runs: dict):
+    baseline = runs[min(runs)]
+    print(f"\n{'workers':>7}  {'scenario':22} {'req/s':>9} {'speed-up':>9} {'worst p95 ms':>13} {'errors':>7}")
+    for workers, summary in sorted(runs.items()):
+        for scenario, totals in summary.items():
+            base_rps = baseline.get(scenario, {}).get("rps")
+            speedup = f"{totals['rps'] / base_rps:.2f}x" if base_rps else "-"
+            print(f"{workers:>7}  {scenario:22} {totals['rps']:>9} {speedup:>9} {totals['worst_p95_ms']:>13} "
+                  f"{totals['errors']:>7}")
+
+
+if __name__ == "__main__":
+    parser = build_parser()
+    parser.add_argument("--worker-counts", default="1,2,4", help="comma-separated worker counts to compare")
+    args = parser.parse_args()
+    args.mode = "ports"
+
+    counts = sorted({int(count) for count in args.worker_counts.split(",")})
+    print(f"{os.cpu_count()} CPUs on this host; comparing {counts} workers per service")
+    runs, raw = {}, {}
+    for workers in counts:
+        print(f"\n=== {workers} worker(s) per service")
+        args.workers = workers
+        raw[workers] = asyncio.run(main(args))
+        runs[workers] = summarize(raw[workers])
+    print_table(runs)
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"workers-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"summary": runs, "runs": raw}, f, indent=2)
+    print(f"\nResults written to {output}")
@@ -0,0 +1,191 @@
+"""Seed data and user journeys driven by the benchmark harness.
+
+Each journey is one iteration of a virtual user: it issues a few requests
+through Recorder.call, which times them under an endpoint label such as
+"GET /orders/{order_id}".
+"""
+import time
+import random
+from collections import defaultdict
+import httpx
+from services import current_endpoint
+
+# Lifecycle steps the dashboard and dispatch journeys walk orders through
+NEXT_STATUS = {"cart": "confirmed", "confirmed": "preparing", "preparing": "ready"}
+
+# Around District 1, Ho Chi Minh City
+CENTER = (10.7769, 106.7009)
+
+
+class Recorder:
+    """Per-endpoint latency samples and unexpected responses"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, client: httpx.AsyncClient, label: str, method: str, url: str, expected=(200,), **kwargs):
+        token = current_endpoint.set(label)
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.latencies[label].append(time.perf_counter() - started)
+            self.errors[label] += 1
+            self.statuses[label][type(e).__name__] += 1
+            return None
+        finally:
+            current_endpoint.reset(token)
+        self.latencies[label].append(time.perf_counter() - started)
+        self.statuses[label][str(response.status_code)] += 1
+        if response.status_code not in expected:
+            self.errors[label] += 1
+        return response
+
+
+class Context:
+    """Ids created by seeding and by earlier journeys, shared by all virtual users"""
+
+    def __init__(self, urls: dict, supports_geo: bool, supports_bulk_write: bool):
+        self.urls = urls
+        self.supports_geo = supports_geo
+        self.supports_bulk_write = supports_bulk_write
+        self.users = []
+        self.restaurants = {}  # restaurant_id -> list of menu item ids
+        self.shippers = []
+        self.orders = []  # (order_id, user_id, restaurant_id)
+        self.status = {}  # order_id -> last status this run set
+        self.etags = {}  # url -> ETag last seen, for conditional polling
+
+
+def _point(rng: random.Random, spread: float = 0.03) -> dict:
+    return {"lat": CENTER[0] + rng.uniform(-spread, spread), "lng": CENTER[1] + rng.uniform(-spread, spread)}
+
+
+async def seed(client: httpx.AsyncClient, ctx: Context, users: int, restaurants: int, menu_size: int, shippers: int):
+    rng = random.Random(1)
+    urls = ctx.urls
+    for i in range(users):
+        response = await client.post(f"{urls['user']}/users",
+                                     json={"username": f"user{i}", "email": f"user{i}@example.com"})
+        ctx.users.append(response.json()["id"])
+    for i in range(restaurants):
+        body = {"name": f"Restaurant {i}", "description": "Regional dishes", "address": f"{i} Le Loi", "phone": "0900"}
+        if ctx.supports_geo:
+            body["location"] = _point(rng)
+        restaurant_id = (await client.post(f"{urls['restaurant']}/restaurants", json=body)).json()["id"]
+        items = []
+        for j in range(menu_size):
+            item = {"name": f"Dish {j}", "description": "House special", "price": round(rng.uniform(2, 15), 2)}
+            response = await client.post(f"{urls['restaurant']}/restaurants/{restaurant_id}/menu-items", json=item)
+            items.append(response.json()["id"])
+        ctx.restaurants[restaurant_id] = items
+    for i in range(shippers):
+        body = {"name": f"Shipper {i}", "phone": "0911", "vehicle": "Motorbike"}
+        if ctx.supports_geo:
+            body["location"] = _point(rng)
+        ctx.shippers.append((await client.post(f"{urls['shipper']}/shippers", json=body)).json()["id"])
+
+
+async def _create_order(client, rec: Recorder, ctx: Context, rng: random.Random):
+    user_id = rng.choice(ctx.users)
+    restaurant_id = rng.choice(list(ctx.restaurants))
+    menu = ctx.restaurants[restaurant_id]
+    items = [{"menu_item_id": item_id, "quantity": rng.randint(1, 3)} for item_id in rng.sample(menu, rng.randint(1, 4))]
+    response = await rec.call(client, "POST /orders", "POST", f"{ctx.urls['order']}/orders", expected=(201,),
+                              json={"user_id": user_id, "restaurant_id": restaurant_id, "items": items})
+    if response is None or response.status_code != 201:
+        return None
+    order_id = response.json()["id"]
+    ctx.orders.append((order_id, user_id, restaurant_id))
+    ctx.status[order_id] = "cart"
+    return order_id
+
+
+async def _conditional_get(client, rec: Recorder, ctx: Context, label: str, url: str):
+    """Poll like a browser would: revalidate with the last ETag, expect 304 when nothing changed"""
+    headers = {"If-None-Match": ctx.etags[url]} if url in ctx.etags else {}
+    response = await rec.call(client, label, "GET", url, expected=(200, 304), headers=headers)
+    if response is not None and response.status_code == 200 and "etag" in response.headers:
+        ctx.etags[url] = response.headers["etag"]
+    return response
+
+
+async def _advance(client, rec: Recorder, ctx: Context, order_id: str) -> bool:
+    status = NEXT_STATUS.get(ctx.status.get(order_id))
+    if status is None:
+        return False
+    # 409 is expected when another virtual user moved the same order first
+    response = await rec.call(client, "PUT /orders/{order_id}/status", "PUT",
+                              f"{ctx.urls['order']}/orders/{order_id}/status",
+                              expected=(200, 409), json={"status": status})
+    if response is not None and response.status_code == 200:
+        ctx.status[order_id] = status
+        return True
+    return False
+
+
+async def cart_creation(client, rec: Recorder, ctx: Context, rng: random.Random):
+    """Browse a restaurant's menu, then place an order"""
+    restaurant_id = rng.choice(list(ctx.restaurants))
+    await _conditional_get(client, rec, ctx, "GET /restaurants/{restaurant_id}/menu-items",
+                           f"{ctx.urls['restaurant']}/restaurants/{restaurant_id}/menu-items")
+    await _create_order(client, rec, ctx, rng)
+
+
+async def order_tracking(client, rec: Recorder, ctx: Context, rng: random.Random):
+    """A customer polling one order and their order history"""
+    if not ctx.orders:
+        await _create_order(client, rec, ctx, rng)
+        return
+    order_id, user_id, _ = rng.choice(ctx.orders)
+    await _conditional_get(client, rec, ctx, "GET /orders/{order_id}", f"{ctx.urls['order']}/orders/{order_id}")
+    await _conditional_get(client, rec, ctx, "GET /orders/users/{user_id}/orders",
+                           f"{ctx.urls['order']}/orders/users/{user_id}/orders?limit=20")
+
+
+async def restaurant_dashboard(client, rec: Recorder, ctx: Context, rng: random.Random):
+    """Kitchen screen: list open orders, move one along, glance at the catalog"""
+    restaurant_id = rng.choice(list(ctx.restaurants))
+    await _conditional_get(client, rec, ctx, "GET /orders/restaurants/{restaurant_id}/orders",
+                           f"{ctx.urls['order']}/orders/restaurants/{restaurant_id}/orders"
+                           "?status=cart&status=confirmed&status=preparing&limit=50")
+    open_orders = [order_id for order_id, _, rid in ctx.orders if rid == restaurant_id and ctx.status[order_id] in NEXT_STATUS]
+    if open_orders:
+        await _advance(client, rec, ctx, rng.choice(open_orders))
+    await _conditional_get(client, rec, ctx, "GET /restaurants", f"{ctx.urls['restaurant']}/restaurants?limit=50")
+
+
+async def shipper_dispatch(client, rec: Recorder, ctx: Context, rng: random.Random):
+    """Full delivery: order, kitchen steps, dispatch, delivery, shipper freed; shippers report positions meanwhile"""
+    order_id = await _create_order(client, rec, ctx, rng)
+    if order_id is None:
+        return
+    while await _advance(client, rec, ctx, order_id):
+        pass
+    if ctx.status[order_id] != "ready":
+        return
+    response = await rec.call(client, "POST /orders/{order_id}/dispatch", "POST",
+                              f"{ctx.urls['order']}/orders/{order_id}/dispatch", expected=(200, 409))
+    if ctx.supports_bulk_write:
+        pings = [{"shipper_id": shipper_id, **_point(rng)} for shipper_id in rng.sample(ctx.shippers, 20)]
+        await rec.call(client, "POST /shippers/locations", "POST", f"{ctx.urls['shipper']}/shippers/locations",
+                       expected=(202,), json={"pings": pings})
+    if response is None or response.status_code != 200:
+        return
+    ctx.status[order_id] = "shipped"
+    shipper_id = response.json()["shipper_id"]
+    await rec.call(client, "PUT /orders/{order_id}/status", "PUT", f"{ctx.urls['order']}/orders/{order_id}/status",
+                   json={"status": "delivered"})
+    ctx.status[order_id] = "delivered"
+    await rec.call(client, "PUT /shippers/{shipper_id}/status", "PUT",
+                   f"{ctx.urls['shipper']}/shippers/{shipper_id}/status", json={"status": "available"})
+
+
+SCENARIOS = {
+    "cart_creation": cart_creation,
+    "order_tracking": order_tracking,
+    "restaurant_dashboard": restaurant_dashboard,
+    "shipper_dispatch": shipper_dispatch,
+}
@@ -0,0 +1,185 @@
+"""Backfill snapshot fields (names, prices, totals) on existing orders.
+
+Orders created before names and prices were denormalized only hold
+menu_item_id and quantity. Run once after deploying, from the order-service
+container:
+
+    python -m app.backfill [--batch-size 200] [--include-unknown] [--dry-run]
+
+Prices are taken from the current menu, which is the best available
+approximation for orders that never recorded them. An order is only
+snapshotted when every lookup it needs succeeds and everything it references
+still exists; the others are skipped and keep rendering on the fly, so a run
+during an outage writes nothing it would have to guess. Run it again later
+to pick them up.
+
+--include-unknown also revisits orders whose snapshot holds "Unknown" names
+or items. Only those fields are filled in; prices already recorded are never
+touched, and the total is recomputed from the stored line totals.
+"""
+import argparse
+import asyncio
+from pymongo import UpdateOne
+from app import database
+from app.crud import (
+    UPSTREAM_ERRORS, fetch_menu_items, fetch_restaurant_name, fetch_shipper_names, fetch_user_names,
+    is_snapshotted,
+)
+from app.http_client import start_http_client, close_http_client
+
+UNKNOWN = "Unknown"
+
+# Stands in for the result of a lookup whose service could not be reached
+FAILED = object()
+
+
+def build_filter(include_unknown: bool) -> dict:
+    query = {"total": {"$exists": False}}
+    if include_unknown:
+        # Also retry orders whose snapshot was taken while a dependency was unreachable
+        query = {"$or": [
+            query,
+            {"user_name": UNKNOWN},
+            {"restaurant_name": UNKNOWN},
+            {"shipper_name": UNKNOWN},
+            {"items.item_name": UNKNOWN},
+        ]}
+    return query
+
+
+def _needs(order: dict, field: str) -> bool:
+    return not is_snapshotted(order) or order.get(field) == UNKNOWN
+
+
+def _item_unknown(order: dict, item: dict) -> bool:
+    return not is_snapshotted(order) or item.get("item_name") == UNKNOWN
+
+
+async def _lookup(fetch, *args):
+    try:
+        return await fetch(*args, strict=True)
+    except UPSTREAM_ERRORS:
+        return FAILED
+
+
+async def resolve(orders: list) -> dict:
+    """Look up everything the orders are missing; a lookup whose service is down comes back as FAILED"""
+    user_ids = {order["user_id"] for order in orders if _needs(order, "user_name")}
+    shipper_ids = {order["shipper_id"] for order in orders if order.get("shipper_id") and _needs(order, "shipper_name")}
+    restaurant_ids = list({order["restaurant_id"] for order in orders if _needs(order, "restaurant_name")})
+    menu_keys = {
+        (order["restaurant_id"], item["menu_item_id"])
+        for order in orders
+        for item in order["items"]
+        if _item_unknown(order, item)
+    }
+    users, shippers, menu, *restaurants = await asyncio.gather(
+        _lookup(fetch_user_names, user_ids),
+        _lookup(fetch_shipper_names, shipper_ids),
+        _lookup(fetch_menu_items, menu_keys),
+        *(_lookup(fetch_restaurant_name, restaurant_id) for restaurant_id in restaurant_ids),
+    )
+    return {"users": users, "shippers": shippers, "menu": menu, "restaurants": dict(zip(restaurant_ids, restaurants))}
+
+
+def _name(found, key):
+    """The looked-up value, None if the entity no longer exists, FAILED if its service was down"""
+    if found is FAILED:
+        return FAILED
+    return found.get(key)
+
+
+def snapshot_update(order: dict, found: dict):
+    """$set filling the order's missing snapshot fields, or None if nothing can be filled safely"""
+    names = {"user_name": _name(found["users"], order["user_id"]),
+             "restaurant_name": found["restaurants"].get(order["restaurant_id"])}
+    if order.get("shipper_id"):
+        names["shipper_name"] = _name(found["shippers"], order["shipper_id"])
+
+    items = []
+    for item in order["items"]:
+        if _item_unknown(order, item):
+            details = _name(found["menu"], (order["restaurant_id"], item["menu_item_id"]))
+            if details is FAILED or details is None:
+                item = None
+            else:
+                item = {
+                    "menu_item_id": item["menu_item_id"],
+                    "item_name": details["name"],
+                    "price": details["price"],
+                    "quantity": item["quantity"],
+                    "line_total": round(details["price"] * item["quantity"], 2),
+                }
+        items.append(item)
+
+    if not is_snapshotted(order):
+        # All or nothing: a legacy order counts as snapshotted once it has a total
+        if None in items or any(name is FAILED or name is None for name in names.values()):
+            return None
+        return {**names, "items": items, "total": round(sum(item["line_total"] for item in items), 2)}
+
+    update = {field: name for field, name in names.items()
+              if order.get(field) == UNKNOWN and name is not FAILED and name is not None}
+    filled = [new if new is not None else old for new, old in zip(items, order["items"])]
+    if filled != order["items"]:
+        update["items"] = filled
+        # Recomputed from the stored line totals, so prices recorded at creation stay as they were
+        update["total"] = round(sum(item.get("line_total") or 0 for item in filled), 2)
+    return update or None
+
+
+async def _flush(orders_collection, batch: list, dry_run: bool):
+    """(orders updated, orders skipped) for one batch"""
+    found = await resolve(batch)
+    updates = []
+    for order in batch:
+        fields = snapshot_update(order, found)
+        if fields:
+            updates.append(UpdateOne({"_id": order["_id"]}, {"$set": fields}))
+    skipped = len(batch) - len(updates)
+    if dry_run or not updates:
+        return len(updates), skipped
+    result = await orders_collection.bulk_write(updates, ordered=False)
+    return result.modified_count, skipped
+
+
+async def backfill(db, batch_size: int = 200, include_unknown: bool = False, dry_run: bool = False):
+    """Snapshot every matching order in batches; returns (orders updated, orders skipped)"""
+    orders_collection = db["orders"]
+    cursor = orders_collection.find(build_filter(include_unknown), batch_size=batch_size)
+    updated = skipped = 0
+    batch = []
+    async for order in cursor:
+        batch.append(order)
+        if len(batch) >= batch_size:
+            done, left = await _flush(orders_collection, batch, dry_run)
+            updated, skipped = updated + done, skipped + left
+            print(f"Backfilled {updated} orders, skipped {skipped}...")
+            batch = []
+    if batch:
+        done, left = await _flush(orders_collection, batch, dry_run)
+        updated, skipped = updated + done, skipped + left
+    return updated, skipped
+
+
+async def main(batch_size: int, include_unknown: bool, dry_run: bool):
+    await database.connect_to_mongo()
+    await start_http_client()
+    try:
+        updated, skipped = await backfill(database.get_database(), batch_size, include_unknown, dry_run)
+        action = "Would backfill" if dry_run else "Backfilled"
+        print(f"{action} {updated} orders; skipped {skipped} whose lookups failed or that reference "
+              f"something that no longer exists")
+    finally:
+        await close_http_client()
+        await database.close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill order snapshot fields")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--include-unknown", action="store_true",
+                        help="also fill in 'Unknown' names and items of snapshotted orders")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.include_unknown, args.dry_run))
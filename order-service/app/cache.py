@@ -0,0 +1,242 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", "10000"))
+NEGATIVE_CACHE_TTL = float(os.getenv("NEGATIVE_CACHE_TTL", "30"))
+
+# Cached value for lookups that came back 404
+NOT_FOUND = object()
+
+
+def _fail(future: asyncio.Future, error: BaseException):
+    if isinstance(error, asyncio.CancelledError):
+        future.cancel()
+    else:
+        future.set_exception(error)
+        future.exception()  # mark retrieved so an unawaited failure is not logged
+
+
+async def _await_inflight(future: asyncio.Future):
+    """Wait for another caller's load; returns (ok, value), ok is False if that load was cancelled"""
+    try:
+        return True, await asyncio.shield(future)
+    except asyncio.CancelledError:
+        if not future.cancelled():
+            raise
+        return False, None
+
+
+class AsyncTTLCache:
+    """Bounded async cache with per-entry TTL, LRU eviction and single-flight loads.
+
+    Loaders return the value, or None when the entity does not exist (cached
+    for negative_ttl). Loader exceptions propagate and are never cached.
+    """
+
+    def __init__(self, name: str, ttl: float, maxsize: int = CACHE_MAXSIZE, negative_ttl: float = NEGATIVE_CACHE_TTL):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}  # key -> Future
+        self._generation = 0  # bumped on invalidation so loads racing with it are not stored
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, value, generation: int):
+        if generation != self._generation:
+            return
+        ttl = self.negative_ttl if value is None else self.ttl
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, NOT_FOUND if value is None else value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _cached_value(self, key):
+        """Return (found, value); value is None for a cached 404"""
+        entry = self._lookup(key)
+        if entry is None:
+            return False, None
+        value = entry[1]
+        if value is NOT_FOUND:
+            self.negative_hits += 1
+            return True, None
+        self.hits += 1
+        return True, value
+
+    async def get_or_load(self, key, loader):
+        found, value = self._cached_value(key)
+        if found:
+            return value
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            ok, value = await _await_inflight(inflight)
+            if ok:
+                return value
+            return await self.get_or_load(key, loader)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            value = await loader(key)
+        except BaseException as e:
+            _fail(future, e)
+            raise
+        else:
+            self._store(key, value, generation)
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    async def get_many_or_load(self, keys, loader) -> dict:
+        """Resolve many keys, loading all misses with one loader(missing_keys) call.
+
+        loader returns a dict for the keys it found; requested keys absent
+        from it are cached as not found. Returns only keys with a value.
+        """
+        result = {}
+        waiting = {}
+        to_load = []
+        for key in dict.fromkeys(keys):
+            found, value = self._cached_value(key)
+            if found:
+                if value is not None:
+                    result[key] = value
+            elif key in self._inflight:
+                self.coalesced += 1
+                waiting[key] = self._inflight[key]
+            else:
+                self.misses += 1
+                to_load.append(key)
+
+        if to_load:
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in to_load}
+            self._inflight.update(futures)
+            generation = self._generation
+            try:
+                loaded = await loader(to_load)
+            except BaseException as e:
+                for future in futures.values():
+                    _fail(future, e)
+                raise
+            finally:
+                for key in to_load:
+                    self._inflight.pop(key, None)
+            for key in to_load:
+                value = loaded.get(key)
+                self._store(key, value, generation)
+                futures[key].set_result(value)
+                if value is not None:
+                    result[key] = value
+
+        for key, future in waiting.items():
+            try:
+                ok, value = await _await_inflight(future)
+            except Exception:
+                continue  # the other caller's load failed; treat like a miss that could not be resolved
+            if value is not None:
+                result[key] = value
+        return result
+
+    def invalidate(self, key):
+        self._generation += 1
+        self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate) -> int:
+        self._generation += 1
+        keys = [key for key in self._entries if predicate(key)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "inflight": len(self._inflight),
+        }
+
+
+user_names = AsyncTTLCache("user_names", ttl=float(os.getenv("USER_CACHE_TTL", "300")))
+restaurant_names = AsyncTTLCache("restaurant_names", ttl=float(os.getenv("RESTAURANT_CACHE_TTL", "300")))
+shipper_names = AsyncTTLCache("shipper_names", ttl=float(os.getenv("SHIPPER_CACHE_TTL", "60")))
+menu_items = AsyncTTLCache("menu_items", ttl=float(os.getenv("MENU_CACHE_TTL", "60")))
+
+# Positive-only existence checks for order creation: a just-created user or restaurant must never
+# be rejected because of a cached 404, so misses are always re-checked
+EXISTENCE_CACHE_TTL = float(os.getenv("EXISTENCE_CACHE_TTL", "30"))
+user_exists = AsyncTTLCache("user_exists", ttl=EXISTENCE_CACHE_TTL, negative_ttl=0)
+restaurant_exists = AsyncTTLCache("restaurant_exists", ttl=EXISTENCE_CACHE_TTL, negative_ttl=0)
+
+ALL_CACHES = (user_names, restaurant_names, shipper_names, menu_items, user_exists, restaurant_exists)
+
+
+# Last menu version seen per restaurant in invalidation events
+menu_versions = {}
+
+
+def invalidate_restaurant(restaurant_id: str, item_ids=None, menu_version: int = None) -> int:
+    """Drop cached data for a restaurant after restaurant service reports a change.
+
+    Without item_ids, every cached menu item of the restaurant is dropped. The
+    same happens on the first versioned event for a restaurant and whenever
+    menu_version skips ahead, since events may have been missed.
+    Events at or below the last seen version were already applied and only
+    refresh the restaurant name.
+    """
+    restaurant_names.invalidate(restaurant_id)
+    restaurant_exists.invalidate(restaurant_id)
+    if menu_version is not None:
+        last_seen = menu_versions.get(restaurant_id)
+        if last_seen is not None and menu_version <= last_seen:
+            return 0
+        menu_versions[restaurant_id] = menu_version
+        if last_seen is None or menu_version > last_seen + 1:
+            item_ids = None
+    if item_ids is None:
+        return menu_items.invalidate_where(lambda key: key[0] == restaurant_id)
+    for item_id in item_ids:
+        menu_items.invalidate((restaurant_id, item_id))
+    return len(item_ids)
+
+
+def get_cache_stats() -> dict:
+    return {cache.name: cache.stats() for cache in ALL_CACHES}
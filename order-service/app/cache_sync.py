@@ -0,0 +1,111 @@
+"""Cache invalidations shared by every worker process and replica of order service.
+
+Restaurant service sends each menu change to one /cache/invalidate call, which
+reaches a single worker. That worker applies it and records it in the
+cache_invalidations collection. Every worker polls the collection and applies
+the invalidations recorded by the others, so no worker keeps serving (and
+snapshotting into new orders) prices that changed elsewhere for longer than
+CACHE_SYNC_INTERVAL.
+
+Records expire after CACHE_SYNC_RETENTION seconds through a TTL index.
+"""
+import os
+import uuid
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+from app import cache
+
+CACHE_SYNC_ENABLED = os.getenv("CACHE_SYNC_ENABLED", "true").lower() == "true"
+CACHE_SYNC_INTERVAL = float(os.getenv("CACHE_SYNC_INTERVAL", "0.5"))
+CACHE_SYNC_RETENTION = int(os.getenv("CACHE_SYNC_RETENTION", "3600"))
+# Each poll re-reads this far back, for records written with a slightly older timestamp
+# (insert latency, clock differences between hosts) after the previous poll
+POLL_OVERLAP = timedelta(seconds=5)
+
+COLLECTION = "cache_invalidations"
+
+# Tells this process's own records apart from those of other workers
+ORIGIN = uuid.uuid4().hex
+
+_task: asyncio.Task = None
+
+stats = {
+    "published": 0,
+    "publish_errors": 0,
+    "applied": 0,
+    "poll_errors": 0,
+}
+
+
+def _now() -> datetime:
+    # Naive UTC, which is how the driver returns BSON dates
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+async def publish(db, restaurant_id: str, item_ids=None, menu_version: int = None):
+    """Record an invalidation already applied here, for the other workers to apply"""
+    if not CACHE_SYNC_ENABLED:
+        return
+    try:
+        await db[COLLECTION].insert_one({
+            "restaurant_id": restaurant_id,
+            "item_ids": item_ids,
+            "menu_version": menu_version,
+            "origin": ORIGIN,
+            "at": _now(),
+        })
+        stats["published"] += 1
+    except PyMongoError as e:
+        stats["publish_errors"] += 1
+        print(f"Could not share cache invalidation for restaurant {restaurant_id}: {e}")
+
+
+async def _poll(db):
+    """Apply invalidations recorded by other processes since the last poll"""
+    since = _now()  # caches start empty, so nothing recorded earlier matters
+    applied = {}  # record id -> at, for records inside the overlap window
+    while True:
+        await asyncio.sleep(CACHE_SYNC_INTERVAL)
+        polled_at = _now()
+        try:
+            cursor = db[COLLECTION].find({"at": {"$gte": since - POLL_OVERLAP}}).sort("at", ASCENDING)
+            async for record in cursor:
+                if record["_id"] in applied:
+                    continue
+                applied[record["_id"]] = record["at"]
+                if record.get("origin") == ORIGIN:
+                    continue
+                cache.invalidate_restaurant(record["restaurant_id"], record.get("item_ids"),
+                                            record.get("menu_version"))
+                stats["applied"] += 1
+        except PyMongoError as e:
+            stats["poll_errors"] += 1
+            print(f"Cache invalidation poll failed: {e}")
+            continue
+        since = polled_at
+        applied = {record_id: at for record_id, at in applied.items() if at >= since - POLL_OVERLAP}
+
+
+async def start_cache_sync(db):
+    global _task
+    if _task is not None or not CACHE_SYNC_ENABLED:
+        return
+    _task = asyncio.create_task(_poll(db))
+
+
+async def stop_cache_sync():
+    global _task
+    if _task is None:
+        return
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
+
+
+def get_cache_sync_stats() -> dict:
+    return {"enabled": CACHE_SYNC_ENABLED, "interval": CACHE_SYNC_INTERVAL, "origin": ORIGIN, **stats}
@@ -2,264 +2,708 @@ from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
 from app.schemas import OrderCreate
 from datetime import datetime
-import httpx
+from typing import List, Optional
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+import asyncio
+import base64
+import json
+from app import cache, resilience
+from service_common.tracing import traced
+from app.database import for_listings
+from app.resilience import UPSTREAM_ERRORS
 import os
 
+# Upper bound on outbound lookups in flight for a single enrichment pass
+ENRICH_CONCURRENCY = int(os.getenv("ENRICH_CONCURRENCY", "20"))
 
-async def fetch_restaurant_name(restaurant_id: str) -> str:
-    """Fetch restaurant name from restaurant service"""
+# Search radius around the restaurant for nearest-shipper dispatch
+DISPATCH_RADIUS_KM = float(os.getenv("DISPATCH_RADIUS_KM", "5.0"))
+
+# Documents per Mongo getMore and per NDJSON chunk when streaming exports
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+
+# Per-dependency budget; a slow service falls back to "Unknown" instead of stalling the response
+DEPENDENCY_TIMEOUTS = {
+    "user": float(os.getenv("USER_SERVICE_TIMEOUT", "2.0")),
+    "restaurant": float(os.getenv("RESTAURANT_SERVICE_TIMEOUT", "2.0")),
+    "shipper": float(os.getenv("SHIPPER_SERVICE_TIMEOUT", "2.0")),
+}
+
+UNKNOWN_MENU_ITEM = {"name": "Unknown", "price": 0}
+
+# Most ids or menu items the other services accept in one batch request; larger lookups are split
+BATCH_MAX_SIZE = 1000
+
+
+async def _get_json(target: str, url: str):
+    """GET a resource from another service; None on 404, raises on any other failure"""
+    resp = await resilience.request(target, "GET", url)
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def _load_restaurant_name(restaurant_id: str):
+    restaurant_service_url = os.getenv("RESTAURANT_SERVICE_URL", "http://restaurant-service:8000")
+    data = await _get_json("restaurant", f"{restaurant_service_url}/restaurants/{restaurant_id}?fields=name")
+    return data.get("name", "Unknown") if data is not None else None
+
+
+async def _load_restaurant(restaurant_id: str):
+    restaurant_service_url = os.getenv("RESTAURANT_SERVICE_URL", "http://restaurant-service:8000")
+    data = await _get_json("restaurant", f"{restaurant_service_url}/restaurants/{restaurant_id}?fields=name,location")
+    if data is None:
+        return None
+    return {"name": data.get("name", "Unknown"), "location": data.get("location")}
+
+
+async def _load_shipper_name(shipper_id: str):
+    shipper_service_url = os.getenv("SHIPPER_SERVICE_URL", "http://shipper-service:8000")
+    data = await _get_json("shipper", f"{shipper_service_url}/shippers/{shipper_id}")
+    return data.get("name", "Unknown") if data is not None else None
+
+
+async def _load_user_name(user_id: str):
+    user_service_url = os.getenv("USER_SERVICE_URL", "http://user-service:8000")
+    data = await _get_json("user", f"{user_service_url}/users/{user_id}")
+    return data.get("username", "Unknown") if data is not None else None
+
+
+def _chunks(values: list) -> list:
+    values = list(values)
+    return [values[i:i + BATCH_MAX_SIZE] for i in range(0, len(values), BATCH_MAX_SIZE)]
+
+
+async def _post_batch(target: str, url: str, ids: list, name_field: str) -> dict:
+    async def post(chunk):
+        # Batch lookups are reads, so they are safe to retry and hedge despite being POSTs
+        resp = await resilience.request(target, "POST", url, idempotent=True, json={"ids": chunk})
+        resp.raise_for_status()
+        return {entity["id"]: entity.get(name_field, "Unknown") for entity in resp.json()}
+
+    names = {}
+    for found in await asyncio.gather(*(post(chunk) for chunk in _chunks(ids))):
+        names.update(found)
+    return names
+
+
+async def _load_user_names(user_ids: list) -> dict:
+    user_service_url = os.getenv("USER_SERVICE_URL", "http://user-service:8000")
+    return await _post_batch("user", f"{user_service_url}/users/batch", user_ids, "username")
+
+
+async def _load_shipper_names(shipper_ids: list) -> dict:
+    shipper_service_url = os.getenv("SHIPPER_SERVICE_URL", "http://shipper-service:8000")
+    return await _post_batch("shipper", f"{shipper_service_url}/shippers/batch", shipper_ids, "name")
+
+
+async def _load_menu_items(keys: list) -> dict:
+    restaurant_service_url = os.getenv("RESTAURANT_SERVICE_URL", "http://restaurant-service:8000")
+
+    async def post(chunk):
+        resp = await resilience.request(
+            "restaurant", "POST", f"{restaurant_service_url}/restaurants/menu-items/batch", idempotent=True,
+            json={"items": [{"restaurant_id": rid, "item_id": iid} for rid, iid in chunk]}
+        )
+        resp.raise_for_status()
+        return {
+            (item["restaurant_id"], item["id"]): {"name": item.get("name", "Unknown"), "price": item.get("price", 0)}
+            for item in resp.json()
+        }
+
+    items = {}
+    for found in await asyncio.gather(*(post(chunk) for chunk in _chunks(keys))):
+        items.update(found)
+    return items
+
+
+@traced()
+async def fetch_restaurant_name(restaurant_id: str, strict: bool = False):
+    """Fetch restaurant name from restaurant service (cached).
+
+    Falls back to "Unknown"; with strict, returns None for a missing
+    restaurant and raises if restaurant service cannot be reached.
+    """
     try:
-        restaurant_service_url = os.getenv("RESTAURANT_SERVICE_URL", "http://restaurant-service:8000")
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(f"{restaurant_service_url}/restaurants/{restaurant_id}", timeout=5.0)
-            if resp.status_code == 200:
-                data = resp.json()
-                return data.get("name", "Unknown")
-    except:
-        pass
+        name = await cache.restaurant_names.get_or_load(restaurant_id, _load_restaurant_name)
+        if name is not None or strict:
+            return name
+    except UPSTREAM_ERRORS:
+        if strict:
+            raise
     return "Unknown"
 
 
+@traced()
 async def fetch_shipper_name(shipper_id: str) -> str:
-    """Fetch shipper name from shipper service"""
+    """Fetch shipper name from shipper service (cached)"""
     try:
-        shipper_service_url = os.getenv("SHIPPER_SERVICE_URL", "http://shipper-service:8000")
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(f"{shipper_service_url}/shippers/{shipper_id}", timeout=5.0)
-            if resp.status_code == 200:
-                data = resp.json()
-                return data.get("name", "Unknown")
-    except:
+        name = await cache.shipper_names.get_or_load(shipper_id, _load_shipper_name)
+        if name is not None:
+            return name
+    except UPSTREAM_ERRORS:
         pass
     return "Unknown"
 
 
+@traced()
 async def fetch_user_name(user_id: str) -> str:
-    """Fetch user name from user service"""
+    """Fetch user name from user service (cached)"""
     try:
-        user_service_url = os.getenv("USER_SERVICE_URL", "http://user-service:8000")
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(f"{user_service_url}/users/{user_id}", timeout=5.0)
-            if resp.status_code == 200:
-                data = resp.json()
-                return data.get("username", "Unknown")
-    except:
+        name = await cache.user_names.get_or_load(user_id, _load_user_name)
+        if name is not None:
+            return name
+    except UPSTREAM_ERRORS:
         pass
     return "Unknown"
 
 
-async def fetch_menu_item_details(restaurant_id: str, item_id: str) -> dict:
-    """Fetch menu item details from restaurant service"""
+@traced()
+async def fetch_user_names(user_ids, strict: bool = False) -> dict:
+    """Fetch many user names with one batch call for the cache misses; unknown ids are omitted.
+
+    An unreachable user service gives an empty result, or raises with strict.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
     try:
-        restaurant_service_url = os.getenv("RESTAURANT_SERVICE_URL", "http://restaurant-service:8000")
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(f"{restaurant_service_url}/restaurants/{restaurant_id}/menu-items", timeout=5.0)
-            if resp.status_code == 200:
-                items = resp.json()
-                for item in items:
-                    if item.get("id") == item_id:
-                        return {"name": item.get("name", "Unknown"), "price": item.get("price", 0)}
-    except:
-        pass
-    return {"name": "Unknown", "price": 0}
+        return await cache.user_names.get_many_or_load(user_ids, _load_user_names)
+    except UPSTREAM_ERRORS:
+        if strict:
+            raise
+        return {}
 
 
-async def create_order(db: AsyncIOMotorDatabase, order_data: OrderCreate):
-    """Create a new order (cart status)"""
-    orders_collection = db["orders"]
-    order_dict = order_data.model_dump()
-    order_dict["status"] = "cart"
-    order_dict["created_at"] = datetime.now().isoformat()
-    result = await orders_collection.insert_one(order_dict)
-    
-    # Fetch names
-    user_name = await fetch_user_name(order_dict["user_id"])
-    restaurant_name = await fetch_restaurant_name(order_dict["restaurant_id"])
-    
-    # Build items with details
+@traced()
+async def fetch_shipper_names(shipper_ids, strict: bool = False) -> dict:
+    """Fetch many shipper names with one batch call for the cache misses; unknown ids are omitted.
+
+    An unreachable shipper service gives an empty result, or raises with strict.
+    """
+    shipper_ids = list(shipper_ids)
+    if not shipper_ids:
+        return {}
+    try:
+        return await cache.shipper_names.get_many_or_load(shipper_ids, _load_shipper_names)
+    except UPSTREAM_ERRORS:
+        if strict:
+            raise
+        return {}
+
+
+@traced()
+async def fetch_menu_items(keys, strict: bool = False) -> dict:
+    """Fetch many menu items from restaurant service, loading cache misses in one batch call.
+
+    keys is an iterable of (restaurant_id, menu_item_id); returns a dict keyed
+    the same way with {"name", "price"} for every item that was found.
+    An unreachable restaurant service gives an empty result, or raises with strict.
+    """
+    keys = list(keys)
+    if not keys:
+        return {}
+    try:
+        return await cache.menu_items.get_many_or_load(keys, _load_menu_items)
+    except UPSTREAM_ERRORS:
+        if strict:
+            raise
+        return {}
+
+
+class ReferenceNotFound(Exception):
+    """A user or restaurant referenced by a new order does not exist"""
+
+
+class ServiceUnavailable(Exception):
+    """A service needed to validate a new order could not be reached"""
+
+
+class ShipperUnavailable(Exception):
+    """The requested shipper is busy, or no shipper is free for dispatch"""
+
+
+class InvalidTransition(Exception):
+    """The order's current status does not allow the requested status change"""
+
+
+# Allowed status changes; delivered is final. "shipped" is only reached by assigning a shipper.
+ORDER_TRANSITIONS = {
+    "cart": ("confirmed",),
+    "confirmed": ("preparing",),
+    "preparing": ("ready",),
+    "ready": ("shipped",),
+    "shipped": ("delivered",),
+    "delivered": (),
+}
+
+
+async def _require(existence_cache, key: str, loader, dependency: str, label: str):
+    """Return what loader found for a referenced entity, raising if it is missing or its service is down"""
+    try:
+        found = await resilience.within(DEPENDENCY_TIMEOUTS[dependency], existence_cache.get_or_load(key, loader))
+    except UPSTREAM_ERRORS + (asyncio.TimeoutError,):
+        raise ServiceUnavailable(f"Cannot reach {dependency} service")
+    if found is None:
+        raise ReferenceNotFound(f"{label} not found")
+    return found
+
+
+async def validate_user(user_id: str) -> str:
+    return await _require(cache.user_exists, user_id, _load_user_name, "user", "User")
+
+
+async def validate_restaurant(restaurant_id: str) -> dict:
+    """Return the restaurant's name and location"""
+    return await _require(cache.restaurant_exists, restaurant_id, _load_restaurant, "restaurant", "Restaurant")
+
+
+async def _load_required_menu_items(keys: list) -> dict:
+    found = await cache.menu_items.get_many_or_load(keys, _load_menu_items)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        # Confirm with restaurant service rather than trust a cached 404 or a failed coalesced load
+        found.update(await _load_menu_items(missing))
+    return found
+
+
+async def validate_menu_items(keys: list) -> dict:
+    """Return the name and price of every (restaurant_id, menu_item_id) in keys.
+
+    Raises ReferenceNotFound if any item does not exist and ServiceUnavailable
+    if restaurant service cannot be reached, so an order is never stored
+    without its prices.
+    """
+    try:
+        found = await resilience.within(DEPENDENCY_TIMEOUTS["restaurant"], _load_required_menu_items(keys))
+    except UPSTREAM_ERRORS + (asyncio.TimeoutError,):
+        raise ServiceUnavailable("Cannot reach restaurant service")
+    missing = [key[1] for key in keys if key not in found]
+    if missing:
+        raise ReferenceNotFound(f"Menu item not found: {', '.join(dict.fromkeys(missing))}")
+    return found
+
+
+async def _timed_lookup(dependency: str, default, func, *args):
+    """Run one lookup within its dependency timeout, falling back to default"""
+    try:
+        return await resilience.within(DEPENDENCY_TIMEOUTS[dependency], func(*args))
+    except asyncio.TimeoutError:
+        return default
+
+
+async def _bounded_lookup(semaphore: asyncio.Semaphore, dependency: str, default, func, *args):
+    """Run one lookup under the shared concurrency limit and its dependency timeout"""
+    async with semaphore:
+        return await _timed_lookup(dependency, default, func, *args)
+
+
+def _snapshot_fields(order: dict, user_name, restaurant_name, shipper_name, menu_details: dict) -> dict:
+    """Denormalized fields stored on the order document so reads need no cross-service calls"""
     items_with_details = []
-    for item in order_dict["items"]:
-        menu_details = await fetch_menu_item_details(order_dict["restaurant_id"], item["menu_item_id"])
+    for item in order["items"]:
+        details = menu_details.get((order["restaurant_id"], item["menu_item_id"]), UNKNOWN_MENU_ITEM)
         items_with_details.append({
             "menu_item_id": item["menu_item_id"],
-            "item_name": menu_details["name"],
-            "price": menu_details["price"],
-            "quantity": item["quantity"]
+            "item_name": details["name"],
+            "price": details["price"],
+            "quantity": item["quantity"],
+            "line_total": round(details["price"] * item["quantity"], 2),
         })
-    
+
     return {
-        "id": str(result.inserted_id),
-        "user_id": order_dict["user_id"],
         "user_name": user_name,
-        "restaurant_id": order_dict["restaurant_id"],
         "restaurant_name": restaurant_name,
+        "shipper_name": shipper_name,
         "items": items_with_details,
-        "status": order_dict["status"],
-        "shipper_id": None,
-        "shipper_name": None,
-        "created_at": order_dict["created_at"],
+        "total": round(sum(item["line_total"] for item in items_with_details), 2),
+    }
+
+
+def _order_from_document(order: dict) -> dict:
+    return {
+        "id": str(order["_id"]),
+        "user_id": order["user_id"],
+        "user_name": order.get("user_name"),
+        "restaurant_id": order["restaurant_id"],
+        "restaurant_name": order.get("restaurant_name"),
+        "items": order["items"],
+        "total": order.get("total"),
+        "status": order["status"],
+        "shipper_id": order.get("shipper_id"),
+        "shipper_name": order.get("shipper_name"),
+        "created_at": order.get("created_at"),
+        "status_timestamps": order.get("status_timestamps"),
     }
 
 
+async def enrich_orders(orders: list) -> list:
+    """Resolve user, restaurant, shipper and menu item details for a batch of orders.
+
+    Returns the orders with their snapshot fields (names, item prices, line
+    totals, order total) filled in. Every distinct lookup across the batch is
+    issued once and all of them run concurrently, bounded by
+    ENRICH_CONCURRENCY. Users, shippers and menu items for the whole batch
+    are each resolved by a single batch call.
+    """
+    if not orders:
+        return []
+
+    user_ids = {order["user_id"] for order in orders}
+    restaurant_ids = {order["restaurant_id"] for order in orders}
+    shipper_ids = {order["shipper_id"] for order in orders if order.get("shipper_id")}
+    menu_keys = {
+        (order["restaurant_id"], item["menu_item_id"])
+        for order in orders
+        for item in order["items"]
+    }
+
+    semaphore = asyncio.Semaphore(ENRICH_CONCURRENCY)
+    lookups = [
+        _bounded_lookup(semaphore, "user", {}, fetch_user_names, user_ids),
+        _bounded_lookup(semaphore, "shipper", {}, fetch_shipper_names, shipper_ids),
+        _bounded_lookup(semaphore, "restaurant", {}, fetch_menu_items, menu_keys),
+    ]
+    for restaurant_id in restaurant_ids:
+        lookups.append(_bounded_lookup(semaphore, "restaurant", "Unknown", fetch_restaurant_name, restaurant_id))
+
+    results = await asyncio.gather(*lookups)
+    user_names, shipper_names, menu_details = results[:3]
+    restaurant_names = dict(zip(restaurant_ids, results[3:]))
+
+    return [
+        {
+            **order,
+            **_snapshot_fields(
+                order,
+                user_names.get(order["user_id"], "Unknown"),
+                restaurant_names[order["restaurant_id"]],
+                shipper_names.get(order["shipper_id"], "Unknown") if order.get("shipper_id") else None,
+                menu_details,
+            ),
+        }
+        for order in orders
+    ]
+
+
+def is_snapshotted(order: dict) -> bool:
+    return "total" in order
+
+
+async def _orders_to_response(orders: list) -> list:
+    """Build responses from stored snapshots.
+
+    Orders written before snapshotting existed (see app.backfill) are enriched
+    on the fly so they still render until the backfill has run.
+    """
+    legacy = [order for order in orders if not is_snapshotted(order)]
+    if legacy:
+        enriched = {order["_id"]: order for order in await enrich_orders(legacy)}
+        orders = [enriched.get(order["_id"], order) for order in orders]
+    return [_order_from_document(order) for order in orders]
+
+
+async def create_order(db: AsyncIOMotorDatabase, order_data: OrderCreate):
+    """Create a new order (cart status), snapshotting names and prices.
+
+    User, restaurant and menu item validation run concurrently, and the
+    validated names and prices are reused for the snapshot. Raises
+    ReferenceNotFound (unknown user, restaurant or menu item) or
+    ServiceUnavailable if validation fails; nothing is stored then.
+    """
+    orders_collection = db["orders"]
+    order_dict = order_data.model_dump()
+    order_dict["status"] = "cart"
+    order_dict["created_at"] = datetime.now().isoformat()
+    order_dict["updated_at"] = order_dict["created_at"]
+    order_dict["status_timestamps"] = {"cart": order_dict["created_at"]}
+
+    menu_keys = [(order_dict["restaurant_id"], item["menu_item_id"]) for item in order_dict["items"]]
+    user_name, restaurant, menu_details = await asyncio.gather(
+        validate_user(order_dict["user_id"]),
+        validate_restaurant(order_dict["restaurant_id"]),
+        validate_menu_items(menu_keys),
+        return_exceptions=True,
+    )
+    for outcome in (user_name, restaurant, menu_details):
+        if isinstance(outcome, BaseException):
+            raise outcome
+
+    order_dict.update(_snapshot_fields(order_dict, user_name, restaurant["name"], None, menu_details))
+    # Pickup point for nearest-shipper dispatch
+    order_dict["restaurant_location"] = restaurant["location"]
+    result = await orders_collection.insert_one(order_dict)
+    order_dict["_id"] = result.inserted_id
+    return _order_from_document(order_dict)
+
+
 async def get_order(db: AsyncIOMotorDatabase, order_id: str):
     """Retrieve an order by ID"""
     orders_collection = db["orders"]
     try:
         order = await orders_collection.find_one({"_id": ObjectId(order_id)})
         if order:
-            # Fetch names
-            user_name = await fetch_user_name(order["user_id"])
-            restaurant_name = await fetch_restaurant_name(order["restaurant_id"])
-            
-            # Fetch shipper name if exists
-            shipper_name = None
-            if order.get("shipper_id"):
-                shipper_name = await fetch_shipper_name(order["shipper_id"])
-            
-            # Build items with details
-            items_with_details = []
-            for item in order["items"]:
-                menu_details = await fetch_menu_item_details(order["restaurant_id"], item["menu_item_id"])
-                items_with_details.append({
-                    "menu_item_id": item["menu_item_id"],
-                    "item_name": menu_details["name"],
-                    "price": menu_details["price"],
-                    "quantity": item["quantity"]
-                })
-            
-            return {
-                "id": str(order["_id"]),
-                "user_id": order["user_id"],
-                "user_name": user_name,
-                "restaurant_id": order["restaurant_id"],
-                "restaurant_name": restaurant_name,
-                "items": items_with_details,
-                "status": order["status"],
-                "shipper_id": order.get("shipper_id"),
-                "shipper_name": shipper_name,
-                "created_at": order.get("created_at"),
-            }
+            return (await _orders_to_response([order]))[0]
         return None
     except Exception:
         return None
 
 
+def _previous_statuses(status: str) -> list:
+    return [current for current, allowed in ORDER_TRANSITIONS.items() if status in allowed]
+
+
+async def _transition(db: AsyncIOMotorDatabase, order_id: str, status: str, extra_fields: Optional[dict] = None):
+    """Move an order to status with one conditional update and return the updated document.
+
+    The update matches on _id alone and only changes anything if the current
+    status allows it, so the document it returns (as it was before) tells a
+    missing order, an applied change and a rejected one apart without a
+    second read. Returns None if the order does not exist; raises
+    InvalidTransition otherwise.
+    """
+    if status not in ORDER_TRANSITIONS:
+        raise InvalidTransition(f"Unknown status '{status}'")
+    if not ObjectId.is_valid(order_id):
+        return None
+    now = datetime.now().isoformat()
+    fields = {"status": status, "updated_at": now, **(extra_fields or {})}
+    allowed = {"$in": ["$status", _previous_statuses(status)]}
+    fields_set = {**fields, f"status_timestamps.{status}": now}
+    changes = {field: {"$cond": [allowed, {"$literal": value}, f"${field}"]} for field, value in fields_set.items()}
+    before = await db["orders"].find_one_and_update(
+        {"_id": ObjectId(order_id)}, [{"$set": changes}], return_document=ReturnDocument.BEFORE,
+    )
+    if not before:
+        return None
+    if before["status"] not in _previous_statuses(status):
+        raise InvalidTransition(f"Cannot change order status from '{before['status']}' to '{status}'")
+    return {**before, **fields, "status_timestamps": {**before.get("status_timestamps", {}), status: now}}
+
+
 async def update_order_status(db: AsyncIOMotorDatabase, order_id: str, status: str):
-    """Update order status"""
-    orders_collection = db["orders"]
+    """Advance order status along ORDER_TRANSITIONS, returning the updated order.
+
+    Returns None if the order does not exist; raises InvalidTransition if the
+    current status does not allow the change.
+    """
+    if status == "shipped":
+        raise InvalidTransition("Assign a shipper to ship an order")
+    order = await _transition(db, order_id, status)
+    if not order:
+        return None
+    return (await _orders_to_response([order]))[0]
+
+
+async def _shippable_order(db: AsyncIOMotorDatabase, order_id: str, projection: dict):
+    """Return the order if it exists, raising InvalidTransition if it cannot be shipped yet"""
+    if not ObjectId.is_valid(order_id):
+        return None
+    order = await db["orders"].find_one({"_id": ObjectId(order_id)}, {"status": 1, **projection})
+    if order and order["status"] not in _previous_statuses("shipped"):
+        raise InvalidTransition(f"Cannot change order status from '{order['status']}' to 'shipped'")
+    return order
+
+
+async def _claim_shipper(path: str, payload: dict) -> dict:
+    """Ask shipper service to atomically claim a shipper for the order"""
+    shipper_service_url = os.getenv("SHIPPER_SERVICE_URL", "http://shipper-service:8000")
     try:
-        await orders_collection.update_one(
-            {"_id": ObjectId(order_id)},
-            {"$set": {"status": status}}
+        # Shipper service lets one shipper hold an order (unique index on current_order_id) and answers a
+        # repeated claim with that shipper, so retries and hedges cannot leave a second shipper busy
+        resp = await resilience.request(
+            "shipper", "POST", f"{shipper_service_url}{path}", idempotent=True, json=payload
         )
-        return await get_order(db, order_id)
-    except Exception:
+        if resp.status_code == 409:
+            raise ShipperUnavailable(resp.json().get("detail", "Shipper not available"))
+        if resp.status_code == 404:
+            raise ReferenceNotFound("Shipper not found")
+        resp.raise_for_status()
+        return resp.json()
+    except UPSTREAM_ERRORS:
+        raise ServiceUnavailable("Cannot reach shipper service")
+
+
+async def _release_shipper(shipper_id: str, order_id: str):
+    """Hand back a claimed shipper; best effort, a failure is only logged"""
+    shipper_service_url = os.getenv("SHIPPER_SERVICE_URL", "http://shipper-service:8000")
+    try:
+        # Conditional on the shipper still being claimed for this order, so retrying is safe
+        resp = await resilience.request(
+            "shipper", "POST", f"{shipper_service_url}/shippers/{shipper_id}/release", idempotent=True,
+            json={"order_id": order_id},
+        )
+        if resp.status_code >= 500:
+            resp.raise_for_status()
+    except UPSTREAM_ERRORS as e:
+        print(f"Could not release shipper {shipper_id} claimed for order {order_id}: {e}")
+
+
+async def _record_shipper(db: AsyncIOMotorDatabase, order_id: str, shipper: dict):
+    """Move the order to shipped with the claimed shipper.
+
+    If the order changed since it was checked (e.g. a concurrent assignment
+    won), the claim is released again unless the winner recorded this same
+    shipper, so a shipper never stays busy with an order it does not have.
+    """
+    try:
+        order = await _transition(
+            db, order_id, "shipped", {"shipper_id": shipper["id"], "shipper_name": shipper["name"]}
+        )
+    except InvalidTransition:
+        current = await db["orders"].find_one({"_id": ObjectId(order_id)}, {"shipper_id": 1})
+        if not current or current.get("shipper_id") != shipper["id"]:
+            await _release_shipper(shipper["id"], order_id)
+        raise
+    if not order:
+        await _release_shipper(shipper["id"], order_id)
         return None
+    return (await _orders_to_response([order]))[0]
 
 
 async def assign_shipper(db: AsyncIOMotorDatabase, order_id: str, shipper_id: str):
-    """Assign shipper to order and update shipper status to busy"""
-    orders_collection = db["orders"]
+    """Claim a specific shipper for the order and record it.
+
+    Returns None if the order does not exist; raises InvalidTransition if the
+    order is not ready, ShipperUnavailable if the shipper is already busy,
+    ReferenceNotFound if it does not exist and ServiceUnavailable if shipper
+    service cannot be reached.
+    """
+    if not await _shippable_order(db, order_id, {}):
+        return None
+    shipper = await _claim_shipper(f"/shippers/{shipper_id}/claim", {"order_id": order_id})
+    return await _record_shipper(db, order_id, shipper)
+
+
+async def dispatch_order(db: AsyncIOMotorDatabase, order_id: str):
+    """Let shipper service pick and claim the next available shipper for the order.
+
+    When the restaurant has coordinates, the nearest available shipper within
+    DISPATCH_RADIUS_KM of it is chosen.
+
+    Returns None if the order does not exist; raises InvalidTransition if the
+    order is not ready, ShipperUnavailable if no shipper is free and
+    ServiceUnavailable if shipper service cannot be reached.
+    """
+    order = await _shippable_order(db, order_id, {"restaurant_location": 1})
+    if not order:
+        return None
+    payload = {"order_id": order_id}
+    if order.get("restaurant_location"):
+        payload["location"] = order["restaurant_location"]
+        payload["radius_km"] = DISPATCH_RADIUS_KM
+    shipper = await _claim_shipper("/shippers/dispatch", payload)
+    return await _record_shipper(db, order_id, shipper)
+
+
+def encode_cursor(order: dict) -> str:
+    raw = json.dumps([order.get("created_at"), str(order["_id"])])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """Return (created_at, ObjectId) from a cursor; raises ValueError if it is malformed"""
     try:
-        # Update shipper status to busy in shipper service
-        try:
-            shipper_service_url = os.getenv("SHIPPER_SERVICE_URL", "http://shipper-service:8000")
-            async with httpx.AsyncClient() as client:
-                await client.put(
-                    f"{shipper_service_url}/shippers/{shipper_id}/status",
-                    json={"status": "busy"},
-                    timeout=5.0
-                )
-        except:
-            pass  # Continue even if shipper service call fails
-        
-        # Update order with shipper
-        await orders_collection.update_one(
-            {"_id": ObjectId(order_id)},
-            {"$set": {"shipper_id": shipper_id, "status": "shipped"}}
-        )
-        return await get_order(db, order_id)
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return created_at, ObjectId(order_id)
     except Exception:
-        return None
+        raise ValueError("Invalid cursor")
 
 
-async def get_user_orders(db: AsyncIOMotorDatabase, user_id: str):
-    """Get all orders for a user"""
-    orders_collection = db["orders"]
-    cursor = orders_collection.find({"user_id": user_id})
-    result = []
-    async for order in cursor:
-        # Fetch names
-        user_name = await fetch_user_name(order["user_id"])
-        restaurant_name = await fetch_restaurant_name(order["restaurant_id"])
-        
-        # Fetch shipper name if exists
-        shipper_name = None
-        if order.get("shipper_id"):
-            shipper_name = await fetch_shipper_name(order["shipper_id"])
-        
-        # Build items with details
-        items_with_details = []
-        for item in order["items"]:
-            menu_details = await fetch_menu_item_details(order["restaurant_id"], item["menu_item_id"])
-            items_with_details.append({
-                "menu_item_id": item["menu_item_id"],
-                "item_name": menu_details["name"],
-                "price": menu_details["price"],
-                "quantity": item["quantity"]
-            })
-        
-        result.append({
-            "id": str(order["_id"]),
-            "user_id": order["user_id"],
-            "user_name": user_name,
-            "restaurant_id": order["restaurant_id"],
-            "restaurant_name": restaurant_name,
-            "items": items_with_details,
-            "status": order["status"],
-            "shipper_id": order.get("shipper_id"),
-            "shipper_name": shipper_name,
-            "created_at": order.get("created_at"),
-        })
-    return result
+def _created_at_value(value: datetime) -> str:
+    # created_at is stored as a naive local ISO string, so compare in the same form
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.isoformat()
 
 
-async def get_restaurant_orders(db: AsyncIOMotorDatabase, restaurant_id: str):
-    """Get all orders for a restaurant"""
-    orders_collection = db["orders"]
-    cursor = orders_collection.find({"restaurant_id": restaurant_id})
-    result = []
-    async for order in cursor:
-        # Fetch names
-        user_name = await fetch_user_name(order["user_id"])
-        restaurant_name = await fetch_restaurant_name(order["restaurant_id"])
-        
-        # Fetch shipper name if exists
-        shipper_name = None
-        if order.get("shipper_id"):
-            shipper_name = await fetch_shipper_name(order["shipper_id"])
-        
-        # Build items with details
-        items_with_details = []
-        for item in order["items"]:
-            menu_details = await fetch_menu_item_details(order["restaurant_id"], item["menu_item_id"])
-            items_with_details.append({
-                "menu_item_id": item["menu_item_id"],
-                "item_name": menu_details["name"],
-                "price": menu_details["price"],
-                "quantity": item["quantity"]
-            })
-        
-        result.append({
-            "id": str(order["_id"]),
-            "user_id": order["user_id"],
-            "user_name": user_name,
-            "restaurant_id": order["restaurant_id"],
-            "restaurant_name": restaurant_name,
-            "items": items_with_details,
-            "status": order["status"],
-            "shipper_id": order.get("shipper_id"),
-            "shipper_name": shipper_name,
-            "created_at": order.get("created_at"),
-        })
-    return result
+def _filtered_query(query: dict, status: Optional[List[str]], created_from: Optional[datetime],
+                    created_to: Optional[datetime]) -> dict:
+    query = dict(query)
+    if status:
+        query["status"] = {"$in": status}
+    created_range = {}
+    if created_from:
+        created_range["$gte"] = _created_at_value(created_from)
+    if created_to:
+        created_range["$lt"] = _created_at_value(created_to)
+    if created_range:
+        query["created_at"] = created_range
+    return query
+
+
+async def _list_orders(
+    db: AsyncIOMotorDatabase,
+    query: dict,
+    limit: int,
+    cursor: Optional[str] = None,
+    status: Optional[List[str]] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+):
+    """One page of orders, newest first, using keyset pagination on (created_at, _id).
+
+    Read with MONGO_LISTING_READ_PREFERENCE: with a secondary preference a
+    just-placed order can be missing for the length of the replication lag.
+
+    Returns (orders, next_cursor); next_cursor is None on the last page.
+    """
+    orders_collection = for_listings(db["orders"])
+    query = _filtered_query(query, status, created_from, created_to)
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": last_id}},
+        ]
+
+    orders = await orders_collection.find(query).sort(
+        [("created_at", DESCENDING), ("_id", DESCENDING)]
+    ).limit(limit + 1).to_list(length=limit + 1)
+    next_cursor = encode_cursor(orders[limit - 1]) if len(orders) > limit else None
+    return await _orders_to_response(orders[:limit]), next_cursor
+
+
+async def get_user_orders(db: AsyncIOMotorDatabase, user_id: str, limit: int = 50, cursor: Optional[str] = None,
+                          status: Optional[List[str]] = None, created_from: Optional[datetime] = None,
+                          created_to: Optional[datetime] = None):
+    """Get a page of orders for a user"""
+    return await _list_orders(db, {"user_id": user_id}, limit, cursor, status, created_from, created_to)
+
+
+async def get_restaurant_orders(db: AsyncIOMotorDatabase, restaurant_id: str, limit: int = 50,
+                                cursor: Optional[str] = None, status: Optional[List[str]] = None,
+                                created_from: Optional[datetime] = None, created_to: Optional[datetime] = None):
+    """Get a page of orders for a restaurant"""
+    return await _list_orders(db, {"restaurant_id": restaurant_id}, limit, cursor, status, created_from, created_to)
+
+
+async def export_restaurant_orders(db: AsyncIOMotorDatabase, restaurant_id: str, status: Optional[List[str]] = None,
+                                   created_from: Optional[datetime] = None, created_to: Optional[datetime] = None,
+                                   batch_size: int = EXPORT_BATCH_SIZE):
+    """Stream every matching order of a restaurant as NDJSON, oldest first.
+
+    Yields one bytes chunk per batch_size orders, so memory stays flat
+    regardless of how many orders the restaurant has.
+    """
+    orders_collection = for_listings(db["orders"])
+    query = _filtered_query({"restaurant_id": restaurant_id}, status, created_from, created_to)
+    cursor = orders_collection.find(query, batch_size=batch_size).sort(
+        [("created_at", ASCENDING), ("_id", ASCENDING)]
+    )
+    try:
+        batch = []
+        async for order in cursor:
+            batch.append(order)
+            if len(batch) >= batch_size:
+                yield _ndjson(await _orders_to_response(batch))
+                batch = []
+        if batch:
+            yield _ndjson(await _orders_to_response(batch))
+    finally:
+        await cursor.close()
+
+
+def _ndjson(rows: list) -> bytes:
+    return "".join(json.dumps(row) + "\n" for row in rows).encode()
@@ -0,0 +1,216 @@
+"""Push feed of order changes for tracking clients.
+
+Changes come from a MongoDB change stream on orders when the deployment
+supports one (replica set or sharded cluster), otherwise from polling the
+updated_at index. Each change is published to the subscribers of its order,
+user and restaurant.
+"""
+import os
+import json
+import asyncio
+from datetime import datetime
+from typing import Optional
+from bson import ObjectId
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+
+# auto: change stream, falling back to polling without a replica set
+ORDER_EVENTS_MODE = os.getenv("ORDER_EVENTS_MODE", "auto")  # auto, change_stream, polling, off
+ORDER_EVENTS_POLL_INTERVAL = float(os.getenv("ORDER_EVENTS_POLL_INTERVAL", "1.0"))
+ORDER_EVENTS_QUEUE_SIZE = int(os.getenv("ORDER_EVENTS_QUEUE_SIZE", "100"))
+# SSE comment sent on idle streams so proxies keep the connection open
+ORDER_EVENTS_HEARTBEAT = float(os.getenv("ORDER_EVENTS_HEARTBEAT", "15.0"))
+RETRY_DELAY = 1.0
+
+# Fields pushed to clients; everything here is snapshotted on the order, so no other service is called
+EVENT_FIELDS = (
+    "user_id", "user_name", "restaurant_id", "restaurant_name", "status", "status_timestamps",
+    "shipper_id", "shipper_name", "total", "created_at", "updated_at",
+)
+
+# "The $changeStream stage is only supported on replica sets"
+CHANGE_STREAM_UNSUPPORTED = {40573}
+
+_subscribers: dict = {}  # (scope, id) -> set of asyncio.Queue
+_task: asyncio.Task = None
+source = None  # "change_stream" or "polling" once running
+
+stats = {
+    "events_published": 0,
+    "events_delivered": 0,
+    "events_dropped": 0,
+    "subscribers": 0,
+}
+
+
+def _payload(order: dict) -> dict:
+    payload = {"id": str(order["_id"])}
+    payload.update({field: order.get(field) for field in EVENT_FIELDS})
+    return payload
+
+
+def _event_from_document(order: dict, operation: str) -> dict:
+    return {"type": "order.created" if operation == "insert" else "order.updated", "order": _payload(order)}
+
+
+async def load_snapshot(db, order_id: str) -> Optional[dict]:
+    """Current state of one order in event form; None if it does not exist"""
+    if not ObjectId.is_valid(order_id):
+        return None
+    order = await db["orders"].find_one({"_id": ObjectId(order_id)}, {field: 1 for field in EVENT_FIELDS})
+    return _payload(order) if order else None
+
+
+def subscribe(scope: str, key: str) -> asyncio.Queue:
+    """Register a queue for changes to one order ("order"), or all orders of a "user" or "restaurant" """
+    queue = asyncio.Queue(maxsize=ORDER_EVENTS_QUEUE_SIZE)
+    _subscribers.setdefault((scope, key), set()).add(queue)
+    stats["subscribers"] += 1
+    return queue
+
+
+def unsubscribe(scope: str, key: str, queue: asyncio.Queue):
+    queues = _subscribers.get((scope, key))
+    if queues and queue in queues:
+        queues.discard(queue)
+        stats["subscribers"] -= 1
+        if not queues:
+            del _subscribers[(scope, key)]
+
+
+def publish(event: dict):
+    order = event["order"]
+    stats["events_published"] += 1
+    for subscription in (("order", order["id"]), ("user", order["user_id"]), ("restaurant", order["restaurant_id"])):
+        for queue in _subscribers.get(subscription, ()):
+            if queue.full():
+                # Slow client: drop its oldest event rather than block the feed; every event carries the full status
+                queue.get_nowait()
+                stats["events_dropped"] += 1
+            queue.put_nowait(event)
+            stats["events_delivered"] += 1
+
+
+async def _watch_change_stream(db):
+    """Publish every insert/update from the orders change stream, resuming after errors"""
+    pipeline = [
+        {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}},
+        {"$project": {"operationType": 1, "fullDocument._id": 1,
+                      **{f"fullDocument.{field}": 1 for field in EVENT_FIELDS}}},
+    ]
+    resume_token = None
+    while True:
+        try:
+            async with db["orders"].watch(pipeline, full_document="updateLookup",
+                                          resume_after=resume_token) as stream:
+                print("Order events: watching change stream")
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    if change.get("fullDocument"):
+                        publish(_event_from_document(change["fullDocument"], change["operationType"]))
+        except OperationFailure as e:
+            if e.code in CHANGE_STREAM_UNSUPPORTED:
+                raise
+            print(f"Order change stream error, resuming: {e}")
+            await asyncio.sleep(RETRY_DELAY)
+        except PyMongoError as e:
+            print(f"Order change stream error, resuming: {e}")
+            await asyncio.sleep(RETRY_DELAY)
+
+
+async def _poll(db):
+    """Publish orders whose updated_at moved since the last poll"""
+    print(f"Order events: polling every {ORDER_EVENTS_POLL_INTERVAL}s")
+    since = datetime.now().isoformat()
+    seen_at_since = set()  # ids already published with updated_at == since
+    projection = {field: 1 for field in EVENT_FIELDS}
+    while True:
+        await asyncio.sleep(ORDER_EVENTS_POLL_INTERVAL)
+        if not _subscribers:
+            # Nobody listening: skip the query and do not replay this gap to later subscribers
+            since, seen_at_since = datetime.now().isoformat(), set()
+            continue
+        try:
+            cursor = db["orders"].find({"updated_at": {"$gte": since}}, projection).sort("updated_at", ASCENDING)
+            async for order in cursor:
+                if order["updated_at"] == since and order["_id"] in seen_at_since:
+                    continue
+                if order["updated_at"] != since:
+                    since, seen_at_since = order["updated_at"], set()
+                seen_at_since.add(order["_id"])
+                operation = "insert" if order.get("created_at") == order["updated_at"] else "update"
+                publish(_event_from_document(order, operation))
+        except PyMongoError as e:
+            print(f"Order events poll failed: {e}")
+
+
+async def _run(db):
+    global source
+    if ORDER_EVENTS_MODE in ("auto", "change_stream"):
+        try:
+            source = "change_stream"
+            await _watch_change_stream(db)
+        except OperationFailure as e:
+            if ORDER_EVENTS_MODE == "change_stream":
+                print(f"Order change stream unavailable: {e}")
+                source = None
+                return
+            print("Change streams need a replica set; falling back to polling")
+    source = "polling"
+    await _poll(db)
+
+
+async def start_order_events(db):
+    global _task
+    if _task is not None or ORDER_EVENTS_MODE == "off":
+        return
+    _task = asyncio.create_task(_run(db))
+
+
+async def stop_order_events():
+    global _task, source
+    if _task is None:
+        return
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
+    source = None
+
+
+def _sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event['order'])}\n\n"
+
+
+async def stream(scope: str, key: str, queue: asyncio.Queue, snapshot: Optional[dict] = None):
+    """Server-Sent Events from a queue returned by subscribe(), starting with snapshot if given.
+
+    Subscribe before loading the snapshot, so no change made in between is
+    lost. Changes queued meanwhile that the snapshot already includes are
+    skipped. The subscription ends with the stream.
+    """
+    try:
+        if snapshot is not None:
+            yield _sse({"type": "order.snapshot", "order": snapshot})
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), ORDER_EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if snapshot is not None and (event["order"]["updated_at"] or "") <= (snapshot["updated_at"] or ""):
+                continue
+            yield _sse(event)
+    finally:
+        unsubscribe(scope, key, queue)
+
+
+def get_event_stats() -> dict:
+    return {
+        "mode": ORDER_EVENTS_MODE,
+        "source": source,
+        "subscriptions": len(_subscribers),
+        **stats,
+    }
@@ -0,0 +1,100 @@
+import os
+import httpx
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30.0"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "5.0"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "5.0"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+
+# httpx asks for gzip, deflate and br by default. Inside the cluster compressing a response costs more
+# than it saves (benchmarks/README.md), so the services answer each other uncompressed.
+INTERNAL_HEADERS = {"Accept-Encoding": "identity"}
+
+client: httpx.AsyncClient = None
+
+# Counters for sizing the pool; updated from the client's event hooks
+stats = {
+    "requests_sent": 0,
+    "responses_received": 0,
+}
+
+
+async def _on_request(request: httpx.Request):
+    stats["requests_sent"] += 1
+
+
+async def _on_response(response: httpx.Response):
+    stats["responses_received"] += 1
+
+
+def _connection_pool():
+    """Return the underlying httpcore pool, if the transport exposes one"""
+    transport = getattr(client, "_transport", None)
+    return getattr(transport, "_pool", None)
+
+
+async def start_http_client():
+    """Create the app-lifetime client shared by every outbound call"""
+    global client
+    if client is not None:
+        return
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(HTTP_TIMEOUT, pool=HTTP_POOL_TIMEOUT)
+    try:
+        client = httpx.AsyncClient(limits=limits, timeout=timeout, http2=HTTP2_ENABLED, headers=INTERNAL_HEADERS)
+    except ImportError:
+        # http2 requires the optional "h2" package; fall back to HTTP/1.1 keep-alive
+        print("HTTP/2 requested but h2 is not installed, using HTTP/1.1")
+        client = httpx.AsyncClient(limits=limits, timeout=timeout, headers=INTERNAL_HEADERS)
+    client.event_hooks = {"request": [_on_request], "response": [_on_response]}
+    print(f"HTTP client started (max_connections={HTTP_MAX_CONNECTIONS}, "
+          f"max_keepalive={HTTP_MAX_KEEPALIVE_CONNECTIONS})")
+
+
+async def close_http_client():
+    global client
+    if client:
+        await client.aclose()
+        client = None
+        print("HTTP client closed")
+
+
+def get_http_client() -> httpx.AsyncClient:
+    return client
+
+
+def get_pool_stats() -> dict:
+    """Snapshot of pool configuration, live connections and request counters"""
+    result = {
+        "limits": {
+            "max_connections": HTTP_MAX_CONNECTIONS,
+            "max_keepalive_connections": HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            "keepalive_expiry": HTTP_KEEPALIVE_EXPIRY,
+        },
+        "http2": HTTP2_ENABLED,
+        "connections": {"total": 0, "idle": 0, "active": 0, "by_origin": {}},
+        "pending_requests": 0,
+        **stats,
+    }
+    pool = _connection_pool()
+    if pool is None:
+        return result
+    connections = list(getattr(pool, "connections", []))
+    by_origin = {}
+    for conn in connections:
+        origin = str(getattr(conn, "_origin", "unknown"))
+        by_origin[origin] = by_origin.get(origin, 0) + 1
+        if conn.is_idle():
+            result["connections"]["idle"] += 1
+        else:
+            result["connections"]["active"] += 1
+    result["connections"]["total"] = len(connections)
+    result["connections"]["by_origin"] = by_origin
+    result["pending_requests"] = len(getattr(pool, "_requests", []))
+    return result
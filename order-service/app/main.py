@@ -1,18 +1,41 @@
-from fastapi import FastAPI
-from app.database import connect_to_mongo, close_mongo_connection
+from typing import Optional
+from fastapi import FastAPI, Response
+from service_common.middleware import HTTPCacheMiddleware
+from service_common.metrics import (
+    MetricsMiddleware, CONTENT_TYPE, render_metrics, get_mongo_pool_stats, mark_process_exited,
+)
+from service_common.tracing import TracingMiddleware, recent_spans
+from app.database import connect_to_mongo, close_mongo_connection, get_database
+from app.http_client import start_http_client, close_http_client, get_pool_stats
+from app.cache import get_cache_stats, invalidate_restaurant
+from app.resilience import get_resilience_stats
+from app.events import start_order_events, stop_order_events, get_event_stats
+from app.cache_sync import start_cache_sync, stop_cache_sync, get_cache_sync_stats, publish
+from app.schemas import CacheInvalidation
 from app.routers import orders
 
 app = FastAPI(title="Order Service", version="1.0.0")
+app.add_middleware(HTTPCacheMiddleware)
+# Each middleware wraps those added before it: metrics include compression time, the server span covers both
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware, service="order-service")
 
 
 @app.on_event("startup")
 async def startup():
     await connect_to_mongo()
+    await start_http_client()
+    await start_order_events(get_database())
+    await start_cache_sync(get_database())
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    await stop_order_events()
+    await stop_cache_sync()
+    await close_http_client()
     await close_mongo_connection()
+    mark_process_exited()
 
 
 app.include_router(orders.router)
@@ -21,3 +44,62 @@ app.include_router(orders.router)
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "order-service"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Request, MongoDB and outbound call timings in the Prometheus text format"""
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
+
+@app.get("/traces", include_in_schema=False)
+async def traces(trace_id: Optional[str] = None):
+    """Recent spans from the in-memory trace exporter, optionally only those of one trace"""
+    return recent_spans(trace_id)
+
+
+@app.get("/stats/mongo-pool")
+async def mongo_pool_stats():
+    """MongoDB connection pool size, usage and waiters per server (for sizing MONGO_MAX_POOL_SIZE)"""
+    return get_mongo_pool_stats()
+
+
+@app.get("/stats/http-client")
+async def http_client_stats():
+    """Outbound connection pool statistics (for sizing HTTP_MAX_* settings)"""
+    return get_pool_stats()
+
+
+@app.get("/stats/cache")
+async def cache_stats():
+    """Hit/miss/eviction counters of the cross-service lookup caches"""
+    return get_cache_stats()
+
+
+@app.get("/stats/resilience")
+async def resilience_stats():
+    """Circuit breaker state, retries, hedges and latency percentiles per downstream service"""
+    return get_resilience_stats()
+
+
+@app.get("/stats/events")
+async def event_stats():
+    """Order event feed source, subscriptions and delivery counters"""
+    return get_event_stats()
+
+
+@app.get("/stats/cache-sync")
+async def cache_sync_stats():
+    """Cache invalidations shared with and applied from the other workers"""
+    return get_cache_sync_stats()
+
+
+@app.post("/cache/invalidate")
+async def invalidate_cache(event: CacheInvalidation):
+    """Called by restaurant service when a restaurant or its menu changes.
+
+    Reaches one worker; it is passed on to the others through cache_sync.
+    """
+    dropped = invalidate_restaurant(event.restaurant_id, event.item_ids, event.menu_version)
+    await publish(get_database(), event.restaurant_id, event.item_ids, event.menu_version)
+    return {"invalidated": dropped}
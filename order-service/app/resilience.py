@@ -0,0 +1,288 @@
+import os
+import time
+import random
+import asyncio
+import contextvars
+from collections import deque
+import httpx
+from app.http_client import get_http_client
+from service_common.metrics import observe_upstream
+from service_common import tracing
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv("BREAKER_RECOVERY_TIMEOUT", "10.0"))
+BREAKER_HALF_OPEN_MAX_CALLS = int(os.getenv("BREAKER_HALF_OPEN_MAX_CALLS", "1"))
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "2"))  # retries on top of the first try
+RETRY_BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", "0.05"))
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "1.0"))
+# Each request earns this fraction of a retry; caps retries at ~20% extra load while a target is failing
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MAX = float(os.getenv("RETRY_BUDGET_MAX", "10"))
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", "200"))
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+# Event-loop time by which the caller stops waiting for the current lookup; set by within()
+_deadline = contextvars.ContextVar("upstream_deadline", default=None)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the target while its circuit breaker is open"""
+
+    def __init__(self, target: str):
+        super().__init__(f"Circuit open for {target} service")
+        self.target = target
+
+
+# What the fetch_* helpers treat as "dependency unavailable"; ValueError covers malformed JSON bodies
+UPSTREAM_ERRORS = (httpx.HTTPError, CircuitOpenError, ValueError)
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: open after a threshold, probe again after a cool-down"""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 recovery_timeout: float = BREAKER_RECOVERY_TIMEOUT,
+                 half_open_max_calls: int = BREAKER_HALF_OPEN_MAX_CALLS):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self.half_open_calls = 0
+        if self.state == HALF_OPEN:
+            if self.half_open_calls >= self.half_open_max_calls:
+                self.rejected += 1
+                return False
+            self.half_open_calls += 1
+        return True
+
+    def record_success(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.times_opened += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+
+class TargetStats:
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.retry_tokens = RETRY_BUDGET_MAX
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.retries_denied = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def percentile(self, p: float):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * p / 100))
+        return ordered[index]
+
+    def earn_retry_credit(self):
+        self.retry_tokens = min(RETRY_BUDGET_MAX, self.retry_tokens + RETRY_BUDGET_RATIO)
+
+    def take_retry_credit(self) -> bool:
+        if self.retry_tokens >= 1:
+            self.retry_tokens -= 1
+            return True
+        self.retries_denied += 1
+        return False
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "times_opened": self.breaker.times_opened,
+            "rejected": self.breaker.rejected,
+            "requests": self.requests,
+            "failures": self.failures,
+            "retries": self.retries,
+            "retries_denied": self.retries_denied,
+            "retry_tokens": round(self.retry_tokens, 2),
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "latency_p50": self.percentile(50),
+            "latency_p95": self.percentile(95),
+            "latency_p99": self.percentile(99),
+        }
+
+
+_targets = {}
+
+
+def get_target_stats(target: str) -> TargetStats:
+    if target not in _targets:
+        _targets[target] = TargetStats()
+    return _targets[target]
+
+
+def reset():
+    """Forget all breaker state and counters"""
+    _targets.clear()
+
+
+def get_resilience_stats() -> dict:
+    return {target: stats.snapshot() for target, stats in _targets.items()}
+
+
+async def within(seconds: float, awaitable):
+    """Await a lookup for at most seconds, raising asyncio.TimeoutError after that.
+
+    Unlike a bare asyncio.wait_for, request() knows about the budget: an
+    attempt cut off by it counts as a failure of the target, so a slow
+    dependency still opens its breaker and shows up in its latency percentiles.
+    """
+    loop = asyncio.get_running_loop()
+    token = _deadline.set(loop.time() + seconds)
+    try:
+        return await asyncio.wait_for(awaitable, seconds)
+    finally:
+        _deadline.reset(token)
+
+
+def _deadline_passed() -> bool:
+    deadline = _deadline.get()
+    # A millisecond of slack for the timer firing just before the deadline it was set for
+    return deadline is not None and asyncio.get_running_loop().time() >= deadline - 0.001
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: uniform in [0, min(max, base * 2^attempt)]
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * (2 ** attempt)))
+
+
+async def _timed_send(stats: TargetStats, method: str, url: str, kwargs: dict) -> httpx.Response:
+    started = time.monotonic()
+    response = await get_http_client().request(method, url, **kwargs)
+    stats.latencies.append(time.monotonic() - started)
+    return response
+
+
+async def _send(stats: TargetStats, method: str, url: str, kwargs: dict, hedge: bool) -> httpx.Response:
+    """Send once; if hedging, fire a second copy when the first is slower than the target's percentile"""
+    delay = stats.percentile(HEDGE_PERCENTILE) if hedge and len(stats.latencies) >= HEDGE_MIN_SAMPLES else None
+    primary = asyncio.ensure_future(_timed_send(stats, method, url, kwargs))
+    pending = {primary}
+    try:
+        if delay is None:
+            return await primary
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if not done:
+            stats.hedges += 1
+            pending.add(asyncio.ensure_future(_timed_send(stats, method, url, kwargs)))
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary:
+                        stats.hedge_wins += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def request(target: str, method: str, url: str, idempotent: bool = None, hedge: bool = None,
+                  **kwargs) -> httpx.Response:
+    """Send a request to another service through its breaker, retry budget and optional hedging.
+
+    Connection errors, timeouts and 5xx responses count as failures and are
+    retried (idempotent requests only) with jittered exponential backoff
+    while the target's retry budget allows. 4xx responses are returned as-is.
+    Raises CircuitOpenError without sending anything while the breaker is open.
+    """
+    method = method.upper()
+    if idempotent is None:
+        idempotent = method in IDEMPOTENT_METHODS
+    if hedge is None:
+        hedge = HEDGE_ENABLED
+    stats = get_target_stats(target)
+    stats.earn_retry_credit()
+
+    attempt = 0
+    while True:
+        if not stats.breaker.allow():
+            raise CircuitOpenError(target)
+        stats.requests += 1
+        started = time.perf_counter()
+        # One client span per attempt; the traceparent makes the target's server span its child
+        with tracing.span(f"{method} {target}", kind="client", **{"http.url": url, "attempt": attempt}) as span:
+            try:
+                headers = tracing.inject(kwargs.get("headers"))
+                response = await _send(stats, method, url, {**kwargs, "headers": headers}, hedge and idempotent)
+            except asyncio.CancelledError:
+                if _deadline_passed():
+                    # Cut off by the caller's time budget (see within()): the target was too slow
+                    elapsed = time.perf_counter() - started
+                    stats.latencies.append(elapsed)
+                    stats.failures += 1
+                    stats.breaker.record_failure()
+                    observe_upstream(target, elapsed, "timeout")
+                elif stats.breaker.state == HALF_OPEN:
+                    # Abandoned for another reason (e.g. the client went away); free a half-open probe slot
+                    stats.breaker.half_open_calls = max(0, stats.breaker.half_open_calls - 1)
+                raise
+            except httpx.TransportError as e:
+                response, error = None, e
+                span.fail(e)
+            else:
+                error = None
+                span.set_attribute("http.status_code", response.status_code)
+                if response.status_code >= 500:
+                    span.fail(f"HTTP {response.status_code}")
+        observe_upstream(target, time.perf_counter() - started,
+                         "error" if error is not None else f"{response.status_code // 100}xx")
+
+        if error is None and response.status_code < 500:
+            stats.breaker.record_success()
+            return response
+
+        stats.failures += 1
+        stats.breaker.record_failure()
+        can_retry = (
+            idempotent
+            and attempt < RETRY_MAX_ATTEMPTS
+            and stats.breaker.state != OPEN
+            and stats.take_retry_credit()
+        )
+        if not can_retry:
+            if error is not None:
+                raise error
+            return response
+        stats.retries += 1
+        await asyncio.sleep(_backoff(attempt))
+        attempt += 1
@@ -1,41 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.database import get_database
+from service_common.metrics import TimedRoute
 from app.schemas import OrderCreate, OrderResponse, OrderStatusUpdate, ShipperAssign
-from app import crud
-import httpx
+from app import crud, events
+from datetime import datetime
+from typing import List, Optional
 import os
 
-router = APIRouter(prefix="/orders", tags=["orders"])
+router = APIRouter(prefix="/orders", tags=["orders"], route_class=TimedRoute)
+
+# Server-Sent Events; no-transform and X-Accel-Buffering stop proxies from buffering the stream
+SSE_HEADERS = {"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"}
+
+DEFAULT_PAGE_SIZE = int(os.getenv("ORDERS_DEFAULT_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("ORDERS_MAX_PAGE_SIZE", "200"))
 
 
 @router.post("", response_model=OrderResponse, status_code=201)
 async def create_order(order: OrderCreate, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Create a new order (US 2 - Add to cart)
 
-    Validate that referenced user and restaurant exist by calling their services.
+    Validate that referenced user and restaurant exist by calling their services
+    (concurrently, with recently validated ids served from a short-lived cache).
     """
-    user_service_url = os.getenv("USER_SERVICE_URL", "http://user-service:8000")
-    restaurant_service_url = os.getenv("RESTAURANT_SERVICE_URL", "http://restaurant-service:8000")
-
-    async with httpx.AsyncClient() as client:
-        # Validate user
-        try:
-            uresp = await client.get(f"{user_service_url}/users/{order.user_id}", timeout=5.0)
-        except httpx.RequestError:
-            raise HTTPException(status_code=502, detail="Cannot reach user service")
-        if uresp.status_code == 404:
-            raise HTTPException(status_code=400, detail="User not found")
-
-        # Validate restaurant
-        try:
-            rresp = await client.get(f"{restaurant_service_url}/restaurants/{order.restaurant_id}", timeout=5.0)
-        except httpx.RequestError:
-            raise HTTPException(status_code=502, detail="Cannot reach restaurant service")
-        if rresp.status_code == 404:
-            raise HTTPException(status_code=400, detail="Restaurant not found")
-
-    result = await crud.create_order(db, order)
+    try:
+        result = await crud.create_order(db, order)
+    except crud.ReferenceNotFound as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except crud.ServiceUnavailable as e:
+        raise HTTPException(status_code=502, detail=str(e))
     return result
 
 
@@ -48,10 +43,34 @@ async def get_order(order_id: str, db: AsyncIOMotorDatabase = Depends(get_databa
     return order
 
 
+@router.get("/{order_id}/events")
+async def order_events(order_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Stream changes to one order as Server-Sent Events, starting with its current state"""
+    # Subscribed first, so a change made while the snapshot loads is still delivered
+    queue = events.subscribe("order", order_id)
+    try:
+        snapshot = await events.load_snapshot(db, order_id)
+    except BaseException:
+        events.unsubscribe("order", order_id, queue)
+        raise
+    if not snapshot:
+        events.unsubscribe("order", order_id, queue)
+        raise HTTPException(status_code=404, detail="Order not found")
+    return StreamingResponse(
+        events.stream("order", order_id, queue, snapshot), media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+
 @router.put("/{order_id}/status", response_model=OrderResponse)
 async def update_order_status(order_id: str, update: OrderStatusUpdate, db: AsyncIOMotorDatabase = Depends(get_database)):
-    """Update order status (US 3 - Place order, US 6 - Confirm order)"""
-    result = await crud.update_order_status(db, order_id, update.status)
+    """Update order status (US 3 - Place order, US 6 - Confirm order)
+
+    Only the next status in the order lifecycle is accepted; anything else is 409.
+    """
+    try:
+        result = await crud.update_order_status(db, order_id, update.status)
+    except crud.InvalidTransition as e:
+        raise HTTPException(status_code=409, detail=str(e))
     if not result:
         raise HTTPException(status_code=404, detail="Order not found")
     return result
@@ -59,22 +78,117 @@ async def update_order_status(order_id: str, update: OrderStatusUpdate, db: Asyn
 
 @router.put("/{order_id}/shipper", response_model=OrderResponse)
 async def assign_shipper(order_id: str, assign: ShipperAssign, db: AsyncIOMotorDatabase = Depends(get_database)):
-    """Assign shipper to order (US 7 - Shipper accept order)"""
-    result = await crud.assign_shipper(db, order_id, assign.shipper_id)
+    """Assign shipper to order (US 7 - Shipper accept order)
+
+    The shipper is claimed atomically, so it cannot be given to two orders at once.
+    """
+    try:
+        result = await crud.assign_shipper(db, order_id, assign.shipper_id)
+    except (crud.ShipperUnavailable, crud.InvalidTransition) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except crud.ReferenceNotFound as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except crud.ServiceUnavailable as e:
+        raise HTTPException(status_code=502, detail=str(e))
     if not result:
         raise HTTPException(status_code=404, detail="Order not found")
     return result
 
 
-@router.get("/users/{user_id}/orders")
-async def get_user_orders(user_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
-    """Get all orders for a user (US 4 - Track orders)"""
-    orders = await crud.get_user_orders(db, user_id)
+@router.post("/{order_id}/dispatch", response_model=OrderResponse)
+async def dispatch_order(order_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Assign the next available shipper to the order in one round trip to shipper service"""
+    try:
+        result = await crud.dispatch_order(db, order_id)
+    except (crud.ShipperUnavailable, crud.InvalidTransition) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except crud.ServiceUnavailable as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    if not result:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return result
+
+
+@router.get("/users/{user_id}/orders", response_model=list[OrderResponse])
+async def get_user_orders(
+    user_id: str,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[List[str]] = Query(None),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    """Get a page of orders for a user, newest first (US 4 - Track orders)
+
+    Pass the X-Next-Cursor response header back as `cursor` to get the next page.
+    """
+    try:
+        orders, next_cursor = await crud.get_user_orders(
+            db, user_id, limit, cursor, status, created_from, created_to
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return orders
 
 
-@router.get("/restaurants/{restaurant_id}/orders")
-async def get_restaurant_orders(restaurant_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
-    """Get all orders for a restaurant (US 6 - Manage orders)"""
-    orders = await crud.get_restaurant_orders(db, restaurant_id)
+@router.get("/users/{user_id}/events")
+async def user_order_events(user_id: str):
+    """Stream changes to any of a user's orders as Server-Sent Events"""
+    queue = events.subscribe("user", user_id)
+    return StreamingResponse(
+        events.stream("user", user_id, queue), media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+
+@router.get("/restaurants/{restaurant_id}/orders", response_model=list[OrderResponse])
+async def get_restaurant_orders(
+    restaurant_id: str,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[List[str]] = Query(None),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    """Get a page of orders for a restaurant, newest first (US 6 - Manage orders)
+
+    Pass the X-Next-Cursor response header back as `cursor` to get the next page.
+    """
+    try:
+        orders, next_cursor = await crud.get_restaurant_orders(
+            db, restaurant_id, limit, cursor, status, created_from, created_to
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return orders
+
+
+@router.get("/restaurants/{restaurant_id}/events")
+async def restaurant_order_events(restaurant_id: str):
+    """Stream new orders and order changes of a restaurant as Server-Sent Events (dashboard feed)"""
+    queue = events.subscribe("restaurant", restaurant_id)
+    return StreamingResponse(
+        events.stream("restaurant", restaurant_id, queue), media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+
+@router.get("/restaurants/{restaurant_id}/orders/export")
+async def export_restaurant_orders(
+    restaurant_id: str,
+    status: Optional[List[str]] = Query(None),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    """Stream a restaurant's full order history as NDJSON (one order per line, oldest first)"""
+    return StreamingResponse(
+        crud.export_restaurant_orders(db, restaurant_id, status, created_from, created_to),
+        media_type="application/x-ndjson",
+    )
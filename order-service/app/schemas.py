@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 from datetime import datetime
 
 
@@ -13,6 +13,7 @@ class OrderItemDetail(BaseModel):
     item_name: str
     price: float
     quantity: int
+    line_total: Optional[float] = None
 
 
 class OrderCreate(BaseModel):
@@ -22,7 +23,7 @@ class OrderCreate(BaseModel):
 
 
 class OrderStatusUpdate(BaseModel):
-    status: str  # cart, confirmed, preparing, ready, shipped, delivered
+    status: Literal["cart", "confirmed", "preparing", "ready", "shipped", "delivered"]
 
 
 class ShipperAssign(BaseModel):
@@ -36,10 +37,18 @@ class OrderResponse(BaseModel):
     restaurant_id: str
     restaurant_name: Optional[str] = None
     items: List[OrderItemDetail]
+    total: Optional[float] = None
     status: str
     shipper_id: Optional[str] = None
     shipper_name: Optional[str] = None
     created_at: Optional[str] = None
+    status_timestamps: Optional[Dict[str, str]] = None  # status -> when the order entered it
 
     class Config:
         populate_by_name = True
+
+
+class CacheInvalidation(BaseModel):
+    restaurant_id: str
+    item_ids: Optional[List[str]] = None  # None drops every cached item of the restaurant
+    menu_version: Optional[int] = None  # increases by one per menu change
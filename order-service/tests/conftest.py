@@ -0,0 +1,30 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import cache, http_client, resilience  # noqa: E402
+from fake_service import FakeService  # noqa: E402
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    """A healthy fake service wired in as the outbound client, with fresh breaker state and caches"""
+    monkeypatch.setattr(resilience, "RETRY_BACKOFF_BASE", 0.0)
+    monkeypatch.setattr(resilience, "HEDGE_ENABLED", False)
+    resilience.reset()
+    for existing in cache.ALL_CACHES:
+        existing.clear()
+    service = FakeService()
+    service.use()
+    yield service
+    http_client.client = None
+    resilience.reset()
+
+
+@pytest.fixture
+def db():
+    """An in-memory order database"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return mongomock_motor.AsyncMongoMockClient()["order_db"]
@@ -0,0 +1,57 @@
+"""A scriptable stand-in for another service, served through httpx.MockTransport.
+
+    fake = FakeService()
+    fake.fail(503)        # answer every request with 503
+    fake.slow(1.0)        # answer after a delay
+    fake.disconnect()     # raise a connection error
+    fake.recover()        # answer 200 with fake.body again
+    fake.respond("/users/u1", {"username": "ann"})   # a fixed answer for one path
+
+Install it as the app's outbound client with use(), so resilience.request()
+and everything built on it talks to the fake instead of the network.
+"""
+import asyncio
+import httpx
+from app import http_client
+
+
+class FakeService:
+    def __init__(self, body=None):
+        self.body = body if body is not None else {}
+        self.status = 200
+        self.delay = 0.0
+        self.connect_error = False
+        self.calls = 0
+        self.requests = []  # (method, path) of every request received
+        self.responses = {}  # path -> (status, body), answered instead of body when healthy
+
+    def fail(self, status: int = 503):
+        self.status, self.delay, self.connect_error = status, 0.0, False
+
+    def slow(self, delay: float):
+        self.status, self.delay, self.connect_error = 200, delay, False
+
+    def disconnect(self):
+        self.connect_error = True
+
+    def respond(self, path: str, body, status: int = 200):
+        self.responses[path] = (status, body)
+
+    def recover(self):
+        self.status, self.delay, self.connect_error = 200, 0.0, False
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        self.requests.append((request.method, request.url.path))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.connect_error:
+            raise httpx.ConnectError("connection refused", request=request)
+        if self.status >= 400:
+            return httpx.Response(self.status, json={"detail": "fake failure"})
+        status, body = self.responses.get(request.url.path, (200, self.body))
+        return httpx.Response(status, json=body)
+
+    def use(self):
+        """Route every outbound call of the app through this fake"""
+        http_client.client = httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
@@ -0,0 +1,59 @@
+"""The backfill fills in only what is unknown and never writes placeholders"""
+import asyncio
+from app import backfill
+from app.backfill import FAILED, snapshot_update
+
+LEGACY = {"_id": 1, "user_id": "u1", "restaurant_id": "r1", "items": [{"menu_item_id": "m1", "quantity": 2}]}
+
+SNAPSHOTTED = {
+    "_id": 2, "user_id": "u1", "restaurant_id": "r1", "user_name": "ann", "restaurant_name": "Unknown",
+    "shipper_name": None, "total": 20.0,
+    "items": [
+        {"menu_item_id": "m1", "item_name": "Margherita", "price": 10.0, "quantity": 2, "line_total": 20.0},
+        {"menu_item_id": "m2", "item_name": "Unknown", "price": 0, "quantity": 1, "line_total": 0},
+    ],
+}
+
+MENU_NOW = {("r1", "m1"): {"name": "Margherita", "price": 99.0}, ("r1", "m2"): {"name": "Calzone", "price": 8.0}}
+
+
+def _found(users=None, restaurants=None, menu=None, shippers=None):
+    return {"users": {"u1": "ann"} if users is None else users,
+            "restaurants": {"r1": "Pizza Palace"} if restaurants is None else restaurants,
+            "menu": MENU_NOW if menu is None else menu,
+            "shippers": {} if shippers is None else shippers}
+
+
+def test_legacy_order_gets_a_full_snapshot():
+    update = snapshot_update(LEGACY, _found())
+    assert update["items"][0]["price"] == 99.0
+    assert update["total"] == 198.0
+    assert (update["user_name"], update["restaurant_name"]) == ("ann", "Pizza Palace")
+
+
+def test_legacy_order_is_skipped_when_a_lookup_failed():
+    assert snapshot_update(LEGACY, _found(menu=FAILED)) is None
+    assert snapshot_update(LEGACY, _found(users=FAILED)) is None
+    assert snapshot_update(LEGACY, _found(restaurants={"r1": FAILED})) is None
+
+
+def test_legacy_order_is_skipped_when_an_item_no_longer_exists():
+    assert snapshot_update(LEGACY, _found(menu={})) is None
+
+
+def test_snapshotted_order_keeps_its_recorded_prices():
+    update = snapshot_update(SNAPSHOTTED, _found())
+    assert update["restaurant_name"] == "Pizza Palace"
+    assert "user_name" not in update
+    assert update["items"][0] == SNAPSHOTTED["items"][0]
+    assert update["items"][1]["price"] == 8.0
+    assert update["total"] == 28.0
+
+
+def test_snapshotted_order_is_left_alone_while_lookups_fail():
+    assert snapshot_update(SNAPSHOTTED, _found(restaurants={"r1": FAILED}, menu=FAILED)) is None
+
+
+def test_dry_run_counts_failed_lookups_as_skipped(fake):
+    fake.fail(503)
+    assert asyncio.run(backfill._flush(None, [LEGACY, SNAPSHOTTED], dry_run=True)) == (0, 2)
@@ -0,0 +1,77 @@
+"""Invalidations recorded by one worker reach the caches of the others"""
+import asyncio
+import pytest
+from app import cache, cache_sync
+
+
+@pytest.fixture
+def sync(fake, monkeypatch):
+    monkeypatch.setattr(cache_sync, "CACHE_SYNC_INTERVAL", 0.01)
+    for name in cache_sync.stats:
+        monkeypatch.setitem(cache_sync.stats, name, 0)
+    cache.menu_versions.clear()
+    yield
+    cache.menu_versions.clear()
+
+
+async def _cache_menu_item(restaurant_id: str, item_id: str):
+    async def load(key):
+        return {"name": "Margherita", "price": 12.5}
+    await cache.menu_items.get_or_load((restaurant_id, item_id), load)
+
+
+def _cached(restaurant_id: str, item_id: str) -> bool:
+    return cache.menu_items._lookup((restaurant_id, item_id)) is not None
+
+
+def test_invalidation_from_another_worker_is_applied(sync, db, monkeypatch):
+    async def scenario():
+        await _cache_menu_item("r1", "m1")
+        await _cache_menu_item("r2", "m9")
+        await cache_sync.start_cache_sync(db)
+        try:
+            await asyncio.sleep(0.03)
+            # Recorded by another worker, whose ORIGIN differs
+            monkeypatch.setattr(cache_sync, "ORIGIN", "other-worker")
+            await cache_sync.publish(db, "r1", ["m1"], 1)
+            monkeypatch.undo()
+            await asyncio.sleep(0.05)
+        finally:
+            await cache_sync.stop_cache_sync()
+
+    asyncio.run(scenario())
+    assert not _cached("r1", "m1")
+    assert _cached("r2", "m9")
+    assert cache.menu_versions["r1"] == 1
+    assert cache_sync.stats["applied"] == 1
+
+
+def test_own_invalidations_are_not_applied_twice(sync, db):
+    async def scenario():
+        await cache_sync.start_cache_sync(db)
+        try:
+            await asyncio.sleep(0.03)
+            await cache_sync.publish(db, "r1", None, 3)
+            await asyncio.sleep(0.05)
+        finally:
+            await cache_sync.stop_cache_sync()
+
+    asyncio.run(scenario())
+    assert cache_sync.stats == {"published": 1, "publish_errors": 0, "applied": 0, "poll_errors": 0}
+
+
+def test_each_invalidation_is_applied_once_across_overlapping_polls(sync, db):
+    async def scenario():
+        await cache_sync.start_cache_sync(db)
+        try:
+            await asyncio.sleep(0.03)
+            await db[cache_sync.COLLECTION].insert_one({
+                "restaurant_id": "r1", "item_ids": None, "menu_version": None,
+                "origin": "other-worker", "at": cache_sync._now(),
+            })
+            await asyncio.sleep(0.1)
+        finally:
+            await cache_sync.stop_cache_sync()
+
+    asyncio.run(scenario())
+    assert cache_sync.stats["applied"] == 1
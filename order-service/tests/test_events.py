@@ -0,0 +1,77 @@
+"""The order stream misses no change made while its snapshot loads"""
+import json
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app import events
+from app.routers import orders
+
+
+def _update(order_id: str, status: str, updated_at: str) -> dict:
+    return {"type": "order.updated", "order": {
+        "id": order_id, "user_id": "u1", "restaurant_id": "r1", "status": status, "updated_at": updated_at,
+    }}
+
+
+async def _events(response, count: int) -> list:
+    received = []
+    body = response.body_iterator
+    try:
+        while len(received) < count:
+            chunk = await asyncio.wait_for(body.__anext__(), 1)
+            if chunk.startswith("event:"):
+                name, data = chunk.strip().split("\n")
+                received.append((name[len("event: "):], json.loads(data[len("data: "):])["status"]))
+    finally:
+        await body.aclose()
+    return received
+
+
+def test_change_during_snapshot_load_is_streamed(db, monkeypatch):
+    load_snapshot = events.load_snapshot
+
+    async def scenario():
+        inserted = await db["orders"].insert_one({
+            "user_id": "u1", "restaurant_id": "r1", "status": "confirmed", "updated_at": "2026-01-01T10:00:00",
+        })
+        order_id = str(inserted.inserted_id)
+
+        async def racing_load(db, order_id):
+            snapshot = await load_snapshot(db, order_id)
+            # Published after the snapshot was read, before the stream starts
+            events.publish(_update(order_id, "preparing", "2026-01-01T10:00:05"))
+            return snapshot
+
+        monkeypatch.setattr(events, "load_snapshot", racing_load)
+        response = await orders.order_events(order_id, db)
+        return await _events(response, 2)
+
+    assert asyncio.run(scenario()) == [("order.snapshot", "confirmed"), ("order.updated", "preparing")]
+    assert events._subscribers == {}
+
+
+def test_changes_the_snapshot_already_shows_are_skipped(db):
+    async def scenario():
+        inserted = await db["orders"].insert_one({
+            "user_id": "u1", "restaurant_id": "r1", "status": "preparing", "updated_at": "2026-01-01T10:00:05",
+        })
+        order_id = str(inserted.inserted_id)
+        queue = events.subscribe("order", order_id)
+        # Queued before the snapshot was read, so the snapshot already includes it
+        events.publish(_update(order_id, "confirmed", "2026-01-01T10:00:00"))
+        events.publish(_update(order_id, "ready", "2026-01-01T10:00:09"))
+        snapshot = await events.load_snapshot(db, order_id)
+        stream = events.stream("order", order_id, queue, snapshot)
+
+        class Response:
+            body_iterator = stream
+        return await _events(Response, 2)
+
+    assert asyncio.run(scenario()) == [("order.snapshot", "preparing"), ("order.updated", "ready")]
+
+
+def test_unknown_order_leaves_no_subscription(db):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(orders.order_events("0" * 24, db))
+    assert error.value.status_code == 404
+    assert events._subscribers == {}
@@ -0,0 +1,29 @@
+"""Calls to other services ask for uncompressed responses"""
+import asyncio
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from service_common.middleware import HTTPCacheMiddleware
+from app import http_client
+
+
+async def document(request):
+    return JSONResponse({"name": "x" * 2000})
+
+
+APP = HTTPCacheMiddleware(Starlette(routes=[Route("/document", document)]))
+
+
+def test_service_to_service_responses_are_not_compressed():
+    async def client_headers():
+        await http_client.start_http_client()
+        try:
+            return dict(http_client.client.headers)
+        finally:
+            await http_client.close_http_client()
+
+    accept_encoding = asyncio.run(client_headers())["accept-encoding"]
+    response = TestClient(APP).get("/document", headers={"accept-encoding": accept_encoding})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"].startswith('W/"')
@@ -0,0 +1,50 @@
+"""Order creation snapshots validated prices and never stores placeholders"""
+import asyncio
+import pytest
+from app import crud
+from app.schemas import OrderCreate
+
+MENU_BATCH = "/restaurants/menu-items/batch"
+
+
+@pytest.fixture
+def catalog(fake):
+    fake.respond("/users/u1", {"id": "u1", "username": "ann"})
+    fake.respond("/restaurants/r1", {"id": "r1", "name": "Pizza Palace", "location": None})
+    fake.respond(MENU_BATCH, [{"restaurant_id": "r1", "id": "m1", "name": "Margherita", "price": 12.5}])
+    return fake
+
+
+def _order(*item_ids) -> OrderCreate:
+    return OrderCreate(user_id="u1", restaurant_id="r1",
+                       items=[{"menu_item_id": item_id, "quantity": 2} for item_id in item_ids])
+
+
+def test_create_order_snapshots_prices(catalog, db):
+    order = asyncio.run(crud.create_order(db, _order("m1")))
+    assert order["items"][0]["item_name"] == "Margherita"
+    assert order["items"][0]["line_total"] == 25.0
+    assert order["total"] == 25.0
+    assert order["user_name"] == "ann"
+
+
+def test_create_order_is_rejected_when_menu_lookup_fails(catalog, db):
+    catalog.respond(MENU_BATCH, {"detail": "down"}, status=503)
+    with pytest.raises(crud.ServiceUnavailable):
+        asyncio.run(crud.create_order(db, _order("m1")))
+    assert asyncio.run(db["orders"].count_documents({})) == 0
+
+
+def test_create_order_is_rejected_for_unknown_menu_items(catalog, db):
+    with pytest.raises(crud.ReferenceNotFound, match="m2"):
+        asyncio.run(crud.create_order(db, _order("m1", "m2")))
+    assert asyncio.run(db["orders"].count_documents({})) == 0
+
+
+def test_large_menu_lookups_are_split_into_accepted_batches(fake):
+    keys = [("r1", f"m{i}") for i in range(2500)]
+    fake.respond(MENU_BATCH, [{"restaurant_id": "r1", "id": "m1", "name": "Margherita", "price": 12.5}])
+
+    found = asyncio.run(crud._load_menu_items(keys))
+    assert fake.requests == [("POST", MENU_BATCH)] * 3
+    assert found == {("r1", "m1"): {"name": "Margherita", "price": 12.5}}
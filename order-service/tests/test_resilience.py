@@ -0,0 +1,187 @@
+"""Breaker states, retry budget and dependency budgets, driven by a fake service"""
+import time
+import asyncio
+import pytest
+from app import crud, resilience
+from app.resilience import CLOSED, OPEN, HALF_OPEN, CircuitBreaker, CircuitOpenError
+
+URL = "http://fake-service/things/1"
+
+
+def _breaker(target: str = "fake", **settings) -> CircuitBreaker:
+    breaker = resilience.get_target_stats(target).breaker = CircuitBreaker(**settings)
+    return breaker
+
+
+def _call(target: str = "fake"):
+    return resilience.request(target, "GET", URL)
+
+
+def test_failures_open_the_breaker_and_it_then_fails_fast(fake, monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_MAX_ATTEMPTS", 0)
+    breaker = _breaker(failure_threshold=3, recovery_timeout=60)
+    fake.fail(503)
+
+    async def scenario():
+        for _ in range(3):
+            assert (await _call()).status_code == 503
+        assert breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            await _call()
+
+    asyncio.run(scenario())
+    assert fake.calls == 3
+    assert breaker.rejected == 1
+
+
+def test_connection_errors_count_as_failures(fake, monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_MAX_ATTEMPTS", 0)
+    breaker = _breaker(failure_threshold=2, recovery_timeout=60)
+    fake.disconnect()
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(Exception):
+                await _call()
+
+    asyncio.run(scenario())
+    assert breaker.state == OPEN
+
+
+def test_half_open_probe_success_closes_the_breaker(fake, monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_MAX_ATTEMPTS", 0)
+    breaker = _breaker(failure_threshold=1, recovery_timeout=0.05, half_open_max_calls=1)
+    fake.fail(503)
+
+    async def scenario():
+        await _call()
+        assert breaker.state == OPEN
+        await asyncio.sleep(0.06)
+        fake.slow(0.05)
+        probe = asyncio.ensure_future(_call())
+        await asyncio.sleep(0.01)
+        assert breaker.state == HALF_OPEN
+        # Only one probe at a time; everything else keeps failing fast
+        with pytest.raises(CircuitOpenError):
+            await _call()
+        assert (await probe).status_code == 200
+
+    asyncio.run(scenario())
+    assert breaker.state == CLOSED
+    assert breaker.consecutive_failures == 0
+
+
+def test_half_open_probe_failure_reopens_the_breaker(fake, monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_MAX_ATTEMPTS", 0)
+    breaker = _breaker(failure_threshold=1, recovery_timeout=0.05)
+    fake.fail(503)
+
+    async def scenario():
+        await _call()
+        await asyncio.sleep(0.06)
+        opened_at = breaker.opened_at
+        assert (await _call()).status_code == 503
+        assert breaker.state == OPEN
+        assert breaker.opened_at > opened_at
+
+    asyncio.run(scenario())
+    assert breaker.times_opened == 2
+
+
+def test_retries_recover_from_a_transient_failure(fake, monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_MAX_ATTEMPTS", 2)
+    fake.fail(503)
+    calls_before_recovery = 1
+
+    original = fake.handle
+
+    async def flaky(request):
+        response = await original(request)
+        if fake.calls >= calls_before_recovery:
+            fake.recover()
+        return response
+
+    fake.handle = flaky
+    fake.use()
+    assert asyncio.run(_call()).status_code == 200
+    stats = resilience.get_target_stats("fake")
+    assert (stats.retries, stats.failures) == (1, 1)
+
+
+def test_empty_retry_budget_denies_retries(fake, monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_MAX_ATTEMPTS", 2)
+    stats = resilience.get_target_stats("fake")
+    stats.retry_tokens = 0
+    fake.fail(503)
+
+    assert asyncio.run(_call()).status_code == 503
+    assert fake.calls == 1
+    assert stats.retries == 0
+    assert stats.retries_denied == 1
+
+
+def test_non_idempotent_requests_are_not_retried(fake, monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_MAX_ATTEMPTS", 2)
+    fake.fail(503)
+
+    response = asyncio.run(resilience.request("fake", "POST", URL, json={}))
+    assert response.status_code == 503
+    assert fake.calls == 1
+
+
+def test_calls_cut_off_by_the_dependency_budget_open_the_breaker(fake, monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_MAX_ATTEMPTS", 0)
+    breaker = _breaker(failure_threshold=3, recovery_timeout=60)
+    fake.slow(1.0)
+
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(asyncio.TimeoutError):
+                await resilience.within(0.05, _call())
+        started = time.monotonic()
+        with pytest.raises(CircuitOpenError):
+            await resilience.within(0.05, _call())
+        return time.monotonic() - started
+
+    fail_fast = asyncio.run(scenario())
+    stats = resilience.get_target_stats("fake")
+    assert breaker.state == OPEN
+    assert stats.failures == 3
+    assert stats.percentile(95) is not None
+    assert fail_fast < 0.05
+
+
+def test_slow_restaurant_service_degrades_reads_without_waiting(fake, monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_MAX_ATTEMPTS", 0)
+    monkeypatch.setitem(crud.DEPENDENCY_TIMEOUTS, "restaurant", 0.05)
+    _breaker("restaurant", failure_threshold=2, recovery_timeout=60)
+    fake.slow(1.0)
+
+    async def scenario():
+        for _ in range(2):
+            assert await crud._timed_lookup("restaurant", "Unknown", crud.fetch_restaurant_name, "r1") == "Unknown"
+        started = time.monotonic()
+        assert await crud._timed_lookup("restaurant", "Unknown", crud.fetch_restaurant_name, "r2") == "Unknown"
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 0.05
+    assert resilience.get_resilience_stats()["restaurant"]["state"] == OPEN
+    assert fake.calls == 2
+
+
+def test_abandoned_half_open_probe_frees_its_slot(fake):
+    breaker = _breaker(failure_threshold=1, recovery_timeout=0)
+    breaker.record_failure()
+    fake.slow(1.0)
+
+    async def scenario():
+        probe = asyncio.ensure_future(_call())
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(scenario())
+    assert breaker.state == HALF_OPEN
+    assert breaker.half_open_calls == 0
+    assert breaker.consecutive_failures == 1
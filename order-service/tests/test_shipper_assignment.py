@@ -0,0 +1,57 @@
+"""A shipper claimed for an order that could not be shipped is released again"""
+import asyncio
+import pytest
+from bson import ObjectId
+from app import crud
+
+
+def _insert_ready_order(db) -> str:
+    result = asyncio.run(db["orders"].insert_one({
+        "user_id": "u1", "restaurant_id": "r1", "items": [], "total": 0.0, "status": "ready",
+    }))
+    return str(result.inserted_id)
+
+
+def _win_race_on_claim(fake, db, order_id: str, winner: str):
+    """Let a concurrent assignment ship the order with winner while this claim is in flight"""
+    original = fake.handle
+
+    async def handle(request):
+        if request.url.path.endswith("/claim") or request.url.path.endswith("/dispatch"):
+            await db["orders"].update_one(
+                {"_id": ObjectId(order_id)}, {"$set": {"status": "shipped", "shipper_id": winner}}
+            )
+        return await original(request)
+
+    fake.handle = handle
+    fake.use()
+
+
+def test_losing_assignment_releases_its_shipper(fake, db):
+    order_id = _insert_ready_order(db)
+    fake.respond("/shippers/b/claim", {"id": "b", "name": "Bea"})
+    _win_race_on_claim(fake, db, order_id, winner="a")
+
+    with pytest.raises(crud.InvalidTransition):
+        asyncio.run(crud.assign_shipper(db, order_id, "b"))
+    assert ("POST", "/shippers/b/release") in fake.requests
+
+
+def test_losing_duplicate_dispatch_keeps_the_shared_shipper(fake, db):
+    order_id = _insert_ready_order(db)
+    # Dispatching an order again returns the shipper already claimed for it
+    fake.respond("/shippers/dispatch", {"id": "a", "name": "Al"})
+    _win_race_on_claim(fake, db, order_id, winner="a")
+
+    with pytest.raises(crud.InvalidTransition):
+        asyncio.run(crud.dispatch_order(db, order_id))
+    assert not any(path.endswith("/release") for _, path in fake.requests)
+
+
+def test_successful_assignment_keeps_its_shipper(fake, db):
+    order_id = _insert_ready_order(db)
+    fake.respond("/shippers/b/claim", {"id": "b", "name": "Bea"})
+
+    order = asyncio.run(crud.assign_shipper(db, order_id, "b"))
+    assert (order["status"], order["shipper_id"]) == ("shipped", "b")
+    assert not any(path.endswith("/release") for _, path in fake.requests)
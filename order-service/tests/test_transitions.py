@@ -0,0 +1,53 @@
+"""Status changes are decided by one conditional update, rejections included"""
+import asyncio
+import pytest
+from bson import ObjectId
+from app import crud
+
+
+class CountingCollection:
+    """Counts the calls made to a collection"""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self.calls = []
+
+    def __getattr__(self, name):
+        self.calls.append(name)
+        return getattr(self._collection, name)
+
+
+@pytest.fixture
+def orders(db):
+    async def insert():
+        return (await db["orders"].insert_one({"status": "confirmed", "status_timestamps": {"cart": "t0"}})).inserted_id
+    order_id = str(asyncio.run(insert()))
+    return order_id, {"orders": CountingCollection(db["orders"])}
+
+
+def test_allowed_transition_is_written(orders, db):
+    order_id, counted = orders
+    order = asyncio.run(crud._transition(counted, order_id, "preparing"))
+    stored = asyncio.run(db["orders"].find_one({"_id": ObjectId(order_id)}))
+    assert order["status"] == stored["status"] == "preparing"
+    assert order["status_timestamps"] == stored["status_timestamps"]
+    assert set(stored["status_timestamps"]) == {"cart", "preparing"}
+    assert counted["orders"].calls == ["find_one_and_update"]
+
+
+@pytest.mark.parametrize("status", ["confirmed", "ready", "delivered"])
+def test_disallowed_transition_is_rejected_without_a_second_read(orders, db, status):
+    order_id, counted = orders
+    with pytest.raises(crud.InvalidTransition):
+        asyncio.run(crud._transition(counted, order_id, status))
+    stored = asyncio.run(db["orders"].find_one({"_id": ObjectId(order_id)}))
+    assert stored["status"] == "confirmed"
+    assert stored["status_timestamps"] == {"cart": "t0"}
+    assert "updated_at" not in stored
+    assert counted["orders"].calls == ["find_one_and_update"]
+
+
+def test_missing_order_is_none(orders):
+    _, counted = orders
+    assert asyncio.run(crud._transition(counted, str(ObjectId()), "preparing")) is None
+    assert counted["orders"].calls == ["find_one_and_update"]
@@ -1,6 +1,22 @@
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
-from app.schemas import Restaurant, MenuItem
+from app.schemas import Restaurant, MenuItem, MenuItemRef
+from typing import List, Optional, Sequence
+from pymongo import ASCENDING, ReturnDocument
+import base64
+import json
+from app.database import for_listings
+
+RESTAURANT_FIELDS = ("name", "description", "address", "phone", "location", "menu_items")
+# Default for listings: everything except the embedded menu
+SUMMARY_FIELDS = ("name", "description", "address", "phone", "location")
+
+
+def _restaurant_from_document(restaurant: dict, fields: Sequence[str]) -> dict:
+    result = {"id": str(restaurant["_id"])}
+    for field in fields:
+        result[field] = restaurant.get(field, [] if field == "menu_items" else None)
+    return result
 
 
 async def create_restaurant(db: AsyncIOMotorDatabase, restaurant_data: Restaurant):
@@ -8,6 +24,7 @@ async def create_restaurant(db: AsyncIOMotorDatabase, restaurant_data: Restauran
     restaurants = db["restaurants"]
     restaurant_dict = restaurant_data.model_dump(exclude={"id"})
     restaurant_dict["menu_items"] = []
+    restaurant_dict["menu_version"] = 0
     result = await restaurants.insert_one(restaurant_dict)
     return {
         "id": str(result.inserted_id),
@@ -15,99 +32,205 @@ async def create_restaurant(db: AsyncIOMotorDatabase, restaurant_data: Restauran
         "description": restaurant_dict["description"],
         "address": restaurant_dict["address"],
         "phone": restaurant_dict["phone"],
+        "location": restaurant_dict["location"],
         "menu_items": restaurant_dict["menu_items"],
     }
 
 
-async def get_restaurant(db: AsyncIOMotorDatabase, restaurant_id: str):
-    """Get restaurant by ID"""
+async def get_restaurant(db: AsyncIOMotorDatabase, restaurant_id: str, fields: Sequence[str] = RESTAURANT_FIELDS):
+    """Get restaurant by ID, fetching only the requested fields"""
     restaurants = db["restaurants"]
     try:
-        restaurant = await restaurants.find_one({"_id": ObjectId(restaurant_id)})
+        restaurant = await restaurants.find_one({"_id": ObjectId(restaurant_id)}, {field: 1 for field in fields})
         if restaurant:
-            return {
-                "id": str(restaurant["_id"]),
-                "name": restaurant["name"],
-                "description": restaurant["description"],
-                "address": restaurant["address"],
-                "phone": restaurant["phone"],
-                "menu_items": restaurant.get("menu_items", []),
-            }
+            return _restaurant_from_document(restaurant, fields)
         return None
     except Exception:
         return None
 
 
-async def list_restaurants(db: AsyncIOMotorDatabase):
-    """List all restaurants"""
+def encode_cursor(position: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Decode a catalog cursor; raises ValueError if it is malformed"""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if "after" in position:
+            ObjectId(position["after"])
+        elif not isinstance(position.get("offset"), int) or position["offset"] < 0:
+            raise ValueError
+        return position
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _catalog_projection(fields: Sequence[str], available_only: bool) -> dict:
+    projection = {field: 1 for field in fields}
+    if available_only and "menu_items" in projection:
+        projection["menu_items"] = {
+            "$filter": {
+                "input": {"$ifNull": ["$menu_items", []]},
+                "as": "item",
+                "cond": {"$eq": ["$$item.available", True]},
+            }
+        }
+    return projection
+
+
+async def list_restaurants(db: AsyncIOMotorDatabase, fields: Sequence[str] = SUMMARY_FIELDS, limit: int = 50,
+                           cursor: Optional[str] = None, q: Optional[str] = None, available_only: bool = False):
+    """List a page of restaurants, fetching only the requested fields.
+
+    Browsing pages through _id with a keyset cursor. A q= search uses the
+    catalog text index (name, description, menu item names) and is ordered
+    by relevance. available_only keeps restaurants with at least one
+    available menu item and drops unavailable items from returned menus.
+
+    Served with MONGO_LISTING_READ_PREFERENCE, so it may trail recent edits by
+    the replication lag.
+
+    Returns (restaurants, next_cursor); next_cursor is None on the last page.
+    """
+    restaurants = for_listings(db["restaurants"])
+    position = decode_cursor(cursor) if cursor else {}
+    query = {}
+    if available_only:
+        query["menu_items.available"] = True
+    projection = _catalog_projection(fields, available_only)
+
+    if q:
+        query["$text"] = {"$search": q}
+        projection["score"] = {"$meta": "textScore"}
+        offset = position.get("offset", 0)
+        found = restaurants.find(query, projection).sort(
+            [("score", {"$meta": "textScore"}), ("_id", ASCENDING)]
+        ).skip(offset)
+    else:
+        if "after" in position:
+            query["_id"] = {"$gt": ObjectId(position["after"])}
+        found = restaurants.find(query, projection).sort("_id", ASCENDING)
+
+    page = await found.limit(limit + 1).to_list(length=limit + 1)
+    next_cursor = None
+    if len(page) > limit:
+        if q:
+            next_cursor = encode_cursor({"offset": position.get("offset", 0) + limit})
+        else:
+            next_cursor = encode_cursor({"after": str(page[limit - 1]["_id"])})
+    return [_restaurant_from_document(restaurant, fields) for restaurant in page[:limit]], next_cursor
+
+
+def menu_etag(menu_version: int) -> str:
+    return f'"menu-{menu_version}"'
+
+
+async def _change_menu(db: AsyncIOMotorDatabase, query: dict, update: dict) -> Optional[int]:
+    """Apply a menu change and bump the restaurant's menu_version in the same write.
+
+    Returns the new version, or None if nothing matched.
+    """
     restaurants = db["restaurants"]
-    cursor = restaurants.find({})
-    result = []
-    async for restaurant in cursor:
-        result.append({
-            "id": str(restaurant["_id"]),
-            "name": restaurant["name"],
-            "description": restaurant["description"],
-            "address": restaurant["address"],
-            "phone": restaurant["phone"],
-            "menu_items": restaurant.get("menu_items", []),
-        })
-    return result
+    update.setdefault("$inc", {})["menu_version"] = 1
+    restaurant = await restaurants.find_one_and_update(
+        query, update, projection={"menu_version": 1}, return_document=ReturnDocument.AFTER
+    )
+    return restaurant["menu_version"] if restaurant else None
 
 
 async def create_menu_item(db: AsyncIOMotorDatabase, restaurant_id: str, menu_item: MenuItem):
-    """Create a menu item for a restaurant"""
-    restaurants = db["restaurants"]
-    try:
-        item_id = str(ObjectId())
-        menu_item_dict = menu_item.model_dump(exclude={"id"})
-        menu_item_dict["id"] = item_id
-        
-        await restaurants.update_one(
-            {"_id": ObjectId(restaurant_id)},
-            {"$push": {"menu_items": menu_item_dict}}
-        )
-        return menu_item_dict
-    except Exception as e:
+    """Create a menu item for a restaurant; returns (item, menu_version) or None"""
+    if not ObjectId.is_valid(restaurant_id):
+        return None
+    item_id = str(ObjectId())
+    menu_item_dict = menu_item.model_dump(exclude={"id"})
+    menu_item_dict["id"] = item_id
+    version = await _change_menu(db, {"_id": ObjectId(restaurant_id)}, {"$push": {"menu_items": menu_item_dict}})
+    if version is None:
         return None
+    return menu_item_dict, version
+
+
+async def get_menu_version(db: AsyncIOMotorDatabase, restaurant_id: str) -> Optional[int]:
+    """Current menu version without loading the menu; None if the restaurant does not exist"""
+    if not ObjectId.is_valid(restaurant_id):
+        return None
+    restaurant = await db["restaurants"].find_one({"_id": ObjectId(restaurant_id)}, {"menu_version": 1})
+    if not restaurant:
+        return None
+    return restaurant.get("menu_version", 0)
 
 
 async def get_menu_items(db: AsyncIOMotorDatabase, restaurant_id: str):
-    """Get all menu items for a restaurant"""
+    """Get all menu items for a restaurant with its menu version; ([], None) if it does not exist"""
     restaurants = db["restaurants"]
-    try:
-        restaurant = await restaurants.find_one({"_id": ObjectId(restaurant_id)})
-        if restaurant:
-            return restaurant.get("menu_items", [])
-        return []
-    except Exception:
-        return []
+    if not ObjectId.is_valid(restaurant_id):
+        return [], None
+    restaurant = await restaurants.find_one({"_id": ObjectId(restaurant_id)}, {"menu_items": 1, "menu_version": 1})
+    if restaurant:
+        return restaurant.get("menu_items", []), restaurant.get("menu_version", 0)
+    return [], None
 
 
 async def update_menu_item(db: AsyncIOMotorDatabase, restaurant_id: str, item_id: str, menu_item: MenuItem):
-    """Update a menu item"""
-    restaurants = db["restaurants"]
-    try:
-        menu_item_dict = menu_item.model_dump()
-        menu_item_dict["id"] = item_id
-        
-        await restaurants.update_one(
-            {"_id": ObjectId(restaurant_id), "menu_items.id": item_id},
-            {"$set": {"menu_items.$": menu_item_dict}}
-        )
-        return menu_item_dict
-    except Exception:
+    """Update a menu item; returns (item, menu_version) or None if it does not exist"""
+    if not ObjectId.is_valid(restaurant_id):
+        return None
+    menu_item_dict = menu_item.model_dump()
+    menu_item_dict["id"] = item_id
+    version = await _change_menu(
+        db,
+        {"_id": ObjectId(restaurant_id), "menu_items.id": item_id},
+        {"$set": {"menu_items.$": menu_item_dict}},
+    )
+    if version is None:
         return None
+    return menu_item_dict, version
 
 
-async def delete_menu_item(db: AsyncIOMotorDatabase, restaurant_id: str, item_id: str):
-    """Delete a menu item"""
+async def delete_menu_item(db: AsyncIOMotorDatabase, restaurant_id: str, item_id: str) -> Optional[int]:
+    """Delete a menu item; returns the new menu_version or None if it does not exist"""
+    if not ObjectId.is_valid(restaurant_id):
+        return None
+    return await _change_menu(
+        db,
+        {"_id": ObjectId(restaurant_id), "menu_items.id": item_id},
+        {"$pull": {"menu_items": {"id": item_id}}},
+    )
+
+
+async def get_menu_items_batch(db: AsyncIOMotorDatabase, refs: List[MenuItemRef]):
+    """Get specific menu items across restaurants in one query.
+
+    Only the requested items are returned: $filter trims each restaurant's
+    embedded menu_items server-side before it goes over the wire.
+    """
     restaurants = db["restaurants"]
-    try:
-        await restaurants.update_one(
-            {"_id": ObjectId(restaurant_id)},
-            {"$pull": {"menu_items": {"id": item_id}}}
-        )
-        return True
-    except Exception:
-        return False
+    requested = {}
+    for ref in refs:
+        if ObjectId.is_valid(ref.restaurant_id):
+            requested.setdefault(ref.restaurant_id, set()).add(ref.item_id)
+    if not requested:
+        return []
+
+    item_ids = list({item_id for ids in requested.values() for item_id in ids})
+    pipeline = [
+        {"$match": {"_id": {"$in": [ObjectId(rid) for rid in requested]}}},
+        {"$project": {
+            "menu_items": {
+                "$filter": {
+                    "input": {"$ifNull": ["$menu_items", []]},
+                    "as": "item",
+                    "cond": {"$in": ["$$item.id", item_ids]},
+                }
+            }
+        }},
+    ]
+    result = []
+    async for restaurant in restaurants.aggregate(pipeline):
+        restaurant_id = str(restaurant["_id"])
+        for item in restaurant["menu_items"]:
+            if item["id"] in requested[restaurant_id]:
+                result.append({"restaurant_id": restaurant_id, **item})
+    return result
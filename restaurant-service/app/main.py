@@ -1,18 +1,32 @@
-from fastapi import FastAPI
+from typing import Optional
+from fastapi import FastAPI, Response
+from service_common.middleware import HTTPCacheMiddleware
+from service_common.metrics import (
+    MetricsMiddleware, CONTENT_TYPE, render_metrics, get_mongo_pool_stats, mark_process_exited,
+)
+from service_common.tracing import TracingMiddleware, recent_spans
 from app.database import connect_to_mongo, close_mongo_connection
+from app.notifications import start_notifier, close_notifier
 from app.routers import restaurants
 
 app = FastAPI(title="Restaurant Service", version="1.0.0")
+app.add_middleware(HTTPCacheMiddleware)
+# Each middleware wraps those added before it: metrics include compression time, the server span covers both
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware, service="restaurant-service")
 
 
 @app.on_event("startup")
 async def startup():
     await connect_to_mongo()
+    await start_notifier()
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    await close_notifier()
     await close_mongo_connection()
+    mark_process_exited()
 
 
 app.include_router(restaurants.router)
@@ -21,3 +35,21 @@ app.include_router(restaurants.router)
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "restaurant-service"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Request, MongoDB and outbound call timings in the Prometheus text format"""
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
+
+@app.get("/traces", include_in_schema=False)
+async def traces(trace_id: Optional[str] = None):
+    """Recent spans from the in-memory trace exporter, optionally only those of one trace"""
+    return recent_spans(trace_id)
+
+
+@app.get("/stats/mongo-pool")
+async def mongo_pool_stats():
+    """MongoDB connection pool size, usage and waiters per server (for sizing MONGO_MAX_POOL_SIZE)"""
+    return get_mongo_pool_stats()
@@ -0,0 +1,52 @@
+import os
+import time
+import httpx
+from service_common.metrics import observe_upstream
+from service_common import tracing
+
+# Comma-separated endpoints told about menu changes so their caches can drop stale entries
+MENU_UPDATE_SUBSCRIBERS = [
+    url.strip()
+    for url in os.getenv("MENU_UPDATE_SUBSCRIBERS", "http://order-service:8000/cache/invalidate").split(",")
+    if url.strip()
+]
+NOTIFY_TIMEOUT = float(os.getenv("NOTIFY_TIMEOUT", "2.0"))
+# Service-to-service responses are not worth compressing; httpx would otherwise ask for gzip and br
+INTERNAL_HEADERS = {"Accept-Encoding": "identity"}
+
+client: httpx.AsyncClient = None
+
+
+async def start_notifier():
+    global client
+    client = httpx.AsyncClient(timeout=NOTIFY_TIMEOUT, headers=INTERNAL_HEADERS)
+
+
+async def close_notifier():
+    global client
+    if client:
+        await client.aclose()
+        client = None
+
+
+async def notify_menu_updated(restaurant_id: str, item_ids=None, menu_version: int = None):
+    """Best-effort notification; consumers fall back to their cache TTL if it is lost.
+
+    menu_version increases by one per menu change, so a consumer that sees a
+    gap knows it missed an event and can drop the whole menu.
+    """
+    if client is None:
+        return
+    payload = {"restaurant_id": restaurant_id, "item_ids": item_ids, "menu_version": menu_version}
+    for url in MENU_UPDATE_SUBSCRIBERS:
+        started = time.perf_counter()
+        with tracing.span(f"POST {httpx.URL(url).host}", kind="client", **{"http.url": url}) as span:
+            try:
+                response = await client.post(url, json=payload, headers=tracing.inject())
+                outcome = f"{response.status_code // 100}xx"
+                span.set_attribute("http.status_code", response.status_code)
+            except httpx.HTTPError as e:
+                outcome = "error"
+                span.fail(e)
+                print(f"Menu update notification to {url} failed: {e}")
+        observe_upstream(httpx.URL(url).host, time.perf_counter() - started, outcome)
@@ -1,10 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Response
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.database import get_database
-from app.schemas import Restaurant, MenuItem, RestaurantResponse, MenuItemResponse
+from service_common.metrics import TimedRoute
+from app.schemas import (
+    Restaurant, MenuItem, RestaurantResponse, RestaurantView, MenuItemResponse, MenuItemBatchRequest,
+    BatchMenuItemResponse
+)
+from typing import Optional
+import os
 from app import crud
+from app.notifications import notify_menu_updated
+from service_common.middleware import etag_matches
 
-router = APIRouter(tags=["restaurants"])
+router = APIRouter(tags=["restaurants"], route_class=TimedRoute)
+
+DEFAULT_PAGE_SIZE = int(os.getenv("CATALOG_DEFAULT_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("CATALOG_MAX_PAGE_SIZE", "200"))
+
+
+def parse_fields(fields: Optional[str], default):
+    """Parse a comma-separated sparse fieldset, e.g. fields=name,phone"""
+    if fields is None:
+        return default
+    requested = [field.strip() for field in fields.split(",") if field.strip() and field.strip() != "id"]
+    unknown = [field for field in requested if field not in crud.RESTAURANT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return requested
 
 
 @router.post("/restaurants", response_model=RestaurantResponse, status_code=201)
@@ -14,51 +36,99 @@ async def create_restaurant(restaurant: Restaurant, db: AsyncIOMotorDatabase = D
     return result
 
 
-@router.get("/restaurants", response_model=list[RestaurantResponse])
-async def list_restaurants(db: AsyncIOMotorDatabase = Depends(get_database)):
-    """List all restaurants"""
-    restaurants = await crud.list_restaurants(db)
+@router.get("/restaurants", response_model=list[RestaurantView], response_model_exclude_unset=True)
+async def list_restaurants(
+    response: Response,
+    fields: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+    available: bool = False,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    """Browse or search the restaurant catalog, one page at a time
+
+    Menus are left out unless requested, e.g. fields=name,menu_items.
+    q= searches restaurant names, descriptions and menu item names.
+    available=true keeps only restaurants (and menu items) that can be ordered.
+    Pass the X-Next-Cursor response header back as `cursor` to get the next page.
+    """
+    try:
+        restaurants, next_cursor = await crud.list_restaurants(
+            db, parse_fields(fields, crud.SUMMARY_FIELDS), limit, cursor, q, available
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return restaurants
 
 
-@router.get("/restaurants/{restaurant_id}", response_model=RestaurantResponse)
-async def get_restaurant(restaurant_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
-    """Get restaurant by ID"""
-    restaurant = await crud.get_restaurant(db, restaurant_id)
+@router.post("/restaurants/menu-items/batch", response_model=list[BatchMenuItemResponse])
+async def get_menu_items_batch(request: MenuItemBatchRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Get many menu items by (restaurant_id, item_id) in one call; unknown pairs are omitted"""
+    items = await crud.get_menu_items_batch(db, request.items)
+    return items
+
+
+@router.get("/restaurants/{restaurant_id}", response_model=RestaurantView, response_model_exclude_unset=True)
+async def get_restaurant(restaurant_id: str, fields: Optional[str] = None, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Get restaurant by ID; fields= limits the response (and the Mongo projection) to those fields"""
+    restaurant = await crud.get_restaurant(db, restaurant_id, parse_fields(fields, crud.RESTAURANT_FIELDS))
     if not restaurant:
         raise HTTPException(status_code=404, detail="Restaurant not found")
     return restaurant
 
 
 @router.post("/restaurants/{restaurant_id}/menu-items", response_model=MenuItemResponse, status_code=201)
-async def add_menu_item(restaurant_id: str, menu_item: MenuItem, db: AsyncIOMotorDatabase = Depends(get_database)):
+async def add_menu_item(restaurant_id: str, menu_item: MenuItem, response: Response, background_tasks: BackgroundTasks,
+                        db: AsyncIOMotorDatabase = Depends(get_database)):
     """Add menu item to restaurant"""
     result = await crud.create_menu_item(db, restaurant_id, menu_item)
     if not result:
         raise HTTPException(status_code=404, detail="Restaurant not found")
-    return result
+    item, version = result
+    response.headers["ETag"] = crud.menu_etag(version)
+    background_tasks.add_task(notify_menu_updated, restaurant_id, [item["id"]], version)
+    return item
 
 
 @router.get("/restaurants/{restaurant_id}/menu-items", response_model=list[MenuItemResponse])
-async def get_menu_items(restaurant_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
-    """Get all menu items for a restaurant"""
-    items = await crud.get_menu_items(db, restaurant_id)
+async def get_menu_items(restaurant_id: str, response: Response, if_none_match: Optional[str] = Header(None),
+                         db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Get all menu items for a restaurant
+
+    The ETag is the menu version; revalidating with If-None-Match costs a
+    single-field read and returns 304 while the menu is unchanged.
+    """
+    if if_none_match:
+        version = await crud.get_menu_version(db, restaurant_id)
+        if version is not None and etag_matches(if_none_match, crud.menu_etag(version)):
+            return Response(status_code=304, headers={"ETag": crud.menu_etag(version)})
+    items, version = await crud.get_menu_items(db, restaurant_id)
+    if version is not None:
+        response.headers["ETag"] = crud.menu_etag(version)
     return items
 
 
 @router.put("/restaurants/{restaurant_id}/menu-items/{item_id}", response_model=MenuItemResponse)
-async def update_menu_item(restaurant_id: str, item_id: str, menu_item: MenuItem, db: AsyncIOMotorDatabase = Depends(get_database)):
+async def update_menu_item(restaurant_id: str, item_id: str, menu_item: MenuItem, response: Response,
+                           background_tasks: BackgroundTasks, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Update a menu item"""
     result = await crud.update_menu_item(db, restaurant_id, item_id, menu_item)
     if not result:
         raise HTTPException(status_code=404, detail="Menu item not found")
-    return result
+    item, version = result
+    response.headers["ETag"] = crud.menu_etag(version)
+    background_tasks.add_task(notify_menu_updated, restaurant_id, [item_id], version)
+    return item
 
 
 @router.delete("/restaurants/{restaurant_id}/menu-items/{item_id}")
-async def delete_menu_item(restaurant_id: str, item_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+async def delete_menu_item(restaurant_id: str, item_id: str, background_tasks: BackgroundTasks, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Delete a menu item"""
-    success = await crud.delete_menu_item(db, restaurant_id, item_id)
-    if not success:
+    version = await crud.delete_menu_item(db, restaurant_id, item_id)
+    if version is None:
         raise HTTPException(status_code=404, detail="Menu item not found")
-    return {"message": "Menu item deleted"}
+    background_tasks.add_task(notify_menu_updated, restaurant_id, [item_id], version)
+    return {"message": "Menu item deleted", "menu_version": version}
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 
 
@@ -10,12 +10,18 @@ class MenuItem(BaseModel):
     available: bool = True
 
 
+class Location(BaseModel):
+    lat: float = Field(ge=-90, le=90)
+    lng: float = Field(ge=-180, le=180)
+
+
 class Restaurant(BaseModel):
     id: Optional[str] = None
     name: str
     description: str
     address: str
     phone: str
+    location: Optional[Location] = None  # coordinates of the address, used for shipper dispatch
     menu_items: List[MenuItem] = []
 
 
@@ -25,12 +31,24 @@ class RestaurantResponse(BaseModel):
     description: str
     address: str
     phone: str
+    location: Optional[Location] = None
     menu_items: List[MenuItem]
 
     class Config:
         populate_by_name = True
 
 
+class RestaurantView(BaseModel):
+    """Restaurant with only the requested fields (see the fields= query parameter)"""
+    id: str
+    name: Optional[str] = None
+    description: Optional[str] = None
+    address: Optional[str] = None
+    phone: Optional[str] = None
+    location: Optional[Location] = None
+    menu_items: Optional[List[MenuItem]] = None
+
+
 class MenuItemResponse(BaseModel):
     id: str
     name: str
@@ -40,3 +58,21 @@ class MenuItemResponse(BaseModel):
 
     class Config:
         populate_by_name = True
+
+
+class MenuItemRef(BaseModel):
+    restaurant_id: str
+    item_id: str
+
+
+class MenuItemBatchRequest(BaseModel):
+    items: List[MenuItemRef] = Field(max_length=1000)
+
+
+class BatchMenuItemResponse(BaseModel):
+    restaurant_id: str
+    id: str
+    name: str
+    description: str
+    price: float
+    available: bool
@@ -0,0 +1,5 @@
+"""Code every service runs the same way: metrics, tracing, HTTP caching and the production entry point.
+
+Installed into each service's image (see the service Dockerfiles); the
+services import it as service_common.metrics, service_common.tracing and so on.
+"""
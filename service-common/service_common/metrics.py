@@ -0,0 +1,354 @@
+"""Prometheus metrics and a Server-Timing header for every route.
+
+Request latency per route, requests in flight, MongoDB command timings per
+collection and command, MongoDB connection pool utilisation, and outbound
+HTTP timings per target, kept with prometheus_client and served in the
+Prometheus text format at /metrics.
+
+With several workers, service_common.serve sets PROMETHEUS_MULTIPROC_DIR and
+prometheus_client keeps every worker's values in files there; /metrics then
+reports the sum over all workers, whichever worker answers the scrape.
+Histograms and counters include workers that have exited; gauges only count
+the running ones.
+
+Each response also gets a Server-Timing header splitting the request into
+db (MongoDB commands), upstream (calls to other services), app (the rest of
+the handler) and serialization (response validation, JSON encoding, ETag and
+compression), which browser dev tools show next to the network timings.
+"""
+import os
+import time
+import inspect
+import functools
+import threading
+import contextvars
+from fastapi.routing import APIRoute
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, disable_created_metrics, generate_latest,
+    multiprocess,
+)
+from pymongo import monitoring
+from starlette.datastructures import MutableHeaders
+
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+
+# Shared by the workers of one service; prometheus_client reads it when first imported
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+# Seconds; from single-document reads up to slow cross-service calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# The _created series only say when a process first saw a label combination
+disable_created_metrics()
+
+# This module's own registry, so each service imported into one interpreter (benchmarks/services.py)
+# keeps its own metrics
+registry = CollectorRegistry()
+
+# Time spent by the request being served: {"db": s, "upstream": s, "handler_end": perf_counter}
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+# MongoDB events arrive on Motor's executor threads
+_lock = threading.Lock()
+
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being served", registry=registry, multiprocess_mode="livesum",
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last body chunk, per route template",
+    ("method", "route", "status"), buckets=LATENCY_BUCKETS, registry=registry,
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command round trips as reported by the driver",
+    ("collection", "command", "outcome"), buckets=LATENCY_BUCKETS, registry=registry,
+)
+UPSTREAM_REQUEST_DURATION = Histogram(
+    "upstream_request_duration_seconds",
+    "Outbound HTTP requests to other services, including reading the body",
+    ("target", "outcome"), buckets=LATENCY_BUCKETS, registry=registry,
+)
+
+# Pool fields exported as gauges per server address, summed over the running workers
+MONGO_POOL_GAUGES = {
+    key: Gauge(name, documentation, ("address",), registry=registry, multiprocess_mode="livesum")
+    for key, name, documentation in (
+        ("max_size", "mongo_pool_max_size", "Configured maxPoolSize per server"),
+        ("open", "mongo_pool_connections_open", "Connections open to the server, idle or in use"),
+        ("in_use", "mongo_pool_connections_in_use", "Connections checked out by an operation"),
+        ("waiting", "mongo_pool_waiters", "Operations waiting for a connection"),
+    )
+}
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    "mongo_pool_checkout_failures", "Checkouts that gave up, by reason", ("address", "reason"), registry=registry,
+)
+MONGO_POOL_CLEARS = Counter(
+    "mongo_pool_clears", "Times the pool was cleared after a network error or failover", ("address",),
+    registry=registry,
+)
+MONGO_POOL_CHECKOUT_WAIT = Histogram(
+    "mongo_pool_checkout_wait_seconds",
+    "Time from asking the pool for a connection to getting one (or giving up)",
+    ("address", "outcome"), buckets=LATENCY_BUCKETS, registry=registry,
+)
+
+
+def render_metrics() -> bytes:
+    """All metrics in the Prometheus text exposition format, for every worker when running several"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        workers = CollectorRegistry()
+        multiprocess.MultiProcessCollector(workers)
+        return generate_latest(workers)
+    return generate_latest(registry)
+
+
+def mark_process_exited():
+    """Stop counting this worker's gauges; call from the shutdown handler"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def _add_request_time(kind: str, seconds: float):
+    timings = _request_timings.get()
+    if timings is not None:
+        with _lock:
+            timings[kind] += seconds
+
+
+def observe_upstream(target: str, seconds: float, outcome: str):
+    """Record one outbound request; outcome is a status class such as "2xx", or "error" """
+    UPSTREAM_REQUEST_DURATION.labels(target, outcome).observe(seconds)
+    _add_request_time("upstream", seconds)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times every command the driver sends; pass it to the client's event_listeners"""
+
+    def __init__(self):
+        self._pending = {}  # (connection, request id) -> (collection, command)
+
+    def started(self, event):
+        name = event.command_name
+        collection = event.command.get("collection" if name == "getMore" else name)
+        with _lock:
+            self._pending[(event.connection_id, event.request_id)] = (
+                collection if isinstance(collection, str) else "", name,
+            )
+
+    def _finished(self, event, outcome: str):
+        with _lock:
+            collection, command = self._pending.pop((event.connection_id, event.request_id), ("", event.command_name))
+        seconds = event.duration_micros / 1_000_000
+        MONGO_COMMAND_DURATION.labels(collection, command, outcome).observe(seconds)
+        # Motor runs the driver in a thread with a copy of the caller's context, so this finds the request
+        _add_request_time("db", seconds)
+
+    def succeeded(self, event):
+        self._finished(event, "success")
+
+    def failed(self, event):
+        self._finished(event, "failure")
+
+
+mongo_listener = MongoCommandListener()
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """Connection pool utilisation per MongoDB server; pass it to the client's event_listeners
+
+    A pool whose in_use sits at max_size with waiters queued is too small for
+    the load (or the queries hold connections too long): raise MONGO_MAX_POOL_SIZE
+    or look at the slow commands in mongo_command_duration_seconds.
+    """
+
+    def __init__(self):
+        self._pools = {}  # "host:port" -> counters
+
+    @staticmethod
+    def _key(address) -> str:
+        return f"{address[0]}:{address[1]}"
+
+    def _pool(self, address) -> dict:
+        key = self._key(address)
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = {
+                "max_size": 0, "min_size": 0, "open": 0, "in_use": 0, "waiting": 0,
+                "checkouts": 0, "checkout_failures": {}, "clears": 0,
+            }
+        return pool
+
+    def _export(self, address, pool: dict):
+        for key, gauge in MONGO_POOL_GAUGES.items():
+            gauge.labels(self._key(address)).set(pool[key])
+
+    def pool_created(self, event):
+        with _lock:
+            pool = self._pool(event.address)
+            pool["max_size"] = event.options.get("maxPoolSize", 0)
+            pool["min_size"] = event.options.get("minPoolSize", 0)
+            self._export(event.address, pool)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with _lock:
+            self._pool(event.address)["clears"] += 1
+        MONGO_POOL_CLEARS.labels(self._key(event.address)).inc()
+
+    def pool_closed(self, event):
+        with _lock:
+            pool = self._pools.pop(self._key(event.address), None)
+            if pool is not None:
+                self._export(event.address, {key: 0 for key in MONGO_POOL_GAUGES})
+
+    def connection_created(self, event):
+        with _lock:
+            pool = self._pool(event.address)
+            pool["open"] += 1
+            self._export(event.address, pool)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with _lock:
+            pool = self._pool(event.address)
+            pool["open"] = max(0, pool["open"] - 1)
+            self._export(event.address, pool)
+
+    def connection_check_out_started(self, event):
+        with _lock:
+            pool = self._pool(event.address)
+            pool["waiting"] += 1
+            self._export(event.address, pool)
+
+    def connection_checked_out(self, event):
+        with _lock:
+            pool = self._pool(event.address)
+            pool["waiting"] = max(0, pool["waiting"] - 1)
+            pool["in_use"] += 1
+            pool["checkouts"] += 1
+            self._export(event.address, pool)
+        # duration is only reported by pymongo 4.7 and later
+        if getattr(event, "duration", None) is not None:
+            MONGO_POOL_CHECKOUT_WAIT.labels(self._key(event.address), "success").observe(event.duration)
+
+    def connection_check_out_failed(self, event):
+        with _lock:
+            pool = self._pool(event.address)
+            pool["waiting"] = max(0, pool["waiting"] - 1)
+            pool["checkout_failures"][event.reason] = pool["checkout_failures"].get(event.reason, 0) + 1
+            self._export(event.address, pool)
+        MONGO_POOL_CHECKOUT_FAILURES.labels(self._key(event.address), event.reason).inc()
+        if getattr(event, "duration", None) is not None:
+            MONGO_POOL_CHECKOUT_WAIT.labels(self._key(event.address), "failure").observe(event.duration)
+
+    def connection_checked_in(self, event):
+        with _lock:
+            pool = self._pool(event.address)
+            pool["in_use"] = max(0, pool["in_use"] - 1)
+            self._export(event.address, pool)
+
+    def snapshot(self) -> dict:
+        """This worker's pools, for /stats/mongo-pool"""
+        with _lock:
+            pools = {address: {**pool, "checkout_failures": dict(pool["checkout_failures"])}
+                     for address, pool in self._pools.items()}
+        for pool in pools.values():
+            pool["utilization"] = round(pool["in_use"] / pool["max_size"], 3) if pool["max_size"] else None
+        return pools
+
+
+mongo_pool_listener = MongoPoolListener()
+
+
+def get_mongo_pool_stats() -> dict:
+    """Per-server pool size, open and in-use connections, waiters and checkout failures"""
+    return mongo_pool_listener.snapshot()
+
+
+def _timed_endpoint(endpoint):
+    # Some FastAPI versions rebuild included routes from their (already wrapped) endpoints
+    if not inspect.iscoroutinefunction(endpoint) or getattr(endpoint, "marks_handler_end", False):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    async def timed(*args, **kwargs):
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            timings = _request_timings.get()
+            if timings is not None:
+                timings["handler_end"] = time.perf_counter()
+
+    timed.marks_handler_end = True
+    return timed
+
+
+class TimedRoute(APIRoute):
+    """Notes when the endpoint returns, so Server-Timing can tell handler time from serialization.
+
+    Use as APIRouter(route_class=TimedRoute).
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+
+def server_timing(timings: dict, started: float, now: float) -> str:
+    handler_end = timings["handler_end"] or now
+    handler = handler_end - started
+    parts = [
+        ("db", timings["db"]),
+        ("upstream", timings["upstream"]),
+        # db and upstream can overlap when a handler awaits several calls at once
+        ("app", max(0.0, handler - timings["db"] - timings["upstream"])),
+        ("serialization", now - handler_end),
+        ("total", now - started),
+    ]
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in parts)
+
+
+class MetricsMiddleware:
+    """Request latency, in-flight gauge and the Server-Timing header.
+
+    Add it after HTTPCacheMiddleware so it is the outer one and its timings
+    include compression. Server-Sent Event routes record how long the stream
+    stayed open.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = {"db": 0.0, "upstream": 0.0, "handler_end": None}
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING_ENABLED:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", server_timing(timings, started, time.perf_counter()))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            _request_timings.reset(token)
+            # The router stores the matched route in the scope; label by its template to keep cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_DURATION.labels(scope["method"], route, str(status)).observe(time.perf_counter() - started)
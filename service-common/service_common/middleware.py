@@ -0,0 +1,180 @@
+"""ETags, conditional GETs and response compression for every route.
+
+Plain ASGI middleware rather than BaseHTTPMiddleware, so streaming responses
+(NDJSON exports, Server-Sent Events) still go out chunk by chunk.
+"""
+import os
+import zlib
+import hashlib
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    # Optional; without it only gzip is offered
+    brotli = None
+
+ETAG_ENABLED = os.getenv("ETAG_ENABLED", "true").lower() == "true"
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+# Smaller bodies fit in a packet or two anyway; compressing them costs more CPU than it saves
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+# Brotli's default quality (11) is meant for static assets; 4 compresses better than gzip -6 at similar speed
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+# Events must reach the client as soon as they are written, so they are never buffered or compressed
+UNTOUCHED_TYPES = ("text/event-stream",)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header; q=0 excludes an encoding"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in (("br",) if brotli else ()) + ("gzip",):
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def weak_etag(body: bytes) -> str:
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an If-None-Match header lists etag (weak comparison) or is *"""
+    if not if_none_match:
+        return False
+    bare = etag[2:] if etag.startswith("W/") else etag
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or bare in [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+
+
+class Compressor:
+    """Incremental gzip or brotli encoder"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31: gzip container
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """Compress a chunk; non-final chunks are flushed so the client can decode them right away"""
+        if self.encoding == "br":
+            output = self._brotli.process(data)
+            return output + (self._brotli.finish() if final else self._brotli.flush())
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def _compressible(headers: Headers) -> bool:
+    content_type = headers.get("content-type", "")
+    return (
+        content_type.startswith(COMPRESSIBLE_TYPES)
+        and not content_type.startswith(UNTOUCHED_TYPES)
+        and "content-encoding" not in headers
+    )
+
+
+class HTTPCacheMiddleware:
+    """Weak ETags and 304s for GET responses, gzip/brotli for large bodies.
+
+    A route that sets its own ETag keeps it. Streaming responses get no
+    ETag and are compressed chunk by chunk, with no size threshold.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        use_etag = ETAG_ENABLED and scope["method"] == "GET"
+        encoding = choose_encoding(request_headers.get("accept-encoding", "")) if COMPRESSION_ENABLED else None
+        if not use_etag and encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        streaming = False
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, streaming, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                wants_etag = use_etag and message["status"] == 200
+                if headers.get("content-type", "").startswith(UNTOUCHED_TYPES) or not (
+                        wants_etag or (encoding and _compressible(headers))):
+                    # Nothing to add: send the headers now instead of holding them until the first body chunk
+                    passthrough = True
+                    await send(message)
+                    return
+                start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if streaming:
+                if compressor:
+                    body = compressor.compress(body, final=not more_body)
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            if more_body:
+                # First chunk of a streaming response: headers go out now, the body as it comes
+                streaming = True
+                if encoding and _compressible(headers):
+                    compressor = Compressor(encoding)
+                    del headers["content-length"]
+                    headers["Content-Encoding"] = encoding
+                    headers.add_vary_header("Accept-Encoding")
+                    body = compressor.compress(body, final=False)
+                await send(start)
+                await send({"type": "http.response.body", "body": body, "more_body": True})
+                return
+
+            if COMPRESSION_ENABLED and _compressible(headers):
+                headers.add_vary_header("Accept-Encoding")
+            if use_etag and start["status"] == 200:
+                etag = headers.get("etag") or weak_etag(body)
+                headers["ETag"] = etag
+                if "cache-control" not in headers:
+                    # Cacheable, but revalidate every time; a 304 is far cheaper than the body
+                    headers["Cache-Control"] = "no-cache"
+                if etag_matches(request_headers.get("if-none-match"), etag):
+                    not_modified = MutableHeaders()
+                    for name in ("etag", "cache-control", "vary"):
+                        if name in headers:
+                            not_modified[name] = headers[name]
+                    await send({"type": "http.response.start", "status": 304, "headers": not_modified.raw})
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+
+            if (encoding and _compressible(headers) and len(body) >= COMPRESSION_MIN_SIZE
+                    and start["status"] not in (204, 304)):
+                body = Compressor(encoding).compress(body, final=True)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,116 @@
+"""Production entry point: uvicorn with one worker process per usable core.
+
+    python -m service_common.serve
+
+Run it from a service directory; it serves that service's app.main:app.
+
+Each worker is a separate process that imports the app and runs the startup
+handlers itself, so every worker opens its own MongoDB client, httpx clients
+and background tasks on its own event loop. Nothing that holds a socket is
+created at import time.
+
+On SIGTERM the workers stop accepting connections and give in-flight
+requests up to UVICORN_GRACEFUL_TIMEOUT seconds. Then the shutdown handlers
+run: buffers are flushed and clients closed.
+
+With several workers, PROMETHEUS_MULTIPROC_DIR (a fresh temporary directory
+unless set) lets whichever worker answers /metrics report the totals of all of
+them; see service_common/metrics.py. /stats/* and /traces stay per worker and show the
+worker that answered.
+
+For development, keep using `uvicorn app.main:app --reload`.
+"""
+import os
+import glob
+import math
+import tempfile
+# Required rather than optional: without them uvicorn silently falls back to the asyncio loop and h11 parser
+import uvloop  # noqa: F401
+import httptools  # noqa: F401
+import uvicorn
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+# uvicorn's own variable name; 0 means one worker per usable core
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0"))
+# Pending connections the kernel queues per listening socket (also capped by net.core.somaxconn)
+UVICORN_BACKLOG = int(os.getenv("UVICORN_BACKLOG", "2048"))
+# Longer than the usual 60s idle timeout of load balancers, so the proxy closes idle connections first
+UVICORN_KEEPALIVE = int(os.getenv("UVICORN_KEEPALIVE", "75"))
+# Per worker; beyond it new connections get 503 instead of queueing (0 = unlimited)
+UVICORN_LIMIT_CONCURRENCY = int(os.getenv("UVICORN_LIMIT_CONCURRENCY", "0"))
+# Recycle a worker after this many requests, to bound slow leaks (0 = never)
+UVICORN_MAX_REQUESTS = int(os.getenv("UVICORN_MAX_REQUESTS", "0"))
+UVICORN_GRACEFUL_TIMEOUT = int(os.getenv("UVICORN_GRACEFUL_TIMEOUT", "20"))
+UVICORN_LOG_LEVEL = os.getenv("UVICORN_LOG_LEVEL", "info")
+UVICORN_ACCESS_LOG = os.getenv("UVICORN_ACCESS_LOG", "false").lower() == "true"
+
+
+def _cgroup_cpu_quota():
+    """CPUs allowed by a container limit (docker --cpus), or None if there is none"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:  # cgroup v2
+            quota, period = f.read().split()
+        return int(quota) / int(period) if quota != "max" else None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:  # cgroup v1
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return quota / period if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus() -> int:
+    """Cores this process may run on; os.cpu_count() reports the whole host even inside a container"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+
+def _metrics_dir() -> str:
+    """Directory the workers share their metrics through, emptied of a previous run's files"""
+    directory = os.getenv("PROMETHEUS_MULTIPROC_DIR") or tempfile.mkdtemp(prefix="metrics-")
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.db")):
+        os.remove(path)
+    return directory
+
+
+def main():
+    workers = WEB_CONCURRENCY or available_cpus()
+    if workers > 1:
+        # Inherited by the worker processes, which read it when they import prometheus_client
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = _metrics_dir()
+    print(f"Serving on {HOST}:{PORT} with {workers} worker(s), uvloop + httptools")
+    uvicorn.run(
+        "app.main:app",
+        host=HOST,
+        port=PORT,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        lifespan="on",
+        backlog=UVICORN_BACKLOG,
+        timeout_keep_alive=UVICORN_KEEPALIVE,
+        limit_concurrency=UVICORN_LIMIT_CONCURRENCY or None,
+        limit_max_requests=UVICORN_MAX_REQUESTS or None,
+        # Spread recycling so workers do not all restart at once
+        limit_max_requests_jitter=UVICORN_MAX_REQUESTS // 10,
+        timeout_graceful_shutdown=UVICORN_GRACEFUL_TIMEOUT,
+        log_level=UVICORN_LOG_LEVEL,
+        access_log=UVICORN_ACCESS_LOG,
+        server_header=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""W3C Trace Context propagation and spans for requests, MongoDB commands and outbound calls.
+
+An incoming request continues the trace named in its `traceparent` header,
+or starts a new one. Outbound calls pass the trace on to the next service,
+so the spans all services export join into one tree per request. Spans go
+to the exporter chosen by TRACE_EXPORTER:
+
+    memory        keep the last TRACE_BUFFER_SIZE spans, served at GET /traces (default)
+    file          append one JSON object per line to TRACE_FILE
+    none          propagate trace context but record nothing
+    module:name   an object with export(span: dict), or a class or factory returning one
+
+benchmarks/traces.py reads either source and reports fan-out and critical paths.
+"""
+import os
+import re
+import json
+import time
+import random
+import functools
+import importlib
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+from pymongo import monitoring
+from starlette.datastructures import Headers, MutableHeaders
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "memory")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "10000"))
+# Share of new traces that are recorded; the sampled flag of an incoming traceparent is kept as-is
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))
+# Scrapes and probes would otherwise crowd real requests out of the buffer
+TRACE_EXCLUDE_PATHS = {
+    path.strip() for path in os.getenv("TRACE_EXCLUDE_PATHS", "/health,/metrics,/traces").split(",") if path.strip()
+}
+
+TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# Set by TracingMiddleware; recorded on every span
+service_name = "unknown"
+
+
+class InMemoryExporter:
+    """Ring buffer of the most recent spans"""
+
+    def __init__(self, size: int = TRACE_BUFFER_SIZE):
+        self._spans = deque(maxlen=size)
+
+    def export(self, span: dict):
+        self._spans.append(span)
+
+    def spans(self, trace_id: str = None) -> list:
+        return [span for span in list(self._spans) if trace_id is None or span["trace_id"] == trace_id]
+
+
+class FileExporter:
+    """One JSON object per line, for offline analysis; every span is a small blocking write"""
+
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()  # MongoDB spans end on Motor's executor threads
+
+    def export(self, span: dict):
+        line = json.dumps(span) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", buffering=1)
+            self._file.write(line)
+
+
+class NoopExporter:
+    def export(self, span: dict):
+        pass
+
+
+def _load_exporter(name: str):
+    if name == "memory":
+        return InMemoryExporter()
+    if name == "file":
+        return FileExporter()
+    if name == "none":
+        return NoopExporter()
+    module_name, _, attribute = name.partition(":")
+    target = getattr(importlib.import_module(module_name), attribute)
+    # A class or factory is called; anything else is used as the exporter itself
+    return target() if isinstance(target, type) or not hasattr(target, "export") else target
+
+
+exporter = _load_exporter(TRACE_EXPORTER)
+
+
+def set_exporter(new_exporter):
+    global exporter
+    exporter = new_exporter
+
+
+def recent_spans(trace_id: str = None) -> list:
+    """Spans held by the in-memory exporter; empty for any other exporter"""
+    return exporter.spans(trace_id) if isinstance(exporter, InMemoryExporter) else []
+
+
+def _new_trace_id() -> str:
+    return f"{random.getrandbits(128):032x}"
+
+
+class Span:
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 attributes: dict = None):
+        self.name = name
+        self.kind = kind  # server, client or internal
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = attributes or {}
+        self.error = None
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def fail(self, error):
+        self.error = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+
+    def end(self, duration: float = None):
+        if not self.sampled:
+            return
+        try:
+            exporter.export({
+                "trace_id": self.trace_id,
+                "span_id": self.span_id,
+                "parent_id": self.parent_id,
+                "name": self.name,
+                "kind": self.kind,
+                "service": service_name,
+                "start_time": self.start_time,
+                "duration": duration if duration is not None else time.perf_counter() - self._started,
+                "error": self.error,
+                "attributes": self.attributes,
+            })
+        except Exception as e:
+            print(f"Span export failed: {e}")
+
+
+def start_span(name: str, kind: str = "internal", attributes: dict = None) -> Span:
+    """A child of the current span, or the root of a new trace"""
+    parent = _current_span.get()
+    if parent is None:
+        return Span(name, kind, _new_trace_id(), None, random.random() < TRACE_SAMPLE_RATIO, attributes)
+    return Span(name, kind, parent.trace_id, parent.span_id, parent.sampled, attributes)
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    """Run a block as a span that is current for everything it calls"""
+    current = start_span(name, kind, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def traced(name: str = None):
+    """Decorator: run each call of an async function as a span"""
+    def decorate(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name or func.__name__):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def inject(headers: dict = None) -> dict:
+    """Copy of headers with a traceparent for the current span, to send on an outbound request"""
+    headers = dict(headers or {})
+    current = _current_span.get()
+    if current is not None:
+        headers["traceparent"] = current.traceparent()
+    return headers
+
+
+def parse_traceparent(value: Optional[str]):
+    """(trace_id, parent span id, sampled) from a traceparent header, or None if it is missing or invalid"""
+    match = TRACEPARENT.match(value.strip().lower()) if value else None
+    if not match:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+class MongoSpanListener(monitoring.CommandListener):
+    """A client span per MongoDB command sent while a traced request is current"""
+
+    def __init__(self):
+        self._pending = {}  # (connection, request id) -> Span
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        # Motor runs the driver in a thread with a copy of the caller's context
+        parent = _current_span.get()
+        if parent is None or not parent.sampled:
+            return
+        name = event.command_name
+        collection = event.command.get("collection" if name == "getMore" else name)
+        collection = collection if isinstance(collection, str) else ""
+        command_span = Span(f"mongo {name} {collection}".rstrip(), "client", parent.trace_id, parent.span_id, True, {
+            "db.system": "mongodb",
+            "db.name": event.database_name,
+            "db.operation": name,
+            "db.collection": collection,
+        })
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = command_span
+
+    def _finish(self, event, error: str = None):
+        with self._lock:
+            command_span = self._pending.pop((event.connection_id, event.request_id), None)
+        if command_span is None:
+            return
+        if error:
+            command_span.fail(error)
+        command_span.end(event.duration_micros / 1_000_000)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, str(event.failure))
+
+
+mongo_span_listener = MongoSpanListener()
+
+
+class TracingMiddleware:
+    """Server span per request, continuing the caller's trace when it sent a traceparent.
+
+    The response carries a traceresponse header naming the trace and the server span.
+    """
+
+    def __init__(self, app, service: str):
+        global service_name
+        self.app = app
+        service_name = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in TRACE_EXCLUDE_PATHS:
+            await self.app(scope, receive, send)
+            return
+        incoming = parse_traceparent(Headers(scope=scope).get("traceparent"))
+        if incoming:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id, sampled = _new_trace_id(), None, random.random() < TRACE_SAMPLE_RATIO
+        server_span = Span(f"{scope['method']} {scope['path']}", "server", trace_id, parent_id, sampled, {
+            "http.method": scope["method"],
+            "http.target": scope["path"],
+        })
+        token = _current_span.set(server_span)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append("traceresponse", server_span.traceparent())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            server_span.fail(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                # Name by template so spans of the same endpoint group together
+                server_span.name = f"{scope['method']} {route}"
+                server_span.set_attribute("http.route", route)
+            server_span.set_attribute("http.status_code", status)
+            if status >= 500 and server_span.error is None:
+                server_span.fail(f"HTTP {status}")
+            server_span.end()
@@ -0,0 +1,64 @@
+"""/metrics adds up the values every worker writes to PROMETHEUS_MULTIPROC_DIR"""
+import os
+import sys
+import subprocess
+from service_common import metrics
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# One worker: an upstream call, a pool with two connections in use, a checkout timeout
+WORKER = """
+import sys
+from types import SimpleNamespace
+from service_common import metrics
+
+in_flight, upstream_calls, exited = int(sys.argv[1]), int(sys.argv[2]), sys.argv[3] == "exited"
+for _ in range(in_flight):
+    metrics.REQUESTS_IN_FLIGHT.inc()
+for _ in range(upstream_calls):
+    metrics.observe_upstream("user", 0.002, "2xx")
+address = ("mongo", 27017)
+listener = metrics.MongoPoolListener()
+listener.pool_created(SimpleNamespace(address=address, options={"maxPoolSize": 100}))
+for _ in range(2):
+    listener.connection_created(SimpleNamespace(address=address))
+    listener.connection_check_out_started(SimpleNamespace(address=address))
+    listener.connection_checked_out(SimpleNamespace(address=address, duration=0.001))
+listener.connection_check_out_started(SimpleNamespace(address=address))
+listener.connection_check_out_failed(SimpleNamespace(address=address, reason="timeout", duration=0.5))
+if exited:
+    metrics.mark_process_exited()
+"""
+
+RENDER = "import sys; from service_common import metrics; sys.stdout.write(metrics.render_metrics().decode())"
+
+
+def _python(directory, *args) -> str:
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(directory)}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [PACKAGE_DIR, env.get("PYTHONPATH")]))
+    return subprocess.run([sys.executable, "-c", *args], env=env, check=True, capture_output=True, text=True).stdout
+
+
+def _sample(text: str, series: str) -> str:
+    return next(line.rsplit(" ", 1)[1] for line in text.splitlines() if line.startswith(series + " "))
+
+
+def test_metrics_add_up_every_worker(tmp_path):
+    _python(tmp_path, WORKER, "3", "2", "running")
+    _python(tmp_path, WORKER, "5", "4", "exited")
+
+    text = _python(tmp_path, RENDER)
+    # Gauges only count running workers; counters and histograms keep what exited workers recorded
+    assert float(_sample(text, "http_requests_in_flight")) == 3
+    assert float(_sample(text, 'upstream_request_duration_seconds_count{outcome="2xx",target="user"}')) == 6
+    assert float(_sample(text, 'mongo_pool_connections_in_use{address="mongo:27017"}')) == 2
+    assert float(_sample(text, 'mongo_pool_checkout_failures_total{address="mongo:27017",reason="timeout"}')) == 2
+
+
+def test_single_process_renders_its_own_values(monkeypatch):
+    monkeypatch.setattr(metrics, "PROMETHEUS_MULTIPROC_DIR", "")
+    metrics.REQUESTS_IN_FLIGHT.set(2)
+    try:
+        assert float(_sample(metrics.render_metrics().decode(), "http_requests_in_flight")) == 2
+    finally:
+        metrics.REQUESTS_IN_FLIGHT.set(0)
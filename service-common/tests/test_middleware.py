@@ -0,0 +1,67 @@
+"""HTTPCacheMiddleware must not hold back the headers of event streams"""
+import time
+import asyncio
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from service_common.middleware import HTTPCacheMiddleware
+
+FIRST_EVENT_DELAY = 0.3
+
+
+async def events(request):
+    async def stream():
+        await asyncio.sleep(FIRST_EVENT_DELAY)
+        yield b"data: first\n\n"
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+async def document(request):
+    return JSONResponse({"name": "x" * 2000})
+
+
+APP = HTTPCacheMiddleware(Starlette(routes=[Route("/events", events), Route("/document", document)]))
+
+
+def _get(path: str, headers: dict = None) -> list:
+    """(seconds since the request, message) for everything the middleware sends"""
+    scope = {
+        "type": "http", "method": "GET", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "scheme": "http", "server": ("test", 80), "client": ("test", 1234),
+        "http_version": "1.1",
+        "headers": [(name.encode(), value.encode()) for name, value in (headers or {}).items()],
+    }
+    sent = []
+
+    async def run():
+        started = time.monotonic()
+
+        async def receive():
+            await asyncio.sleep(10)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append((time.monotonic() - started, message))
+
+        await APP(scope, receive, send)
+
+    asyncio.run(run())
+    return sent
+
+
+def test_event_stream_headers_are_sent_before_the_first_event():
+    sent = _get("/events", {"accept-encoding": "gzip"})
+    (start_at, start), (body_at, body) = sent[0], sent[1]
+    assert start["type"] == "http.response.start"
+    assert start_at < FIRST_EVENT_DELAY / 2
+    assert body_at >= FIRST_EVENT_DELAY
+    assert b"content-encoding" not in dict(start["headers"])
+    assert body["body"] == b"data: first\n\n"
+
+
+def test_documents_still_get_an_etag_and_compression():
+    sent = _get("/document", {"accept-encoding": "gzip"})
+    headers = dict(sent[0][1]["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"etag"].startswith(b'W/"')
+
@@ -1,17 +1,49 @@
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
-from app.schemas import Shipper, ShipperUpdate
+from app.schemas import Shipper, ShipperUpdate, Location
+from typing import List, Optional
+import os
+from datetime import datetime
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# How many nearest candidates a geo dispatch tries to claim before giving up
+DISPATCH_CANDIDATES = int(os.getenv("DISPATCH_CANDIDATES", "10"))
+
+
+def _to_geojson(location: Location) -> dict:
+    return {"type": "Point", "coordinates": [location.lng, location.lat]}
+
+
+def _from_geojson(point: Optional[dict]) -> Optional[dict]:
+    if not point:
+        return None
+    lng, lat = point["coordinates"]
+    return {"lat": lat, "lng": lng}
+
+
+def _shipper_from_document(shipper: dict) -> dict:
+    return {
+        "id": str(shipper["_id"]),
+        "name": shipper["name"],
+        "phone": shipper["phone"],
+        "vehicle": shipper["vehicle"],
+        "status": shipper["status"],
+        "current_order_id": shipper.get("current_order_id"),
+        "location": _from_geojson(shipper.get("location")),
+    }
 
 
 async def create_shipper(db: AsyncIOMotorDatabase, shipper_data: Shipper):
     """Create a new shipper"""
     shippers = db["shippers"]
-    shipper_dict = shipper_data.model_dump()
-    result = await shippers.insert_one(shipper_dict)
-    return {
-        "id": str(result.inserted_id),
-        **shipper_dict,
-    }
+    shipper_dict = shipper_data.model_dump(exclude={"location"})
+    if shipper_data.location:
+        shipper_dict["location"] = _to_geojson(shipper_data.location)
+    if shipper_dict["status"] == "available":
+        shipper_dict["available_since"] = datetime.now().isoformat()
+    await shippers.insert_one(shipper_dict)
+    return _shipper_from_document(shipper_dict)
 
 
 async def get_shipper(db: AsyncIOMotorDatabase, shipper_id: str):
@@ -20,42 +52,175 @@ async def get_shipper(db: AsyncIOMotorDatabase, shipper_id: str):
     try:
         shipper = await shippers.find_one({"_id": ObjectId(shipper_id)})
         if shipper:
-            return {
-                "id": str(shipper["_id"]),
-                "name": shipper["name"],
-                "phone": shipper["phone"],
-                "vehicle": shipper["vehicle"],
-                "status": shipper["status"],
-            }
+            return _shipper_from_document(shipper)
         return None
     except Exception:
         return None
 
 
+async def get_shippers_batch(db: AsyncIOMotorDatabase, shipper_ids: List[str]):
+    """Get id and name of many shippers with one $in query; unknown ids are omitted"""
+    shippers = db["shippers"]
+    object_ids = [ObjectId(shipper_id) for shipper_id in set(shipper_ids) if ObjectId.is_valid(shipper_id)]
+    if not object_ids:
+        return []
+    cursor = shippers.find({"_id": {"$in": object_ids}}, {"name": 1})
+    return [{"id": str(shipper["_id"]), "name": shipper["name"]} async for shipper in cursor]
+
+
 async def list_available_shippers(db: AsyncIOMotorDatabase):
     """List all available shippers"""
     shippers = db["shippers"]
     cursor = shippers.find({"status": "available"})
     result = []
     async for shipper in cursor:
-        result.append({
-            "id": str(shipper["_id"]),
-            "name": shipper["name"],
-            "phone": shipper["phone"],
-            "vehicle": shipper["vehicle"],
-            "status": shipper["status"],
-        })
+        result.append(_shipper_from_document(shipper))
     return result
 
 
 async def update_shipper_status(db: AsyncIOMotorDatabase, shipper_id: str, status: str):
-    """Update shipper status"""
+    """Update shipper status; becoming available releases the current order"""
     shippers = db["shippers"]
     try:
-        await shippers.update_one(
+        update = {"$set": {"status": status}}
+        if status == "available":
+            update["$set"]["available_since"] = datetime.now().isoformat()
+            update["$unset"] = {"current_order_id": ""}
+        shipper = await shippers.find_one_and_update(
             {"_id": ObjectId(shipper_id)},
-            {"$set": {"status": status}}
+            update,
+            return_document=ReturnDocument.AFTER,
         )
-        return await get_shipper(db, shipper_id)
+        if shipper:
+            return _shipper_from_document(shipper)
+        return None
     except Exception:
         return None
+
+
+def _claim_update(order_id: str) -> dict:
+    return {
+        "$set": {"status": "busy", "current_order_id": order_id, "claimed_at": datetime.now().isoformat()},
+        "$unset": {"available_since": ""},
+    }
+
+
+async def _claimed_for(shippers, order_id: str):
+    """The shipper already claimed for an order, or None"""
+    shipper = await shippers.find_one({"current_order_id": order_id})
+    return _shipper_from_document(shipper) if shipper else None
+
+
+async def _claim(shippers, query: dict, order_id: str, **kwargs):
+    """Claim the shipper matching query for order_id; returns the shipper, or None if none matches.
+
+    The unique current_order_id index lets only one shipper hold an order, so
+    when a concurrent claim for the same order (a retry or hedge) wins first,
+    this returns the shipper that won instead of claiming a second one.
+    """
+    try:
+        shipper = await shippers.find_one_and_update(
+            query, _claim_update(order_id), return_document=ReturnDocument.AFTER, **kwargs
+        )
+    except DuplicateKeyError:
+        return await _claimed_for(shippers, order_id)
+    return _shipper_from_document(shipper) if shipper else None
+
+
+async def claim_shipper(db: AsyncIOMotorDatabase, shipper_id: str, order_id: str):
+    """Atomically mark an available shipper busy with an order.
+
+    The status precondition lives in the update filter, so two concurrent
+    claims can never both win. Claiming again for the same order returns the
+    shipper unchanged, which makes retries safe.
+
+    Returns the shipper, "conflict" if it is not available, or None if it does not exist.
+    """
+    shippers = db["shippers"]
+    if not ObjectId.is_valid(shipper_id):
+        return None
+    shipper = await _claim(
+        shippers, {"_id": ObjectId(shipper_id), "$or": [{"status": "available"}, {"current_order_id": order_id}]},
+        order_id,
+    )
+    if shipper:
+        return shipper
+    if await shippers.find_one({"_id": ObjectId(shipper_id)}, {"_id": 1}):
+        return "conflict"
+    return None
+
+
+async def release_shipper(db: AsyncIOMotorDatabase, shipper_id: str, order_id: str):
+    """Undo a claim: make the shipper available again, but only while it is still claimed for order_id.
+
+    Used by order service when the order could not be updated after the claim,
+    so the shipper does not stay busy with an order it will never deliver.
+
+    Returns the shipper, "conflict" if it is not claimed for that order, or None if it does not exist.
+    """
+    shippers = db["shippers"]
+    if not ObjectId.is_valid(shipper_id):
+        return None
+    shipper = await shippers.find_one_and_update(
+        {"_id": ObjectId(shipper_id), "status": "busy", "current_order_id": order_id},
+        {
+            "$set": {"status": "available", "available_since": datetime.now().isoformat()},
+            "$unset": {"current_order_id": "", "claimed_at": ""},
+        },
+        return_document=ReturnDocument.AFTER,
+    )
+    if shipper:
+        return _shipper_from_document(shipper)
+    if await shippers.find_one({"_id": ObjectId(shipper_id)}, {"_id": 1}):
+        return "conflict"
+    return None
+
+
+async def find_nearby_shippers(db: AsyncIOMotorDatabase, location: Location, radius_km: float, limit: int,
+                               status: str = "available"):
+    """Shippers in a status within radius_km of a point, nearest first (uses the 2dsphere index)"""
+    shippers = db["shippers"]
+    pipeline = [
+        {"$geoNear": {
+            "near": _to_geojson(location),
+            "distanceField": "distance_m",
+            "maxDistance": radius_km * 1000,
+            "query": {"status": status},
+            "key": "location",
+            "spherical": True,
+        }},
+        {"$limit": limit},
+    ]
+    result = []
+    async for shipper in shippers.aggregate(pipeline):
+        result.append({
+            **_shipper_from_document(shipper),
+            "distance_km": round(shipper["distance_m"] / 1000, 3),
+        })
+    return result
+
+
+async def dispatch_shipper(db: AsyncIOMotorDatabase, order_id: str, location: Optional[Location] = None,
+                           radius_km: float = 5.0):
+    """Pick and claim an available shipper for an order.
+
+    With a location, the nearest available shippers within radius_km are
+    tried in order, each through the same atomic status-conditioned claim, so
+    losing a race to another dispatch just moves on to the next candidate.
+    Without one, the longest-idle available shipper is claimed in a single
+    atomic update.
+
+    Returns None if no shipper is available. Dispatching the same order again,
+    even concurrently, returns the shipper already claimed for it.
+    """
+    shippers = db["shippers"]
+    existing = await _claimed_for(shippers, order_id)
+    if existing:
+        return existing
+    if location is not None:
+        for candidate in await find_nearby_shippers(db, location, radius_km, DISPATCH_CANDIDATES):
+            shipper = await _claim(shippers, {"_id": ObjectId(candidate["id"]), "status": "available"}, order_id)
+            if shipper:
+                return shipper
+        return None
+    return await _claim(shippers, {"status": "available"}, order_id, sort=[("available_since", ASCENDING)])
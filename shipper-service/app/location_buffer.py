@@ -0,0 +1,180 @@
+import os
+import time
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Optional
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from app.database import get_database
+from app.crud import _to_geojson
+from app.schemas import Location
+
+LOCATION_FLUSH_INTERVAL = float(os.getenv("LOCATION_FLUSH_INTERVAL", "1.0"))
+# Flush early once this many shippers have a pending position
+LOCATION_FLUSH_SIZE = int(os.getenv("LOCATION_FLUSH_SIZE", "500"))
+# Distinct shippers the buffer holds before new ones are turned away
+LOCATION_BUFFER_MAX = int(os.getenv("LOCATION_BUFFER_MAX", "20000"))
+# Retry-After sent with rejected pings: one flush interval, rounded up
+RETRY_AFTER_SECONDS = max(1, int(-(-LOCATION_FLUSH_INTERVAL // 1)))
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", "200"))
+
+# shipper_id -> (location, reported_at); only the latest ping per shipper is kept
+_pending: dict = {}
+_flush_requested: asyncio.Event = None
+_flush_lock: asyncio.Lock = None
+_task: asyncio.Task = None
+_flush_latencies = deque(maxlen=LATENCY_WINDOW)
+
+stats = {
+    "pings_received": 0,
+    "pings_coalesced": 0,
+    "pings_rejected": 0,
+    "pings_invalid": 0,
+    "flushes": 0,
+    "flush_errors": 0,
+    "positions_written": 0,
+    "last_flush_size": 0,
+    "last_flush_latency": None,
+}
+
+
+def submit(shipper_id: str, location: Location, reported_at: Optional[datetime] = None) -> str:
+    """Queue a position for the next flush.
+
+    Returns "accepted", "coalesced" (replaced a pending ping for the same
+    shipper), "stale" (older than the pending ping), "invalid" or
+    "rejected" (buffer full; the caller should retry later).
+    """
+    stats["pings_received"] += 1
+    if not ObjectId.is_valid(shipper_id):
+        stats["pings_invalid"] += 1
+        return "invalid"
+    reported_at = reported_at or datetime.now()
+    pending = _pending.get(shipper_id)
+    if pending is not None:
+        stats["pings_coalesced"] += 1
+        if _is_older(reported_at, pending[1]):
+            return "stale"
+        _pending[shipper_id] = (location, reported_at)
+        return "coalesced"
+    # Backpressure: a full buffer still absorbs updates for shippers it holds, but not new ones
+    if len(_pending) >= LOCATION_BUFFER_MAX:
+        stats["pings_rejected"] += 1
+        return "rejected"
+    _pending[shipper_id] = (location, reported_at)
+    if len(_pending) >= LOCATION_FLUSH_SIZE and _flush_requested is not None:
+        _flush_requested.set()
+    return "accepted"
+
+
+def _is_older(reported_at: datetime, pending_at: datetime) -> bool:
+    try:
+        return reported_at < pending_at
+    except TypeError:
+        # Naive vs timezone-aware timestamps; fall back to arrival order
+        return False
+
+
+async def flush() -> int:
+    """Write every pending position with one unordered bulk_write; returns positions written"""
+    global _pending
+    async with _flush_lock:
+        if not _pending:
+            return 0
+        batch, _pending = _pending, {}
+        updates = [
+            UpdateOne(
+                {"_id": ObjectId(shipper_id)},
+                {"$set": {"location": _to_geojson(location), "location_updated_at": reported_at.isoformat()}},
+            )
+            for shipper_id, (location, reported_at) in batch.items()
+        ]
+        started = time.monotonic()
+        try:
+            result = await get_database()["shippers"].bulk_write(updates, ordered=False)
+            written = result.matched_count
+        except BulkWriteError as e:
+            # Unordered: the rest of the batch was still applied
+            stats["flush_errors"] += 1
+            written = e.details.get("nMatched", 0)
+            print(f"Location flush partially failed: {len(e.details.get('writeErrors', []))} errors")
+        except PyMongoError as e:
+            stats["flush_errors"] += 1
+            _requeue(batch)
+            print(f"Location flush failed, {len(batch)} positions requeued: {e}")
+            return 0
+        latency = time.monotonic() - started
+        _flush_latencies.append(latency)
+        stats["flushes"] += 1
+        stats["positions_written"] += written
+        stats["last_flush_size"] = len(updates)
+        stats["last_flush_latency"] = latency
+        return written
+
+
+def _requeue(batch: dict):
+    """Put a failed batch back without overwriting newer pings that arrived meanwhile"""
+    for shipper_id, pending in batch.items():
+        if shipper_id not in _pending and len(_pending) < LOCATION_BUFFER_MAX:
+            _pending[shipper_id] = pending
+
+
+async def _flush_loop():
+    while True:
+        try:
+            await asyncio.wait_for(_flush_requested.wait(), LOCATION_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _flush_requested.clear()
+        try:
+            await flush()
+        except Exception as e:
+            print(f"Location flush error: {e}")
+
+
+async def start_location_buffer():
+    global _flush_requested, _flush_lock, _task
+    if _task is not None:
+        return
+    _flush_requested = asyncio.Event()
+    _flush_lock = asyncio.Lock()
+    _task = asyncio.create_task(_flush_loop())
+    print(f"Location buffer started (interval={LOCATION_FLUSH_INTERVAL}s, flush_size={LOCATION_FLUSH_SIZE}, "
+          f"max={LOCATION_BUFFER_MAX})")
+
+
+async def stop_location_buffer():
+    """Stop the flush loop and write whatever is still pending"""
+    global _task
+    if _task is None:
+        return
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
+    written = await flush()
+    print(f"Location buffer stopped, flushed {written} pending positions")
+
+
+def _percentile(p: float):
+    if not _flush_latencies:
+        return None
+    ordered = sorted(_flush_latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def get_buffer_stats() -> dict:
+    return {
+        "queue_depth": len(_pending),
+        "queue_max": LOCATION_BUFFER_MAX,
+        "flush_interval": LOCATION_FLUSH_INTERVAL,
+        "flush_size": LOCATION_FLUSH_SIZE,
+        **stats,
+        "flush_latency_p50": _percentile(50),
+        "flush_latency_p95": _percentile(95),
+        "flush_latency_p99": _percentile(99),
+    }
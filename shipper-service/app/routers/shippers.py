@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.database import get_database
-from app.schemas import Shipper, ShipperResponse, ShipperUpdate
-from app import crud
+from service_common.metrics import TimedRoute
+from app.schemas import (
+    Shipper, ShipperResponse, ShipperUpdate, ShipperBatchRequest, ShipperSummary, ShipperClaim, ShipperDispatch,
+    Location, NearbyShipperResponse, LocationBatch, LocationIngestResponse
+)
+from app import crud, location_buffer
 
-router = APIRouter(prefix="/shippers", tags=["shippers"])
+router = APIRouter(prefix="/shippers", tags=["shippers"], route_class=TimedRoute)
 
 
 @router.post("", response_model=ShipperResponse, status_code=201)
@@ -14,6 +18,51 @@ async def create_shipper(shipper: Shipper, db: AsyncIOMotorDatabase = Depends(ge
     return result
 
 
+@router.post("/batch", response_model=list[ShipperSummary])
+async def get_shippers_batch(request: ShipperBatchRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Get names for many shippers in one call; unknown ids are omitted"""
+    shippers = await crud.get_shippers_batch(db, request.ids)
+    return shippers
+
+
+@router.post("/locations", response_model=LocationIngestResponse, status_code=202)
+async def ingest_locations(batch: LocationBatch, response: Response):
+    """Queue many position pings for the next batched write"""
+    result = LocationIngestResponse()
+    for ping in batch.pings:
+        outcome = location_buffer.submit(ping.shipper_id, Location(lat=ping.lat, lng=ping.lng), ping.reported_at)
+        setattr(result, outcome, getattr(result, outcome) + 1)
+    if result.rejected:
+        response.headers["Retry-After"] = str(location_buffer.RETRY_AFTER_SECONDS)
+    return result
+
+
+@router.post("/dispatch", response_model=ShipperResponse)
+async def dispatch_shipper(dispatch: ShipperDispatch, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Claim a shipper for an order in one round trip
+
+    With a pickup location, the nearest available shipper within radius_km is
+    chosen; otherwise the longest-idle available shipper.
+    """
+    shipper = await crud.dispatch_shipper(db, dispatch.order_id, dispatch.location, dispatch.radius_km)
+    if not shipper:
+        raise HTTPException(status_code=409, detail="No shipper available")
+    return shipper
+
+
+@router.get("/nearby", response_model=list[NearbyShipperResponse])
+async def find_nearby_shippers(
+    lat: float = Query(ge=-90, le=90),
+    lng: float = Query(ge=-180, le=180),
+    radius_km: float = Query(5.0, gt=0, le=100),
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    """Nearest available shippers within radius_km of a point, nearest first"""
+    shippers = await crud.find_nearby_shippers(db, Location(lat=lat, lng=lng), radius_km, limit)
+    return shippers
+
+
 @router.get("/{shipper_id}", response_model=ShipperResponse)
 async def get_shipper(shipper_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get shipper by ID"""
@@ -37,3 +86,40 @@ async def update_shipper_status(shipper_id: str, update: ShipperUpdate, db: Asyn
     if not result:
         raise HTTPException(status_code=404, detail="Shipper not found")
     return result
+
+
+@router.post("/{shipper_id}/claim", response_model=ShipperResponse)
+async def claim_shipper(shipper_id: str, claim: ShipperClaim, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Atomically claim an available shipper for an order"""
+    result = await crud.claim_shipper(db, shipper_id, claim.order_id)
+    if result == "conflict":
+        raise HTTPException(status_code=409, detail="Shipper not available")
+    if not result:
+        raise HTTPException(status_code=404, detail="Shipper not found")
+    return result
+
+
+@router.post("/{shipper_id}/release", response_model=ShipperResponse)
+async def release_shipper(shipper_id: str, claim: ShipperClaim, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Make a shipper claimed for an order available again"""
+    result = await crud.release_shipper(db, shipper_id, claim.order_id)
+    if result == "conflict":
+        raise HTTPException(status_code=409, detail="Shipper not claimed for this order")
+    if not result:
+        raise HTTPException(status_code=404, detail="Shipper not found")
+    return result
+
+
+@router.put("/{shipper_id}/location", status_code=202)
+async def update_shipper_location(shipper_id: str, location: Location):
+    """Report a shipper's current position; written with the next batched flush"""
+    outcome = location_buffer.submit(shipper_id, location)
+    if outcome == "invalid":
+        raise HTTPException(status_code=404, detail="Shipper not found")
+    if outcome == "rejected":
+        raise HTTPException(
+            status_code=503,
+            detail="Location buffer full",
+            headers={"Retry-After": str(location_buffer.RETRY_AFTER_SECONDS)},
+        )
+    return Response(status_code=202)
@@ -1,5 +1,11 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+
+
+class Location(BaseModel):
+    lat: float = Field(ge=-90, le=90)
+    lng: float = Field(ge=-180, le=180)
 
 
 class Shipper(BaseModel):
@@ -7,6 +13,7 @@ class Shipper(BaseModel):
     phone: str
     vehicle: str
     status: str = "available"  # available, busy, offline
+    location: Optional[Location] = None
 
 
 class ShipperResponse(BaseModel):
@@ -15,6 +22,8 @@ class ShipperResponse(BaseModel):
     phone: str
     vehicle: str
     status: str
+    current_order_id: Optional[str] = None
+    location: Optional[Location] = None
 
     class Config:
         populate_by_name = True
@@ -22,3 +31,43 @@ class ShipperResponse(BaseModel):
 
 class ShipperUpdate(BaseModel):
     status: str  # available, busy, offline
+
+
+class ShipperClaim(BaseModel):
+    order_id: str
+
+
+class ShipperDispatch(BaseModel):
+    order_id: str
+    location: Optional[Location] = None  # pickup point; nearest shipper wins when given
+    radius_km: float = Field(default=5.0, gt=0, le=100)
+
+
+class NearbyShipperResponse(ShipperResponse):
+    distance_km: float
+
+
+class LocationPing(Location):
+    shipper_id: str
+    reported_at: Optional[datetime] = None  # device time; a ping older than the pending one is dropped
+
+
+class LocationBatch(BaseModel):
+    pings: List[LocationPing] = Field(max_length=1000)
+
+
+class LocationIngestResponse(BaseModel):
+    accepted: int = 0
+    coalesced: int = 0
+    stale: int = 0
+    invalid: int = 0
+    rejected: int = 0  # buffer full; resend these after Retry-After
+
+
+class ShipperBatchRequest(BaseModel):
+    ids: List[str] = Field(max_length=1000)
+
+
+class ShipperSummary(BaseModel):
+    id: str
+    name: str
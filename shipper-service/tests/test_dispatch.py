@@ -0,0 +1,69 @@
+"""Concurrent claims for one order (retries, hedges) never leave two shippers busy with it"""
+import asyncio
+import pytest
+from app import crud, database
+from app.schemas import Shipper
+
+
+class SlowCollection:
+    """Delays every call, so concurrent dispatches interleave the way they do against a real server"""
+
+    def __init__(self, collection, delay: float = 0.01):
+        self._collection = collection
+        self._delay = delay
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        async def delayed(*args, **kwargs):
+            await asyncio.sleep(self._delay)
+            return await method(*args, **kwargs)
+        return delayed
+
+
+@pytest.fixture
+def shippers(db):
+    async def setup():
+        await database.ensure_indexes(db)
+        for name in ("ann", "bob", "cat"):
+            await crud.create_shipper(db, Shipper(name=name, phone="555", vehicle="bike", status="available"))
+    asyncio.run(setup())
+    return db
+
+
+def _busy_with(db, order_id: str) -> list:
+    async def find():
+        return [shipper async for shipper in db["shippers"].find({"current_order_id": order_id})]
+    return asyncio.run(find())
+
+
+def test_concurrent_dispatches_of_one_order_claim_one_shipper(shippers):
+    slow = {"shippers": SlowCollection(shippers["shippers"])}
+
+    async def dispatch_twice():
+        return await asyncio.gather(crud.dispatch_shipper(slow, "order1"), crud.dispatch_shipper(slow, "order1"))
+
+    first, second = asyncio.run(dispatch_twice())
+    assert first["id"] == second["id"]
+    assert len(_busy_with(shippers, "order1")) == 1
+
+
+def test_claiming_another_shipper_for_a_dispatched_order_returns_the_holder(shippers):
+    async def scenario():
+        dispatched = await crud.dispatch_shipper(shippers, "order1")
+        other = await shippers["shippers"].find_one({"status": "available"})
+        return dispatched, await crud.claim_shipper(shippers, str(other["_id"]), "order1")
+
+    dispatched, claimed = asyncio.run(scenario())
+    assert claimed["id"] == dispatched["id"]
+    assert len(_busy_with(shippers, "order1")) == 1
+
+
+def test_released_shipper_can_be_claimed_for_another_order(shippers):
+    async def scenario():
+        shipper = await crud.dispatch_shipper(shippers, "order1")
+        await crud.release_shipper(shippers, shipper["id"], "order1")
+        return await crud.dispatch_shipper(shippers, "order2")
+
+    assert asyncio.run(scenario()) is not None
+    assert _busy_with(shippers, "order1") == []
@@ -1,5 +1,5 @@
 # Smoke test for microservices (PowerShell)
-# Waits for services to be healthy, then creates user, restaurant, and an order.
+# Waits for services to be healthy, then creates user, restaurant, menu item, and an order.
 
 $services = @{
     "user" = "http://localhost:8001/health";
@@ -39,8 +39,14 @@ $rest = Invoke-RestMethod -Method Post -Uri http://localhost:8003/restaurants -C
 $rest_id = $rest.id
 Write-Host "Created restaurant id: $rest_id"
 
+# Create menu item (orders are priced from the menu, so unknown item ids are rejected)
+$menuPayload = '{"name":"Margherita","description":"d","price":12.5,"available":true}'
+$menu_item = Invoke-RestMethod -Method Post -Uri "http://localhost:8003/restaurants/$rest_id/menu-items" -ContentType 'application/json' -Body $menuPayload -UseBasicParsing
+$menu_id = $menu_item.id
+Write-Host "Created menu item id: $menu_id"
+
 # Create order
-$orderObj = @{ user_id = $user_id; restaurant_id = $rest_id; items = @(@{ menu_item_id = "m1"; quantity = 1 }) }
+$orderObj = @{ user_id = $user_id; restaurant_id = $rest_id; items = @(@{ menu_item_id = $menu_id; quantity = 1 }) }
 $orderBody = $orderObj | ConvertTo-Json -Depth 5
 $order = Invoke-RestMethod -Method Post -Uri http://localhost:8002/orders -ContentType 'application/json' -Body $orderBody -UseBasicParsing
 Write-Host "Order created:`n$($order | ConvertTo-Json -Depth 5)"
@@ -1,6 +1,7 @@
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
 from app.schemas import UserCreate, Address
+from typing import List
 
 
 async def create_user(db: AsyncIOMotorDatabase, user_data: UserCreate):
@@ -34,6 +35,16 @@ async def get_user(db: AsyncIOMotorDatabase, user_id: str):
         return None
 
 
+async def get_users_batch(db: AsyncIOMotorDatabase, user_ids: List[str]):
+    """Get id and username of many users with one $in query; unknown ids are omitted"""
+    users_collection = db["users"]
+    object_ids = [ObjectId(user_id) for user_id in set(user_ids) if ObjectId.is_valid(user_id)]
+    if not object_ids:
+        return []
+    cursor = users_collection.find({"_id": {"$in": object_ids}}, {"username": 1})
+    return [{"id": str(user["_id"]), "username": user["username"]} async for user in cursor]
+
+
 async def add_address(db: AsyncIOMotorDatabase, user_id: str, address_data: Address):
     """Add address to user"""
     users_collection = db["users"]
@@ -1,8 +1,18 @@
-from fastapi import FastAPI
+from typing import Optional
+from fastapi import FastAPI, Response
+from service_common.middleware import HTTPCacheMiddleware
+from service_common.metrics import (
+    MetricsMiddleware, CONTENT_TYPE, render_metrics, get_mongo_pool_stats, mark_process_exited,
+)
+from service_common.tracing import TracingMiddleware, recent_spans
 from app.database import connect_to_mongo, close_mongo_connection
 from app.routers import users
 
 app = FastAPI(title="User Service", version="1.0.0")
+app.add_middleware(HTTPCacheMiddleware)
+# Each middleware wraps those added before it: metrics include compression time, the server span covers both
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware, service="user-service")
 
 
 @app.on_event("startup")
@@ -13,6 +23,7 @@ async def startup():
 @app.on_event("shutdown")
 async def shutdown():
     await close_mongo_connection()
+    mark_process_exited()
 
 
 app.include_router(users.router)
@@ -21,3 +32,21 @@ app.include_router(users.router)
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "user-service"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Request, MongoDB and outbound call timings in the Prometheus text format"""
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
+
+@app.get("/traces", include_in_schema=False)
+async def traces(trace_id: Optional[str] = None):
+    """Recent spans from the in-memory trace exporter, optionally only those of one trace"""
+    return recent_spans(trace_id)
+
+
+@app.get("/stats/mongo-pool")
+async def mongo_pool_stats():
+    """MongoDB connection pool size, usage and waiters per server (for sizing MONGO_MAX_POOL_SIZE)"""
+    return get_mongo_pool_stats()
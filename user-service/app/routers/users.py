@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.database import get_database
-from app.schemas import UserCreate, UserResponse, Address, AddressResponse
+from service_common.metrics import TimedRoute
+from app.schemas import UserCreate, UserResponse, Address, AddressResponse, UserBatchRequest, UserSummary
 from app import crud
 
-router = APIRouter(prefix="/users", tags=["users"])
+router = APIRouter(prefix="/users", tags=["users"], route_class=TimedRoute)
 
 
 @router.post("", response_model=UserResponse, status_code=201)
@@ -14,6 +15,13 @@ async def create_user(user: UserCreate, db: AsyncIOMotorDatabase = Depends(get_d
     return result
 
 
+@router.post("/batch", response_model=list[UserSummary])
+async def get_users_batch(request: UserBatchRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Get usernames for many users in one call; unknown ids are omitted"""
+    users = await crud.get_users_batch(db, request.ids)
+    return users
+
+
 @router.get("/{user_id}", response_model=UserResponse)
 async def get_user(user_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Get user by ID"""
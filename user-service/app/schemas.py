@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 
 
@@ -35,3 +35,12 @@ class UserResponse(BaseModel):
 
     class Config:
         populate_by_name = True
+
+
+class UserBatchRequest(BaseModel):
+    ids: List[str] = Field(max_length=1000)
+
+
+class UserSummary(BaseModel):
+    id: str
+    username: str